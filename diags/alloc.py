@@ -0,0 +1,113 @@
+"""alloc.py -- memory allocation costs of read requests
+
+Compares the per call cost of 'owproxy.read(path)', which encodes path
+and header on each call, with a 'PreparedRead' object, which sends a
+message encoded once. Without an owserver URI only the client side
+message encoding is measured.
+
+For each statement the peak of memory allocated during a single call
+(as traced by 'tracemalloc') and the mean execution time are reported.
+"""
+
+from __future__ import print_function
+import sys
+import timeit
+import tracemalloc
+import argparse
+if sys.version_info < (3, ):
+    from urlparse import (urlsplit, )
+else:
+    from urllib.parse import (urlsplit, )
+
+import pyownet
+from pyownet import protocol
+
+PATH = '/28.000028D70000/temperature'
+
+
+def peak(func, number):
+    """max memory allocated during a single call to func (bytes)"""
+
+    func()  # warm up
+    res = 0
+    tracemalloc.start()
+    try:
+        for _ in range(number):
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            func()
+            _, top = tracemalloc.get_traced_memory()
+            res = max(res, top - base)
+    finally:
+        tracemalloc.stop()
+    return res
+
+
+def report(name, func, number):
+    mem = peak(func, number)
+    tim = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print('  * {:20}: {:6d} bytes, {:8.3f} us'.format(name, mem, tim * 1e6))
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('uri', metavar='URI', nargs='?',
+                        help='[owserver:]//server:port/entity')
+    parser.add_argument('-n', '--number', type=int, default=1000,
+                        metavar='N',
+                        help='number of executions (default: %(default)s)')
+
+    args = parser.parse_args()
+    number = args.number
+
+    print(pyownet.__name__, pyownet.__version__, pyownet.__file__)
+
+    # client side encoding only
+    flags = protocol.FLG_OWNET | protocol.FLG_TEMP_C
+    owproxy = protocol._Proxy(0, None, flags)
+    prep = owproxy.prepare_read(PATH)
+
+    def encode():
+        payload = protocol.str2bytez(PATH)
+        tohead = protocol._ToServerHeader(
+            payload=len(payload), type=protocol.MSG_READ,
+            flags=0 | owproxy.flags, size=protocol.MAX_PAYLOAD, offset=0)
+        return tohead + payload
+
+    assert encode() == prep._msg
+
+    print('message encoding: {!r}'.format(PATH))
+    report('read(path)', encode, number)
+    report('PreparedRead', lambda: prep._msg, number)
+
+    if not args.uri:
+        return
+
+    urlc = urlsplit(args.uri, scheme='owserver', allow_fragments=False)
+    if urlc.scheme != 'owserver':
+        parser.error("Invalid URI scheme '{}:'".format(urlc.scheme))
+    assert not urlc.fragment
+    if urlc.query:
+        parser.error(
+            "Invalid URI '{}', no query component allowed".format(args.uri))
+    host = urlc.hostname or 'localhost'
+    port = urlc.port or 4304
+    path = urlc.path or PATH
+
+    try:
+        base = protocol.proxy(host, port, persistent=True)
+    except protocol.ConnError as exc:
+        sys.exit('Error connecting to {}:{} {}'.format(host, port, exc))
+
+    print()
+    print('proxy_obj: {}'.format(base))
+    print('read: {!r}'.format(path))
+    prep = base.prepare_read(path)
+    with base:
+        report('read(path)', lambda: base.read(path), number)
+        report('PreparedRead', prep.read, number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""fuzz.py -- fuzz and performance harness for the sans-I/O protocol core
+
+Feeds 'protocol.ClientProtocol' with byte streams split in random
+chunks:
+
+* valid streams (keepalive frames followed by a reply) must produce the
+  expected events for any chunking;
+* randomly mutated streams must either produce events or raise a
+  'protocol.ProtocolError', never other exceptions.
+
+Finally reports the parsing throughput for typical read replies.
+"""
+
+from __future__ import print_function
+import sys
+import time
+import random
+import argparse
+import traceback
+
+import pyownet
+from pyownet import protocol
+
+HEADER = protocol._FromServerHeader
+
+
+def frame(payload=0, ret=0, flags=0, data=b''):
+    header = HEADER(payload=payload, ret=ret, flags=flags, size=len(data))
+    return header + data.ljust(max(payload, 0), b'\x00')
+
+
+def stream(rnd, persistent):
+    """random valid reply stream, return (data, expected events)"""
+
+    pings = rnd.randint(0, 3)
+    data = bytes(bytearray(rnd.getrandbits(8)
+                           for _ in range(rnd.choice((0, 1, 12, 300)))))
+    payload = len(data) + rnd.randint(0, 2)
+    ret = rnd.randint(-30, 300)
+    flags = protocol.FLG_PERSISTENCE if persistent else 0
+    expected = ['KeepAlive'] * pings
+    if persistent:
+        expected.append('PersistenceGranted')
+    expected.append('Reply')
+    return (frame(-1) * pings + frame(payload, ret, flags, data),
+            expected, (ret, data))
+
+
+def feed(proto, data, rnd):
+    """feed data in random chunks, return list of events"""
+
+    events = []
+    pos = 0
+    while pos < len(data):
+        step = rnd.randint(1, 64)
+        proto.receive_data(data[pos:pos + step])
+        pos += step
+        event = proto.next_event()
+        while event is not protocol.NEED_DATA:
+            events.append(event)
+            event = proto.next_event()
+    return events
+
+
+def check_valid(rnd, number):
+    for i in range(number):
+        persistent = rnd.random() < 0.5
+        proto = protocol.ClientProtocol()
+        flags = protocol.FLG_PERSISTENCE if persistent else 0
+        for _ in range(3 if persistent else 1):
+            proto.send_request(protocol.MSG_READ, b'/\x00', flags)
+            data, expected, (ret, payload) = stream(rnd, persistent)
+            events = feed(proto, data, rnd)
+            assert [type(e).__name__ for e in events] == expected, (
+                i, events, expected)
+            assert (events[-1].ret, events[-1].data) == (ret, payload)
+            assert proto.idle if persistent else proto.closed
+
+
+def check_mutated(rnd, number):
+    raised = 0
+    for i in range(number):
+        data, _, _ = stream(rnd, rnd.random() < 0.5)
+        data = bytearray(data)
+        for _ in range(rnd.randint(1, 4)):
+            data[rnd.randrange(len(data))] = rnd.getrandbits(8)
+        data = bytes(data[:rnd.randint(0, len(data))])
+        proto = protocol.ClientProtocol()
+        proto.send_request(protocol.MSG_READ, b'/\x00',
+                           protocol.FLG_PERSISTENCE)
+        try:
+            feed(proto, data, rnd)
+            proto.receive_data(b'')
+            while proto.next_event() is not protocol.NEED_DATA:
+                pass
+        except protocol.ProtocolError:
+            raised += 1
+        except Exception:
+            print('unexpected exception on input {!r}'.format(data))
+            traceback.print_exc()
+            sys.exit(1)
+    return raised
+
+
+def perf(number, chunk):
+    """parse number replies on a persistent connection, fed in chunks"""
+
+    data = frame(12, 12, protocol.FLG_PERSISTENCE, b'        21.5') * number
+    msg = protocol._ToServerHeader(type=protocol.MSG_READ,
+                                   flags=protocol.FLG_PERSISTENCE)
+    tic = time.time()
+    proto = protocol.ClientProtocol()
+    proto.send_encoded(msg)
+    count = 0
+    for pos in range(0, len(data), chunk):
+        proto.receive_data(data[pos:pos + chunk])
+        event = proto.next_event()
+        while event is not protocol.NEED_DATA:
+            if isinstance(event, protocol.Reply):
+                count += 1
+                proto.send_encoded(msg)
+            event = proto.next_event()
+    elapsed = time.time() - tic
+    assert count == number
+    return count, elapsed, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=10000,
+                        metavar='N',
+                        help='number of fuzz cases (default: %(default)s)')
+    parser.add_argument('-s', '--seed', type=int, default=None,
+                        help='random seed')
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 30)
+    rnd = random.Random(seed)
+    print(pyownet.__name__, pyownet.__version__, pyownet.__file__)
+    print('seed: {}'.format(seed))
+
+    check_valid(rnd, args.number)
+    print('valid streams  : {} ok'.format(args.number))
+    raised = check_mutated(rnd, args.number)
+    print('mutated streams: {} ok, {} ProtocolError'.format(
+        args.number, raised))
+
+    for chunk in (24 + 12, 4096, 65536):
+        count, elapsed, size = perf(args.number * 10, chunk)
+        print('parse {:6d} B chunks: {:9.0f} replies/s, {:7.2f} MB/s'.format(
+            chunk, count / elapsed, size / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    main()
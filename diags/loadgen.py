@@ -0,0 +1,513 @@
+"""loadgen.py -- load generator for owserver
+
+Issues a configurable mix of read/dir/present/write requests to an
+owserver, for a fixed duration at each of a list of concurrency levels,
+and reports throughput, latency percentiles and error rates as JSON.
+
+Target paths are discovered by walking the owserver tree below the URI
+path, unless given explicitly; writes are issued only to the paths and
+values given with '--write PATH=VALUE'.
+
+In closed loop mode each of the N concurrent clients issues a new
+request as soon as the previous one is completed. In open loop mode
+requests arrive at a fixed mean rate (Poisson arrivals) and are served
+by at most N concurrent clients: latency is measured from the scheduled
+arrival time, so that queueing delays are accounted for.
+
+Proxy modes:
+    nonpersistent: a single shared non persistent proxy
+    persistent:    a persistent proxy for each client
+    pooled:        clients share a 'pyownet.pool.ConnectionPool' of
+                   '--pool-size' connections; a fraction '--interactive'
+                   of requests is sent at interactive priority, the rest
+                   at bulk priority, with '--reserved' connections
+                   reserved to interactive requests
+    mux:           a single thread drives N requests in flight via
+                   'pyownet.multiplex' (Python 3.4 or later)
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import sys
+import json
+import time
+import bisect
+import itertools
+import random
+import argparse
+import threading
+import collections
+if sys.version_info < (3, ):
+    from urlparse import (urlsplit, )
+else:
+    from urllib.parse import (urlsplit, )
+
+import pyownet
+from pyownet import protocol, pool
+from pyownet.protocol import monotonic
+
+OPS = ('read', 'dir', 'present', 'write')
+MODES = ('nonpersistent', 'persistent', 'pooled', 'mux')
+
+
+def log(msg):
+    print(msg, file=sys.stderr)
+
+
+#
+# workload
+#
+
+class Workload(object):
+    """random choice of (operation, path, argument) tuples"""
+
+    def __init__(self, mix, targets, dist='uniform'):
+        self.ops = [op for op in OPS if mix.get(op)]
+        self._cumops = _cumulative(mix[op] for op in self.ops)
+        self.targets = targets
+        self._choose = {}
+        for op in self.ops:
+            self._choose[op] = _chooser(dist, len(targets[op]))
+
+    def next(self, rnd):
+        op = self.ops[bisect.bisect(self._cumops, rnd.random() *
+                                    self._cumops[-1])]
+        return (op, ) + self.targets[op][self._choose[op](rnd)]
+
+
+def _cumulative(weights):
+    res = []
+    tot = 0
+    for weight in weights:
+        tot += weight
+        res.append(tot)
+    return res
+
+
+def _chooser(dist, num):
+    # return a function of a random generator, choosing an index < num
+
+    name, _, param = dist.partition(':')
+    if name == 'uniform':
+        return lambda rnd: rnd.randrange(num)
+    elif name == 'zipf':
+        # rank k chosen with probability proportional to 1 / k**s
+        expo = float(param or 1)
+        cum = _cumulative(1 / (k ** expo) for k in range(1, num + 1))
+        return lambda rnd: min(bisect.bisect(cum, rnd.random() * cum[-1]),
+                               num - 1)
+    elif name == 'sequential':
+        counter = itertools.count()
+        lock = threading.Lock()
+
+        def sequential(rnd):
+            with lock:
+                return next(counter) % num
+        return sequential
+    raise ValueError('unknown distribution {!r}'.format(dist))
+
+
+def discover(owproxy, root, maxpaths):
+    """walk owserver tree below root, return (dirs, files) lists"""
+
+    dirs = []
+    files = []
+    todo = collections.deque([root])
+    while todo and len(dirs) + len(files) < maxpaths:
+        path = todo.popleft()
+        try:
+            entries = owproxy.dir(path, slash=True, bus=False)
+        except protocol.OwnetError as exc:
+            if exc.errno != 20:
+                raise
+            files.append(path)
+            continue
+        dirs.append(path)
+        for entry in entries:
+            if entry.endswith('/'):
+                todo.append(entry)
+            else:
+                files.append(entry)
+    return dirs, files
+
+
+#
+# statistics
+#
+
+class Stats(object):
+    """latencies and errors of a run"""
+
+    def __init__(self):
+        self.latencies = []
+        self.by_class = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self._lock = threading.Lock()
+
+    def add(self, latency, exc=None, cls=None):
+        with self._lock:
+            self.latencies.append(latency)
+            if cls is not None:
+                self.by_class[cls].append(latency)
+            if exc is not None:
+                if isinstance(exc, protocol.OwnetError):
+                    self.errors['OwnetError[{}]'.format(exc.errno)] += 1
+                else:
+                    self.errors[type(exc).__name__] += 1
+
+    def report(self, elapsed):
+        num = len(self.latencies)
+        nerr = sum(self.errors.values())
+        res = collections.OrderedDict()
+        res['requests'] = num
+        res['elapsed'] = elapsed
+        res['throughput'] = num / elapsed if elapsed else 0
+        res['errors'] = nerr
+        res['error_rate'] = nerr / num if num else 0
+        res['errors_by_type'] = dict(self.errors)
+        res['latency_ms'] = latency_ms(self.latencies)
+        if self.by_class:
+            res['latency_ms_by_class'] = dict(
+                (cls, latency_ms(lat)) for cls, lat in self.by_class.items())
+        return res
+
+
+def latency_ms(latencies):
+    """latency statistics, in milliseconds"""
+
+    lat = sorted(latencies)
+    num = len(lat)
+    ms = collections.OrderedDict()
+    if num:
+        ms['mean'] = 1e3 * sum(lat) / num
+        for name, quant in (('p50', .5), ('p99', .99), ('p999', .999)):
+            ms[name] = 1e3 * percentile(lat, quant)
+        ms['max'] = 1e3 * lat[-1]
+    return ms
+
+
+def percentile(data, quant):
+    """nearest rank percentile of sorted data"""
+
+    return data[min(int(quant * len(data)), len(data) - 1)]
+
+
+#
+# proxy modes
+#
+
+def _execute(owproxy, op, path, arg):
+    if op == 'read':
+        owproxy.read(path)
+    elif op == 'dir':
+        owproxy.dir(path)
+    elif op == 'present':
+        owproxy.present(path)
+    elif op == 'write':
+        owproxy.write(path, arg)
+
+
+class _Clients(object):
+    """hand out proxy objects to client threads"""
+
+    def __init__(self, base, mode, pool_size, reserved=0, interactive=0):
+        self.mode = mode
+        self.interactive = interactive
+        self._base = base
+        self._local = threading.local()
+        self._opened = []
+        self.pool = None
+        if mode == 'pooled':
+            self.pool = pool.ConnectionPool(base, pool_size, reserved)
+            self._pooled = {'interactive': self.pool.proxy(pool.INTERACTIVE),
+                            'bulk': self.pool.proxy(pool.BULK)}
+
+    def checkout(self, rnd):
+        """return (proxy object, request class) for next request"""
+
+        if self.mode == 'nonpersistent':
+            return self._base, None
+        elif self.mode == 'persistent':
+            try:
+                return self._local.owp, None
+            except AttributeError:
+                owp = self._local.owp = protocol.clone(self._base,
+                                                       persistent=True)
+                self._opened.append(owp)
+                return owp, None
+        else:
+            cls = 'interactive' if rnd.random() < self.interactive else 'bulk'
+            return self._pooled[cls], cls
+
+    def pool_metrics(self):
+        names = {pool.INTERACTIVE: 'interactive', pool.BULK: 'bulk'}
+        metrics = self.pool.metrics()
+        metrics['priorities'] = dict(
+            (names[prio], stats)
+            for prio, stats in metrics['priorities'].items())
+        return metrics
+
+    def close(self):
+        for owp in self._opened:
+            owp.close_connection()
+        if self.pool is not None:
+            self.pool.close()
+
+
+#
+# runners
+#
+
+class _Arrivals(object):
+    """thread-safe sequence of Poisson arrival times"""
+
+    def __init__(self, start, rate, rnd):
+        self._next = start
+        self._rate = rate
+        self._rnd = rnd
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            self._next += self._rnd.expovariate(self._rate)
+            return self._next
+
+
+def _sleep_until(tim):
+    delay = tim - monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def run_threads(clients, workload, concurrency, duration, rate, seed):
+    """run with concurrency client threads, return Stats"""
+
+    stats = Stats()
+    tstart = monotonic()
+    tend = tstart + duration
+    arrivals = None
+    if rate:
+        arrivals = _Arrivals(tstart, rate, random.Random(seed))
+
+    def client(wid):
+        rnd = random.Random('{}/{}'.format(seed, wid))
+        while True:
+            if arrivals is not None:
+                tic = arrivals.next()
+                if tic >= tend:
+                    break
+                _sleep_until(tic)
+            else:
+                tic = monotonic()
+                if tic >= tend:
+                    break
+            op, path, arg = workload.next(rnd)
+            owp, cls = clients.checkout(rnd)
+            exc = None
+            try:
+                _execute(owp, op, path, arg)
+            except protocol.Error as err:
+                exc = err
+            stats.add(monotonic() - tic, exc, cls)
+
+    threads = [threading.Thread(target=client, args=(i, ))
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats, monotonic() - tstart
+
+
+def run_mux(base, workload, concurrency, duration, rate, seed):
+    """run with concurrency requests in flight from a single thread"""
+
+    from pyownet import multiplex
+
+    stats = Stats()
+    rnd = random.Random(seed)
+    tstart = monotonic()
+    tend = tstart + duration
+    arrivals = None
+    if rate:
+        arrivals = _Arrivals(tstart, rate, rnd)
+        tnext = arrivals.next()
+    started = {}
+
+    def submit(tic):
+        op, path, arg = workload.next(rnd)
+        args = (arg, ) if op == 'write' else ()
+        started[getattr(mux, op)(base, path, *args)] = tic
+
+    with multiplex.Multiplexer(max_connections=concurrency) as mux:
+        if arrivals is None:
+            for _ in range(concurrency):
+                submit(monotonic())
+        while True:
+            wait = None
+            if arrivals is not None:
+                while tnext < tend and tnext <= monotonic():
+                    submit(tnext)
+                    tnext = arrivals.next()
+                if not started and tnext < tend:
+                    _sleep_until(tnext)
+                    continue
+                if tnext < tend:
+                    wait = max(tnext - monotonic(), 0)
+            if not started:
+                break
+            for req in mux.poll(wait):
+                stats.add(monotonic() - started.pop(req), req.exception())
+                if arrivals is None and monotonic() < tend:
+                    submit(monotonic())
+    return stats, monotonic() - tstart
+
+
+#
+# command line
+#
+
+def _mix(arg):
+    mix = {}
+    for item in arg.split(','):
+        op, _, weight = item.partition('=')
+        if op not in OPS:
+            raise argparse.ArgumentTypeError('unknown operation ' + op)
+        mix[op] = float(weight or 1)
+    return mix
+
+
+def _levels(arg):
+    return [int(i) for i in arg.split(',')]
+
+
+def _write(arg):
+    path, sep, value = arg.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError('PATH=VALUE required')
+    return path, value.encode('ascii')
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('uri', metavar='URI', nargs='?', default='/',
+                        help='[owserver:]//hostname:port/path')
+    parser.add_argument('--mix', type=_mix,
+                        default='read=80,dir=10,present=10',
+                        help='operation weights (default: %(default)s)')
+    parser.add_argument('--dist', default='uniform',
+                        help='path distribution: uniform, zipf[:s] '
+                        'or sequential (default: %(default)s)')
+    parser.add_argument('--mode', choices=MODES, default='nonpersistent',
+                        help='proxy mode (default: %(default)s)')
+    parser.add_argument('--pool-size', type=int, default=4, metavar='N',
+                        help='pooled mode connections '
+                        '(default: %(default)s)')
+    parser.add_argument('--reserved', type=int, default=0, metavar='N',
+                        help='pooled mode connections reserved to '
+                        'interactive requests (default: %(default)s)')
+    parser.add_argument('--interactive', type=float, default=0,
+                        metavar='F',
+                        help='pooled mode fraction of interactive '
+                        'requests (default: %(default)s)')
+    parser.add_argument('-c', '--concurrency', type=_levels, default='1',
+                        metavar='N[,N...]',
+                        help='concurrency levels to sweep '
+                        '(default: %(default)s)')
+    parser.add_argument('-d', '--duration', type=float, default=10,
+                        help='seconds per concurrency level '
+                        '(default: %(default)s)')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='open loop arrival rate (req/s); '
+                        'closed loop if 0 (default)')
+    parser.add_argument('--read', action='append', default=[],
+                        metavar='PATH', help='read target, repeatable')
+    parser.add_argument('--write', type=_write, action='append',
+                        default=[], metavar='PATH=VALUE',
+                        help='write target, repeatable')
+    parser.add_argument('--max-paths', type=int, default=1000,
+                        help='limit of discovered paths '
+                        '(default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', type=argparse.FileType('w'),
+                        default=sys.stdout, help='JSON report file')
+
+    args = parser.parse_args()
+
+    urlc = urlsplit(args.uri, scheme='owserver', allow_fragments=False)
+    if urlc.scheme != 'owserver':
+        parser.error("Invalid URI scheme '{}:'".format(urlc.scheme))
+    if urlc.query:
+        parser.error(
+            "Invalid URI '{}', no query component allowed".format(args.uri))
+    host = urlc.hostname or 'localhost'
+    port = urlc.port or 4304
+    root = urlc.path or '/'
+    if args.mix.get('write') and not args.write:
+        parser.error('write operations require --write targets')
+
+    try:
+        base = protocol.proxy(host, port)
+    except protocol.ConnError as exc:
+        sys.exit('Error connecting to {}:{} {}'.format(host, port, exc))
+    log('{} {} {}'.format(pyownet.__name__, pyownet.__version__,
+                          pyownet.__file__))
+    log('proxy_obj: {}'.format(base))
+
+    dirs, files = discover(base, root, args.max_paths)
+    targets = {
+        'read': [(i, None) for i in args.read or files],
+        'dir': [(i, None) for i in dirs],
+        'present': [(i.rstrip('/') or '/', None) for i in dirs + files],
+        'write': args.write,
+    }
+    for op in OPS:
+        if args.mix.get(op) and not targets[op]:
+            parser.error('no targets for {} operations'.format(op))
+    log('targets: ' + ', '.join('{} {}'.format(len(targets[op]), op)
+                                for op in OPS))
+    workload = Workload(args.mix, targets, args.dist)
+
+    report = collections.OrderedDict()
+    report['pyownet'] = pyownet.__version__
+    report['server'] = '{}:{}'.format(host, port)
+    report['mode'] = args.mode
+    report['loop'] = 'open' if args.rate else 'closed'
+    report['rate'] = args.rate
+    report['mix'] = args.mix
+    report['distribution'] = args.dist
+    report['duration'] = args.duration
+    report['runs'] = []
+
+    for level in args.concurrency:
+        if args.mode == 'mux':
+            stats, elapsed = run_mux(base, workload, level, args.duration,
+                                     args.rate, args.seed)
+        else:
+            clients = _Clients(base, args.mode, args.pool_size,
+                               args.reserved, args.interactive)
+            try:
+                stats, elapsed = run_threads(clients, workload, level,
+                                             args.duration, args.rate,
+                                             args.seed)
+            finally:
+                clients.close()
+        run = collections.OrderedDict(concurrency=level)
+        run.update(stats.report(elapsed))
+        if args.mode == 'pooled':
+            run['pool'] = clients.pool_metrics()
+        report['runs'].append(run)
+        log('concurrency {:4d}: {:9.1f} req/s, p99 {:8.3f} ms, '
+            '{:d} errors'.format(level, run['throughput'],
+                                 run['latency_ms'].get('p99', 0),
+                                 run['errors']))
+
+    json.dump(report, args.output, indent=2)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
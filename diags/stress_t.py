@@ -50,6 +50,16 @@ def stress(owproxy, root):
         else:
             return 1
 
+    def walkget(path):
+        res = owproxy.get(path, slash=False, bus=False)
+        if isinstance(res, list):
+            num = 0
+            for i in res:
+                num += walkget(i)
+            return num
+        else:
+            return 1
+
     tic = time.time()
     n = walkdir(root)
     toc = time.time()
@@ -60,6 +70,11 @@ def stress(owproxy, root):
     toc = time.time()
     print('walkread({}): {:.3f}s for {:d} nodes'.format(root, toc - tic, n))
 
+    tic = time.time()
+    n = walkget(root)
+    toc = time.time()
+    print('walkget({}) : {:.3f}s for {:d} nodes'.format(root, toc - tic, n))
+
 
 def main():
     """parse commandline arguments and print result"""
@@ -0,0 +1,169 @@
+"""threads.py -- throughput scaling of proxy objects with thread count
+
+Runs the same workload in 1, 2, 4, ... threads sharing a single proxy
+object and reports operations per second and speedup over a single
+thread. Run it with a regular CPython and with a free-threaded
+(no-GIL) build, e.g. 'python3.13t', to compare scaling.
+
+Without an owserver URI the workload is client side only: each
+operation parses a canned reply stream (keepalive, read reply, directory
+listing) with 'protocol.ClientProtocol' and decodes the values, the CPU
+bound part of a request. With an URI each operation is a read of the
+given entity via a shared persistent proxy (or a non persistent one,
+with --no-persistent).
+"""
+
+from __future__ import print_function
+import sys
+import time
+import argparse
+import platform
+import threading
+if sys.version_info < (3, ):
+    from urlparse import (urlsplit, )
+else:
+    from urllib.parse import (urlsplit, )
+
+import pyownet
+from pyownet import protocol, schema
+
+PATH = '/28.000028D70000/temperature'
+
+HEADER = protocol._FromServerHeader
+TYPE = schema.PropertyInfo.parse(b'f,000000,000001,ro,000012,v,')
+LISTING = ','.join('/28.%012X' % i for i in range(64)).encode('ascii')
+
+
+def frame(ret=0, data=b'', payload=None):
+    if payload is None:
+        payload = len(data)
+    return HEADER(payload=payload, ret=ret, size=len(data)) + data
+
+
+def make_parse():
+    """client side workload: parse and decode canned replies"""
+
+    read = frame(-1, payload=-1) + frame(12, b'     21.5625')
+    listing = frame(len(LISTING), LISTING)
+    encoded = protocol.str2bytez(PATH)
+
+    def parse():
+        for stream, msgtype in ((read, protocol.MSG_READ),
+                                (listing, protocol.MSG_DIRALL)):
+            proto = protocol.ClientProtocol()
+            proto.send_request(msgtype, encoded, 0, protocol.MAX_PAYLOAD)
+            proto.receive_data(stream)
+            proto.receive_data(b'')
+            event = proto.next_event()
+            while not isinstance(event, protocol.Reply):
+                event = proto.next_event()
+            if msgtype == protocol.MSG_READ:
+                TYPE.decode(event.data)
+            else:
+                len(protocol.bytes2str(event.data).split(','))
+
+    return parse
+
+
+def rate(func, nthreads, duration):
+    """total calls of func per second, in nthreads concurrent threads"""
+
+    start = threading.Event()
+    counts = [0] * nthreads
+    errors = []
+
+    def worker(i):
+        start.wait()
+        num = 0
+        try:
+            while time.time() < deadline:
+                func()
+                num += 1
+        except protocol.Error as exc:
+            errors.append(exc)
+        counts[i] = num
+
+    threads = [threading.Thread(target=worker, args=(i, ))
+               for i in range(nthreads)]
+    for thread in threads:
+        thread.start()
+    tic = time.time()
+    deadline = tic + duration
+    start.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - tic
+    if errors:
+        sys.exit('Error in worker thread: {}'.format(errors[0]))
+    return sum(counts) / elapsed
+
+
+def gil_enabled():
+    """True unless running on a free-threaded build with the GIL off"""
+
+    is_enabled = getattr(sys, '_is_gil_enabled', None)
+    return True if is_enabled is None else is_enabled()
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('uri', metavar='URI', nargs='?',
+                        help='[owserver:]//server:port/entity')
+    parser.add_argument('-t', '--threads', type=int, default=16,
+                        metavar='N',
+                        help='maximum number of threads, doubled from 1 '
+                        '(default: %(default)s)')
+    parser.add_argument('-d', '--duration', type=float, default=2.0,
+                        metavar='S',
+                        help='duration of each run, seconds '
+                        '(default: %(default)s)')
+    parser.add_argument('--no-persistent', dest='persistent',
+                        action='store_false',
+                        help='use a non persistent proxy')
+
+    args = parser.parse_args()
+
+    print(pyownet.__name__, pyownet.__version__, pyownet.__file__)
+    print('{} {}, GIL {}'.format(
+        platform.python_implementation(), platform.python_version(),
+        'enabled' if gil_enabled() else 'disabled'))
+
+    if args.uri:
+        urlc = urlsplit(args.uri, scheme='owserver', allow_fragments=False)
+        if urlc.scheme != 'owserver':
+            parser.error("Invalid URI scheme '{}:'".format(urlc.scheme))
+        if urlc.query:
+            parser.error("Invalid URI '{}', no query component "
+                         "allowed".format(args.uri))
+        host = urlc.hostname or 'localhost'
+        port = urlc.port or 4304
+        path = urlc.path or PATH
+        try:
+            owproxy = protocol.proxy(host, port, persistent=args.persistent)
+        except protocol.ConnError as exc:
+            sys.exit('Error connecting to {}:{} {}'.format(host, port, exc))
+        print('proxy_obj: {}'.format(owproxy))
+        print('workload: read {!r}'.format(path))
+        func = lambda: owproxy.read(path)
+    else:
+        print('workload: client side parsing')
+        func = make_parse()
+
+    func()  # warm up
+    print()
+    print('{:>8} {:>12} {:>8} {:>10}'.format('threads', 'ops/s', 'speedup',
+                                            'efficiency'))
+    nthreads = 1
+    base = None
+    while nthreads <= args.threads:
+        ops = rate(func, nthreads, args.duration)
+        if base is None:
+            base = ops
+        print('{:8d} {:12.1f} {:8.2f} {:10.2f}'.format(
+            nthreads, ops, ops / base, ops / base / nthreads))
+        nthreads *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -14,9 +14,11 @@ python walk.py //localhost:14304/
 python walk.py //localhost:14304/26.000026D90200/
 python walk.py -K //localhost:14304/26.000026D90200/temperature
 
+Each node is visited with a single 'get' request, returning either a
+directory listing or a value: directories need no trailing slash.
+
 Caution:
-'owget.py //localhost:14304/26.000026D90200' or
-'owget.py //localhost:14304/26.000026D90200/temperature/' yield an error
+'owget.py //localhost:14304/26.000026D90200/temperature/' yields an error
 
 """
 
@@ -108,12 +110,12 @@ def main():
 
     def walk(path):
         try:
-            if not path.endswith('/'):
-                val = proxy.read(path)
-                print("{:40} {!r}".format(path, val))
-            else:
-                for entity in proxy.dir(path, bus=args.bus):
+            res = proxy.get(path, bus=args.bus)
+            if isinstance(res, list):
+                for entity in res:
                     walk(entity)
+            else:
+                print("{:40} {!r}".format(path, res))
         except protocol.OwnetError as error:
             print('Unable to walk {}: server says {}'.format(path, error),
                   file=sys.stderr)
@@ -0,0 +1,166 @@
+"""aggregate reads and writes of multi-channel properties
+
+Multi-channel devices, like the DS2406, DS2408 and DS2413 switches,
+expose each channel as a separate property (``PIO.0``, ``PIO.1``, ...
+or ``PIO.A``, ``PIO.B``, ...) and all channels at once as an aggregate
+property (``PIO.ALL``). Reading or writing channels one at a time costs
+a round trip and a bus transaction each: this module rewrites requests
+for several channels of the same device property into a single
+aggregate request, and splits results back into per-channel values.
+It is used by :func:`pyownet.poller.read_many` and by
+:class:`pyownet.writebehind.WriteBehind`.
+
+>>> from pyownet import protocol, aggregate
+>>> owproxy = protocol.proxy(host="owserver.example.com", port=4304)
+>>> aggregate.group(['/29.000029AA0000/sensed.0',
+...                  '/29.000029AA0000/sensed.7'])
+OrderedDict([('/29.000029AA0000/sensed.ALL', [(0, 0), (1, 7)])])
+>>> aggregate.read(owproxy, '/29.000029AA0000/sensed.ALL', [0, 7])
+[b'1', b'0']
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import re
+import collections
+
+from . import protocol
+
+# per-channel property: name starts with a letter, channel is a number
+# or a single capital letter, e.g. 'PIO.0', 'sensed.7', 'PIO.B'
+_CHANNEL_RE = re.compile(r'^(.*/)([A-Za-z][^/.]*)\.([0-9]{1,2}|[A-Z])$')
+
+# properties whose aggregate is a comma separated list of the channel
+# values, used when the schema of the proxy object is not known; other
+# aggregates, e.g. 'pages/page.ALL', are binary and cannot be split;
+# names as in owfs: e.g. the DS2423 counters are 'counters.A', 'counters.B'
+CHANNEL_PROPERTIES = frozenset((
+    'PIO', 'latch', 'sensed', 'counters', 'volt', 'volt2', ))
+
+
+def split(path, owproxy=None):
+    """return (aggregate path, channel index) of a channel, or None
+
+    e.g. '/29.000029AA0000/PIO.B' -> ('/29.000029AA0000/PIO.ALL', 1)
+
+    the aggregate must be a comma separated list: this is checked in
+    the schema of owproxy, if known, otherwise the property must be in
+    CHANNEL_PROPERTIES.
+    """
+
+    match = _CHANNEL_RE.match(path)
+    if match is None:
+        return None
+    suffix = match.group(3)
+    index = int(suffix) if suffix.isdigit() else ord(suffix) - ord('A')
+    agg = match.group(1) + match.group(2) + '.ALL'
+    info = _info(owproxy, agg)
+    if info is None:
+        if match.group(2) not in CHANNEL_PROPERTIES:
+            return None
+    elif index >= _channels(info):
+        return None
+    return agg, index
+
+
+def group(paths, owproxy=None):
+    """group channels of the same aggregate property
+
+    return an ordered mapping ``{aggregate path: [(position, index),
+    ...]}``, where position is the position of a channel in paths;
+    only aggregates with at least two distinct channels are returned.
+    Channels are recognized as by split(path, owproxy).
+    """
+
+    groups = collections.OrderedDict()
+    for pos, path in enumerate(paths):
+        channel = split(path, owproxy)
+        if channel is not None:
+            groups.setdefault(channel[0], []).append((pos, channel[1]))
+    for agg, members in list(groups.items()):
+        if len(set(index for _, index in members)) < 2:
+            del groups[agg]
+    return groups
+
+
+def read(owproxy, path, indexes, timeout=0):
+    """read aggregate path, return the values of channels indexes
+
+    return None if the aggregate cannot be read, is not a comma
+    separated list, or has fewer channels than requested, so that
+    channels should be read one at a time. Connection errors are
+    raised.
+    """
+
+    info = _info(owproxy, path)
+    if info is not None and max(indexes) >= _channels(info):
+        return None
+    try:
+        elements = owproxy.read(path, timeout=timeout).split(b',')
+    except protocol.OwnetError:
+        return None
+    if max(indexes) >= len(elements):
+        return None
+    return [elements[i] for i in indexes]
+
+
+def write(owproxy, path, updates, timeout=0):
+    """write channels of aggregate path, updates is {index: data}
+
+    the aggregate is written only if updates covers all its channels,
+    since writing back the current value of the other channels would
+    race with other clients. The number of channels is taken from the
+    schema of owproxy, if known, otherwise the aggregate is read.
+    Return False if nothing was written, and channels should be written
+    one at a time. Connection errors are raised.
+    """
+
+    info = _info(owproxy, path)
+    if info is not None and not info.writable:
+        return False
+    try:
+        if info is not None:
+            nchannels = _channels(info)
+        else:
+            nchannels = len(owproxy.read(path, timeout=timeout).split(b','))
+        if set(updates) != set(range(nchannels)):
+            return False
+        owproxy.write(path, b','.join(updates[i] for i in range(nchannels)),
+                      timeout=timeout)
+    except protocol.OwnetError:
+        return False
+    return True
+
+
+def _info(owproxy, path):
+    # PropertyInfo of path in the schema of owproxy, or None if unknown
+
+    schema = getattr(owproxy, 'schema', None)
+    if schema is None:
+        return None
+    try:
+        return schema.lookup(owproxy, path)
+    except protocol.Error:
+        return None
+
+
+def _channels(info):
+    # number of channels of a comma separated aggregate, 0 if binary
+
+    return 0 if info.type == 'b' else info.elements
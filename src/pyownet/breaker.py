@@ -0,0 +1,165 @@
+"""circuit breakers, to fail fast while an owserver is down
+
+When an owserver is down, each request pays the full socket connect
+timeout before raising ConnError, stalling threads which could serve
+other, healthy, owservers. A :class:`CircuitBreaker`, assigned to the
+``breaker`` attribute of a proxy object, counts consecutive connection
+errors: after a threshold requests fail at once with CircuitOpen,
+until a probe finds the owserver up again.
+
+>>> from pyownet import protocol, breaker
+>>> owproxy = protocol.proxy(host="owserver.example.com", breaker=True)
+>>> owproxy.breaker is breaker.circuit_breaker(owproxy._family,
+...                                            owproxy._sockaddr)
+True
+>>> owproxy.breaker.state
+'closed'
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import threading
+
+from . import protocol
+from .protocol import monotonic
+
+
+class CircuitBreaker(object):
+    """Circuit breaker for an owserver endpoint
+
+    After ``failure_threshold`` consecutive connection errors the circuit
+    opens: requests fail at once with CircuitOpen. After
+    ``recovery_timeout`` seconds the next request sends a ping probe to
+    the server (half-open state): if the probe succeeds the circuit is
+    closed and the request goes on, otherwise the circuit opens again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30.0):
+        if failure_threshold < 1:
+            raise ValueError('failure_threshold must be positive')
+        if recovery_timeout < 0:
+            raise ValueError("recovery_timeout cannot be negative!")
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self._key = None
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        # metrics
+        self._counts = dict(calls=0, failures=0, rejected=0, opened=0,
+                            probes=0)
+
+    def __repr__(self):
+        return "<CircuitBreaker {0} {1}>".format(self.state, self._key or '')
+
+    def __reduce__(self):
+        # shared breakers are shared also by unpickled proxy objects
+        if self._key is not None:
+            return (circuit_breaker, self._key + (self.failure_threshold,
+                                                  self.recovery_timeout))
+        return (CircuitBreaker, (self.failure_threshold,
+                                 self.recovery_timeout))
+
+    def metrics(self):
+        """return a dictionary of state and counters"""
+
+        with self._lock:
+            res = dict(self._counts)
+            res['state'] = self.state
+            res['consecutive_failures'] = self._failures
+        return res
+
+    def _admit(self, owproxy):
+        # called before sending a request, raise CircuitOpen if rejected
+
+        with self._lock:
+            self._counts['calls'] += 1
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and (
+                    monotonic() - self._opened_at >= self.recovery_timeout):
+                self.state = self.HALF_OPEN
+                self._counts['probes'] += 1
+            else:
+                self._counts['rejected'] += 1
+                raise protocol.CircuitOpen('circuit open for %s' % (owproxy, ))
+
+        # only one caller at a time gets here, in half open state
+        try:
+            with owproxy._new_connection() as conn:
+                conn.req(protocol.MSG_NOP, bytes(),
+                         owproxy.flags & ~protocol.FLG_PERSISTENCE)
+        except protocol.Error:
+            self._record(False)
+            raise
+        self._record(True)
+
+    def _moved(self, family, sockaddr):
+        # breaker of a proxy moved to another endpoint: shared breakers
+        # follow the proxy, others stay with it
+
+        if self._key is None:
+            return self
+        return circuit_breaker(family, sockaddr)
+
+    def _record(self, success):
+        # record outcome of a request
+
+        with self._lock:
+            if success:
+                self._failures = 0
+                self.state = self.CLOSED
+                return
+            self._counts['failures'] += 1
+            self._failures += 1
+            tripped = self._failures >= self.failure_threshold
+            if self.state == self.HALF_OPEN or tripped:
+                if self.state != self.OPEN:
+                    self._counts['opened'] += 1
+                self.state = self.OPEN
+                self._opened_at = monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(family, sockaddr, failure_threshold=5,
+                    recovery_timeout=30.0):
+    """return the circuit breaker shared by all proxies of an endpoint
+
+    the breaker is created on first request; further arguments are
+    ignored if it already exists.
+    """
+
+    key = (family, sockaddr)
+    with _breakers_lock:
+        try:
+            return _breakers[key]
+        except KeyError:
+            pass
+        breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+        breaker._key = key
+        _breakers[key] = breaker
+        return breaker
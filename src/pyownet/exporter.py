@@ -0,0 +1,372 @@
+"""caching HTTP exporter of owserver readings
+
+An :class:`Exporter` object reads a configured set of paths in the
+background, at fixed intervals and with bounded concurrency, and keeps
+the last values in memory. The values are served over a local HTTP
+endpoint, in Prometheus text format (``/metrics``) and as JSON
+(``/json``): any number of consumers costs the 1-wire bus as a single
+one.
+
+>>> from pyownet import protocol, exporter
+>>> owproxy = protocol.proxy(host="owserver.example.com", port=4304)
+>>> exp = exporter.Exporter(owproxy, ['/28.000028D70000/temperature'])
+>>> exp.start()
+>>> server = exp.serve(port=9430)
+
+The module can also be run as a script, see ``python -m
+pyownet.exporter --help``.
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from __future__ import print_function
+
+import sys
+import json
+import math
+import time
+import binascii
+import threading
+import collections
+if sys.version_info < (3, ):
+    import Queue as queue
+    from BaseHTTPServer import (HTTPServer, BaseHTTPRequestHandler)
+    from SocketServer import ThreadingMixIn
+else:
+    import queue
+    from http.server import (HTTPServer, BaseHTTPRequestHandler)
+    from socketserver import ThreadingMixIn
+
+from . import protocol
+from .protocol import (monotonic, bytes2str)
+
+#: last reading of a path: raw value (bytes or None), wall clock time of
+#: reading, error message (or None) and number of errors so far
+Sample = collections.namedtuple('Sample', 'value timestamp error errors')
+
+
+class Exporter(object):
+    """Refresh readings of ``paths`` in the background
+
+    Every ``interval`` seconds all paths are queued for reading by
+    ``max_workers`` threads, each with its own persistent clone of
+    ``owproxy``. A new refresh cycle starts only after all readings of
+    the previous one are completed.
+    """
+
+    def __init__(self, owproxy, paths, interval=10.0, max_workers=4,
+                 timeout=0):
+        if not isinstance(owproxy, protocol._Proxy):
+            raise TypeError('argument is not a Proxy object')
+        if interval <= 0:
+            raise ValueError('interval must be positive')
+        if max_workers < 1:
+            raise ValueError('max_workers must be positive')
+        self.proxy = owproxy
+        self.paths = list(paths)
+        self.interval = interval
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._threads = []
+        self._scheduler_thread = None
+        self._stop = threading.Event()
+        self._servers = []
+        # refresh cycle statistics
+        self.cycles = 0
+        self.last_cycle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        """start background refresh"""
+
+        if self._scheduler_thread is not None or self._stop.is_set():
+            raise ValueError('exporter already started')
+        for i in range(self.max_workers):
+            self._threads.append(
+                _start_thread(self._worker, 'pyownet-exporter-%d' % i))
+        self._scheduler_thread = _start_thread(self._scheduler,
+                                               'pyownet-exporter')
+
+    def close(self):
+        """stop background refresh and HTTP servers"""
+
+        self._stop.set()
+        if self._scheduler_thread is not None:
+            # the scheduler returns after current cycle is completed
+            self._scheduler_thread.join()
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+            del self._threads[:]
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        del self._servers[:]
+
+    def refresh(self):
+        """read all paths now, blocking until done (no threads needed)"""
+
+        tic = monotonic()
+        for path in self.paths:
+            self._read(self.proxy, path)
+        self._cycle_done(monotonic() - tic)
+
+    #
+    # background refresh
+    #
+
+    def _scheduler(self):
+        while not self._stop.is_set():
+            tic = monotonic()
+            for path in self.paths:
+                self._queue.put(path)
+            self._queue.join()
+            self._cycle_done(monotonic() - tic)
+            self._stop.wait(max(self.interval - (monotonic() - tic), 0))
+
+    def _worker(self):
+        # the persistent clone connects on first read, so that workers
+        # survive an owserver down at start
+        owp = protocol.clone(self.proxy, persistent=True)
+        try:
+            while True:
+                path = self._queue.get()
+                try:
+                    if path is None:
+                        break
+                    self._read(owp, path)
+                finally:
+                    self._queue.task_done()
+        finally:
+            owp.close_connection()
+
+    def _read(self, owp, path):
+        try:
+            value = owp.read(path, timeout=self.timeout)
+        except protocol.Error as exc:
+            value, error = None, str(exc)
+        except Exception as exc:
+            # unexpected: recorded as an error, the worker keeps running
+            value, error = None, '%s: %s' % (type(exc).__name__, exc)
+        else:
+            error = None
+        tstamp = time.time()
+        with self._lock:
+            old = self._samples.get(path)
+            errors = old.errors if old is not None else 0
+            if error is not None:
+                errors += 1
+                if old is not None and old.value is not None:
+                    # keep last good value
+                    value, tstamp = old.value, old.timestamp
+            self._samples[path] = Sample(value, tstamp, error, errors)
+
+    def _cycle_done(self, elapsed):
+        with self._lock:
+            self.cycles += 1
+            self.last_cycle = elapsed
+
+    #
+    # output
+    #
+
+    def samples(self):
+        """return a {path: Sample} snapshot of the last readings"""
+
+        with self._lock:
+            return dict(self._samples)
+
+    def json(self):
+        """last readings as a JSON document"""
+
+        res = collections.OrderedDict()
+        for path, smp in sorted(self.samples().items()):
+            value = smp.value
+            if value is not None:
+                value = _json_value(value)
+            res[path] = collections.OrderedDict([
+                ('value', value), ('timestamp', smp.timestamp),
+                ('error', smp.error), ('errors', smp.errors)])
+        return json.dumps(res, indent=1)
+
+    def prometheus(self):
+        """last readings in Prometheus text exposition format"""
+
+        lines = [
+            '# HELP owfs_value last value read from owserver',
+            '# TYPE owfs_value gauge',
+        ]
+        samples = sorted(self.samples().items())
+        for path, smp in samples:
+            try:
+                value = float(smp.value)
+            except (TypeError, ValueError):
+                continue
+            lines.append('owfs_value{{path="{0}"}} {1} {2:d}'.format(
+                _escape(path), _float(value), int(smp.timestamp * 1000)))
+        lines += [
+            '# HELP owfs_read_errors_total failed reads',
+            '# TYPE owfs_read_errors_total counter',
+        ]
+        for path, smp in samples:
+            lines.append('owfs_read_errors_total{{path="{0}"}} {1:d}'.format(
+                _escape(path), smp.errors))
+        lines += [
+            '# HELP owfs_refresh_seconds duration of last refresh cycle',
+            '# TYPE owfs_refresh_seconds gauge',
+            'owfs_refresh_seconds {0!r}'.format(self.last_cycle or 0.0),
+            '# HELP owfs_refresh_cycles_total refresh cycles completed',
+            '# TYPE owfs_refresh_cycles_total counter',
+            'owfs_refresh_cycles_total {0:d}'.format(self.cycles),
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, host='127.0.0.1', port=9430):
+        """serve last readings over HTTP from a background thread
+
+        return the HTTP server object, stopped by :meth:`close`.
+        """
+
+        class Handler(_Handler):
+            exporter = self
+
+        server = _HTTPServer((host, port), Handler)
+        _start_thread(server.serve_forever, 'pyownet-exporter-http')
+        self._servers.append(server)
+        return server
+
+
+def _start_thread(target, name):
+    thread = threading.Thread(target=target, name=name)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def _json_value(raw):
+    # number if possible, text, or hex digits of binary values
+
+    try:
+        raw.decode('ascii')
+    except UnicodeDecodeError:
+        return binascii.hexlify(raw).decode('ascii')
+    value = bytes2str(raw).strip()
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    # NaN and Infinity are not valid JSON
+    return number if not (math.isnan(number) or math.isinf(number)) else value
+
+
+def _float(value):
+    # format a Prometheus sample value
+
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+def _escape(label):
+    # escape a Prometheus label value
+    return label.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class _HTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    exporter = None
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = self.exporter.prometheus()
+            ctype = 'text/plain; version=0.0.4; charset=utf-8'
+        elif self.path == '/json':
+            body = self.exporter.json()
+            ctype = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    """command line entry point"""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='python -m pyownet.exporter',
+        description='serve owserver readings over HTTP')
+    parser.add_argument('paths', metavar='PATH', nargs='+',
+                        help='owserver path to read')
+    parser.add_argument('--host', default='localhost',
+                        help='owserver host (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=4304,
+                        help='owserver port (default: %(default)s)')
+    parser.add_argument('--listen', default='127.0.0.1:9430',
+                        metavar='ADDR:PORT',
+                        help='HTTP listen address (default: %(default)s)')
+    parser.add_argument('--interval', type=float, default=10.0,
+                        help='refresh interval (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='concurrent reads (default: %(default)s)')
+    args = parser.parse_args()
+
+    addr, _, lport = args.listen.rpartition(':')
+    try:
+        owproxy = protocol.proxy(args.host, args.port)
+    except protocol.ConnError as exc:
+        sys.exit('Error connecting to {0}:{1} {2}'.format(
+            args.host, args.port, exc))
+    with Exporter(owproxy, args.paths, args.interval, args.workers) as exp:
+        exp.start()
+        exp.serve(addr or '127.0.0.1', int(lport))
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""address failover and shared name resolution
+
+By default a proxy object is pinned to the first address of its
+owserver answering a ping. A :class:`Failover` object, assigned to the
+``failover`` attribute of a proxy object, keeps instead the addresses
+of a list of equivalent owservers: a request failing with ConnError is
+sent again to the next address. Names are resolved by :func:`resolve`,
+whose results are cached and shared by all callers, and resolved again
+after a time to live.
+
+>>> from pyownet import protocol, failover
+>>> owproxy = protocol.proxy(host="owserver-a.example.com",
+...                          alternates=[("owserver-b.example.com", 4304)])
+>>> owproxy.failover.servers
+[('owserver-a.example.com', 4304), ('owserver-b.example.com', 4304)]
+>>> failover.resolve("owserver-b.example.com", 4304, ttl=60)
+[(2, ('192.0.2.2', 4304))]
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import socket
+import threading
+
+from . import protocol
+from .protocol import monotonic
+
+
+# shared resolution cache: (host, port) -> [expiry, addresses, resolving]
+_gai_cache = {}
+_gai_lock = threading.Lock()
+
+
+def resolve(host, port, ttl=0):
+    """return the list of (family, sockaddr) of an owserver at host, port
+
+    results are cached for ttl seconds and shared by all callers; while
+    an expired entry is being resolved again, or if resolution fails,
+    other callers get the stale entry.
+    """
+
+    key = (host, port)
+    now = monotonic()
+    with _gai_lock:
+        entry = _gai_cache.get(key)
+        if entry is not None:
+            if entry[0] > now or entry[2]:
+                return entry[1]
+            entry[2] = True
+
+    try:
+        gai = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM,
+                                 socket.IPPROTO_TCP)
+    except socket.gaierror as err:
+        if entry is None:
+            raise protocol.ConnError(*err.args)
+        gai = None
+    finally:
+        if entry is not None:
+            with _gai_lock:
+                entry[2] = False
+    if gai is None:
+        return entry[1]
+
+    addrs = [(family, sockaddr) for (family, _, _, _, sockaddr) in gai]
+    with _gai_lock:
+        _gai_cache[key] = [now + ttl, addrs, False]
+    return addrs
+
+
+class Failover(object):
+    """Addresses of a set of equivalent owservers
+
+    ``servers`` is a list of ``(host, port)`` tuples, in order of
+    preference; hosts are resolved by the shared resolution cache, and
+    re-resolved every ``ttl`` seconds.
+    """
+
+    def __init__(self, servers, ttl=60.0):
+        if not servers:
+            raise ValueError('no servers given')
+        self.servers = [(host, int(port)) for (host, port) in servers]
+        self.ttl = ttl
+        self._reset()
+
+    def _reset(self):
+        # forget resolved addresses
+        self._lock = threading.Lock()
+        self._addrs = None
+        self._expiry = 0.0
+
+    def __repr__(self):
+        return "<Failover {0!r}>".format(self.servers)
+
+    def __getstate__(self):
+        # addresses are resolved again after unpickling
+        return {'servers': self.servers, 'ttl': self.ttl}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def addresses(self):
+        """list of (family, sockaddr) tuples of all servers"""
+
+        with self._lock:
+            if self._addrs is not None and monotonic() < self._expiry:
+                return self._addrs
+            addrs = []
+            lasterr = None
+            for host, port in self.servers:
+                try:
+                    res = resolve(host, port, self.ttl)
+                except protocol.ConnError as err:
+                    lasterr = err
+                    continue
+                addrs.extend(i for i in res if i not in addrs)
+            if not addrs:
+                raise lasterr
+            self._addrs = addrs
+            self._expiry = monotonic() + self.ttl
+            return addrs
@@ -0,0 +1,343 @@
+"""hedged requests, to cut tail latency
+
+Occasionally a single owserver request is much slower than usual, e.g.
+when a 1-wire bus collision forces a retry. A :class:`Hedger` watches
+the latency of idempotent requests (read, dir, present, get, ping) of
+the proxy objects it wraps: if no reply arrives within a given
+percentile of the observed latency, a duplicate request is sent on a
+second connection, and the first reply wins; the other one is
+discarded. The fraction of hedged requests is capped, so that a slow
+owserver is not flooded with duplicates.
+
+>>> from pyownet import protocol, hedge
+>>> with hedge.Hedger(percentile=95, max_rate=0.05) as hedger:
+...     owproxy = hedger.wrap(protocol.proxy(host="owserver.example.com"))
+...     owproxy.read('/28.000028D70000/temperature')
+...
+'           4'
+>>> hedger.metrics()['hedged']
+0
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+import threading
+import collections
+if sys.version_info < (3, ):
+    import Queue as queue
+else:
+    import queue
+
+from . import protocol
+from .protocol import monotonic
+
+# message types that can be safely sent twice
+IDEMPOTENT = frozenset((
+    protocol.MSG_NOP, protocol.MSG_READ, protocol.MSG_PRESENCE,
+    protocol.MSG_DIRALL, protocol.MSG_DIRALLSLASH, protocol.MSG_GET,
+    protocol.MSG_GETSLASH, ))
+
+# hedge delay is recomputed every _REFRESH latency samples
+_REFRESH = 16
+
+
+class Hedger(object):
+    """Hedging policy for idempotent requests
+
+    A duplicate request is sent when no reply is received within the
+    ``percentile`` of the last ``window`` latencies observed for the
+    same owserver and message type, but not before ``min_delay``
+    seconds; no request is hedged until ``min_samples`` latencies are
+    known. At most a ``max_rate`` fraction of the requests is hedged,
+    with bursts of up to ``burst`` hedges.
+
+    Hedger objects are thread-safe, and can be shared by many proxies;
+    worker threads are shut down by close, or on exit from a with block.
+    """
+
+    def __init__(self, percentile=95.0, max_rate=0.05, window=256,
+                 min_samples=32, min_delay=0.001, burst=10):
+        if not 0 < percentile < 100:
+            raise ValueError('percentile must be in range (0, 100)')
+        if not 0 <= max_rate <= 1:
+            raise ValueError('max_rate must be in range [0, 1]')
+        if min_samples > window:
+            raise ValueError('min_samples cannot exceed window')
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._nsamples = {}
+        self._delays = {}
+        self._tokens = float(burst)
+        self._workers = _Workers()
+        self._counts = dict(calls=0, hedged=0, won=0, suppressed=0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __reduce__(self):
+        # latency history and threads are not pickled
+        return (Hedger, (self.percentile, self.max_rate, self.window,
+                         self.min_samples, self.min_delay, self.burst))
+
+    def wrap(self, owproxy):
+        """return a clone of owproxy, whose requests are hedged"""
+
+        return protocol._wrap(owproxy, hedger=self)
+
+    def close(self, timeout=None):
+        """shut down the worker threads
+
+        threads running a request exit when it completes, and are
+        waited for at most timeout seconds each. The hedger can still
+        be used afterwards: new threads are started as needed.
+        """
+
+        self._workers.close(timeout)
+
+    def metrics(self):
+        """return counts of requests, hedges, and hedges that won
+
+        'suppressed' hedges were due, but denied by the rate cap.
+        """
+
+        with self._lock:
+            res = dict(self._counts)
+        res['rate'] = res['hedged'] / float(res['calls'] or 1)
+        return res
+
+    def delay(self, sockaddr, msgtype):
+        """current hedge delay for messages of msgtype, or None"""
+
+        delay = self._delays.get((sockaddr, msgtype))
+        if delay is None:
+            return None
+        return max(delay, self.min_delay)
+
+    def _sample(self, key, latency):
+        # record latency of a request not won by a hedge
+
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = collections.deque(
+                    maxlen=self.window)
+            samples.append(latency)
+            count = self._nsamples[key] = self._nsamples.get(key, 0) + 1
+            if len(samples) >= self.min_samples and (
+                    key not in self._delays or count % _REFRESH == 0):
+                ordered = sorted(samples)
+                i = int(len(ordered) * self.percentile / 100.0)
+                self._delays[key] = ordered[min(i, len(ordered) - 1)]
+
+    def _admit(self):
+        # True if a hedge is allowed by the rate cap
+
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self._counts['hedged'] += 1
+                return True
+            self._counts['suppressed'] += 1
+            return False
+
+    def _call(self, owproxy, msg, timeout=0):
+        # send encoded message via owproxy._transact, hedged if slow
+
+        msgtype = protocol._ToServerHeader._struct.unpack_from(msg)[2]
+        if msgtype not in IDEMPOTENT:
+            return owproxy._transact(msg, timeout)
+        key = (owproxy._sockaddr, msgtype)
+        with self._lock:
+            self._counts['calls'] += 1
+            self._tokens = min(self._tokens + self.max_rate, self.burst)
+
+        delay = self.delay(*key)
+        if delay is None:
+            # still learning latencies
+            tic = monotonic()
+            res = owproxy._transact(msg, timeout)
+            self._sample(key, monotonic() - tic)
+            return res
+
+        race = _Race()
+        self._workers.run(self._attempt, race, owproxy, msg, timeout, key,
+                          True)
+        tend = monotonic() + delay
+        with race.cond:
+            while not race.done():
+                wait = tend - monotonic()
+                if wait <= 0:
+                    break
+                race.cond.wait(wait)
+            if race.done() or not self._admit():
+                hedged = False
+            else:
+                race.pending += 1
+                hedged = True
+        if hedged:
+            self._workers.run(self._attempt, race, owproxy, msg, timeout,
+                              key, False)
+        with race.cond:
+            while not race.done():
+                race.cond.wait()
+        if race.winner is None:
+            raise race.error
+        if race.winner == 'hedge':
+            with self._lock:
+                self._counts['won'] += 1
+        return race.result
+
+    def _attempt(self, race, owproxy, msg, timeout, key, primary):
+        # run a request of race, in a worker thread
+
+        tic = monotonic()
+        res = err = None
+        try:
+            res = owproxy._transact(msg, timeout)
+        except Exception as exc:
+            err = exc
+        if primary and err is None:
+            self._sample(key, monotonic() - tic)
+        with race.cond:
+            race.pending -= 1
+            if race.winner is None:
+                if err is None:
+                    race.winner = 'primary' if primary else 'hedge'
+                    race.result = res
+                elif race.error is None:
+                    race.error = err
+            race.cond.notify_all()
+
+
+class _Race(object):
+    """primary request and its hedge, first reply wins"""
+
+    __slots__ = ('cond', 'pending', 'winner', 'result', 'error', )
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pending = 1
+        self.winner = None
+        self.result = None
+        self.error = None
+
+    def done(self):
+        return self.winner is not None or not self.pending
+
+
+class _Workers(object):
+    """threads running requests, kept for reuse while busy"""
+
+    # seconds before an idle thread exits
+    idle_timeout = 30.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = []
+        self._all = set()
+        # bumped by close(): older workers exit when done
+        self._generation = 0
+
+    def run(self, func, *args):
+        # run func(*args) in an idle thread, or a new one
+
+        with self._lock:
+            try:
+                worker = self._idle.pop()
+            except IndexError:
+                worker = _Worker(self, self._generation)
+                self._all.add(worker)
+        worker.tasks.put((func, args))
+
+    def close(self, timeout=None):
+        # stop idle threads, and wait for busy ones
+
+        with self._lock:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+            workers = list(self._all)
+        for worker in idle:
+            worker.tasks.put(None)
+        current = threading.current_thread()
+        for worker in workers:
+            if worker.thread is not current:
+                worker.thread.join(timeout)
+
+    def _expire(self, worker):
+        # remove idle worker, return False if taken meanwhile
+
+        with self._lock:
+            try:
+                self._idle.remove(worker)
+            except ValueError:
+                return False
+            self._all.discard(worker)
+            return True
+
+    def _done(self, worker):
+        # worker completed a task: return True if it has to exit
+
+        with self._lock:
+            if worker.generation == self._generation:
+                self._idle.append(worker)
+                return False
+            self._all.discard(worker)
+            return True
+
+
+class _Worker(object):
+
+    def __init__(self, workers, generation):
+        self.workers = workers
+        self.generation = generation
+        self.tasks = queue.Queue()
+        self.thread = threading.Thread(target=self._run,
+                                       name='pyownet-hedge')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        workers = self.workers
+        while True:
+            try:
+                task = self.tasks.get(timeout=workers.idle_timeout)
+            except queue.Empty:
+                if workers._expire(self):
+                    return
+                # taken meanwhile, a task is coming
+                continue
+            if task is None:
+                # shut down by close()
+                with workers._lock:
+                    workers._all.discard(self)
+                return
+            func, args = task
+            func(*args)
+            if workers._done(self):
+                return
@@ -0,0 +1,423 @@
+"""thread-free concurrent requests to owservers
+
+This module drives many owserver requests from a single thread: each
+request has its own non-blocking socket, and a :class:`Multiplexer`
+object advances connection set up, sending, keepalive handling and
+reception for all of them, by means of the :mod:`selectors` module;
+it requires Python 3.4 or later.
+
+>>> from pyownet import protocol, multiplex
+>>> owproxy = protocol.proxy(host="owserver.example.com", port=4304)
+>>> mux = multiplex.Multiplexer()
+>>> for path in owproxy.dir():
+...     _ = mux.read(owproxy, path + 'temperature')
+>>> for req in mux.as_completed():
+...     print(req.path, req.result())
+/26.000026D90100/temperature b'         3.9'
+/28.000028D70000/temperature b'           4'
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import errno
+import socket
+import collections
+try:
+    import selectors
+except ImportError:
+    raise ImportError('pyownet.multiplex requires the selectors module, '
+                      'available in Python 3.4 or later')
+
+from . import protocol
+from .protocol import (monotonic, str2bytez, bytes2str)
+
+# request states
+_QUEUED, _CONNECTING, _SENDING, _RECEIVING, _DONE = range(5)
+
+# bytes requested to each socket recv call
+_RECV_SIZE = 8192
+
+
+class Request(object):
+    """A request submitted to a :class:`Multiplexer`
+
+    should not be instantiated directly
+    """
+
+    def __init__(self, owproxy, path, decode, timeout):
+        self.proxy = owproxy
+        self.path = path
+        self._msg = None
+        self._decode = decode
+        self._timeout = timeout
+        self._state = _QUEUED
+        self._sock = None
+        self._sent = 0
+        self._proto = protocol.ClientProtocol(owproxy.max_payload)
+        self._tstart = None
+        self._deadline = None
+        self._result = None
+        self._error = None
+
+    def __repr__(self):
+        return "<Request {0!r} on {1}>".format(self.path, self.proxy)
+
+    def done(self):
+        """True if the request is completed"""
+
+        return self._state == _DONE
+
+    def result(self):
+        """return request result, or raise the corresponding exception"""
+
+        if self._state != _DONE:
+            raise ValueError('request not completed')
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def exception(self):
+        """return request exception, or None"""
+
+        if self._state != _DONE:
+            raise ValueError('request not completed')
+        return self._error
+
+
+class Multiplexer(object):
+    """Drive many owserver requests concurrently from a single thread
+
+    Requests follow the non-persistent protocol, on a new socket each.
+    At most ``max_connections`` sockets are open at the same time, if
+    given; further requests are queued.
+    """
+
+    def __init__(self, max_connections=None):
+        self.max_connections = max_connections
+        self._sel = selectors.DefaultSelector()
+        self._active = set()
+        self._queue = collections.deque()
+        self._completed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._active) + len(self._queue) + len(self._completed)
+
+    def close(self):
+        """abort all pending requests and release resources"""
+
+        for req in list(self._active):
+            self._finish(req, error=protocol.ConnError(
+                errno.ECONNABORTED, 'request aborted'))
+        self._queue.clear()
+        del self._completed[:]
+        self._sel.close()
+
+    #
+    # request submission
+    #
+
+    def submit(self, owproxy, msgtype, payload, flags=0, size=0, offset=0,
+               timeout=0, path=None, decode=None):
+        """submit a generic message, as 'sendmess' of proxy objects
+
+        The result of the returned request is a ``(retcode, data)`` tuple,
+        unless a different ``decode(request, retcode, data)`` function is
+        given.
+        """
+
+        if not isinstance(owproxy, protocol._Proxy):
+            raise TypeError('argument is not a Proxy object')
+        if timeout < 0:
+            raise ValueError("timeout cannot be negative!")
+
+        flags |= owproxy.flags
+        flags &= ~protocol.FLG_PERSISTENCE
+        req = Request(owproxy, path, decode or _decode_sendmess, timeout)
+        req._msg = req._proto.send_request(msgtype, payload, flags, size,
+                                           offset)
+        self._queue.append(req)
+        self._start_queued()
+        return req
+
+    def ping(self, owproxy):
+        """submit a ping message"""
+
+        return self.submit(owproxy, protocol.MSG_NOP, bytes(),
+                           decode=_decode_ping)
+
+    def present(self, owproxy, path, timeout=0):
+        """submit a presence message"""
+
+        return self.submit(owproxy, protocol.MSG_PRESENCE, str2bytez(path),
+                           timeout=timeout, path=path, decode=_decode_present)
+
+    def dir(self, owproxy, path='/', slash=True, bus=False, timeout=0):
+        """submit a directory listing message"""
+
+        if slash:
+            msg = protocol.MSG_DIRALLSLASH
+        else:
+            msg = protocol.MSG_DIRALL
+        if bus:
+            flags = protocol.FLG_BUS_RET
+        else:
+            flags = 0
+
+        return self.submit(owproxy, msg, str2bytez(path), flags,
+                           timeout=timeout, path=path, decode=_decode_dir)
+
+    def get(self, owproxy, path='/', slash=True, bus=False, timeout=0):
+        """submit a get message (directory listing or read)"""
+
+        if slash:
+            msg = protocol.MSG_GETSLASH
+        else:
+            msg = protocol.MSG_GET
+        if bus:
+            flags = protocol.FLG_BUS_RET
+        else:
+            flags = 0
+
+        return self.submit(owproxy, msg, str2bytez(path), flags,
+                           size=owproxy.max_payload, timeout=timeout,
+                           path=path, decode=_decode_get)
+
+    def read(self, owproxy, path, size=None, offset=0, timeout=0):
+        """submit a read message, size defaults to owproxy.max_payload"""
+
+        if size is None:
+            size = owproxy.max_payload
+        elif size > owproxy.max_payload:
+            raise ValueError("size cannot exceed %d" % owproxy.max_payload)
+
+        return self.submit(owproxy, protocol.MSG_READ, str2bytez(path),
+                           size=size, offset=offset, timeout=timeout,
+                           path=path, decode=_decode_read)
+
+    def write(self, owproxy, path, data, offset=0, timeout=0):
+        """submit a write message"""
+
+        if not isinstance(data, (bytes, bytearray, )):
+            raise TypeError("'data' argument must be binary")
+
+        return self.submit(owproxy, protocol.MSG_WRITE,
+                           str2bytez(path) + data, size=len(data),
+                           offset=offset, timeout=timeout, path=path,
+                           decode=_decode_write)
+
+    #
+    # event loop
+    #
+
+    def poll(self, timeout=None):
+        """advance pending requests, return list of completed ones
+
+        Blocks until at least a request is completed, or ``timeout``
+        seconds are elapsed.
+        """
+
+        # requests which failed before connecting
+        completed, self._completed = self._completed, []
+        if timeout is not None:
+            tend = monotonic() + timeout
+        while self._active and not completed:
+            now = monotonic()
+            wait = min(req._deadline for req in self._active) - now
+            if timeout is not None:
+                wait = min(wait, tend - now)
+            for key, _ in self._sel.select(max(wait, 0)):
+                req = key.data
+                try:
+                    self._advance(req)
+                except protocol.Error as exc:
+                    self._finish(req, error=exc)
+                if req._state == _DONE:
+                    completed.append(req)
+
+            now = monotonic()
+            for req in [r for r in self._active if r._deadline <= now]:
+                self._finish(req, error=protocol.ConnError(
+                    errno.ETIMEDOUT, 'timed out'))
+                completed.append(req)
+            self._start_queued()
+            if timeout is not None and now >= tend:
+                break
+        return completed
+
+    def as_completed(self, timeout=None):
+        """yield requests as they are completed, until none is pending
+
+        If ``timeout`` is given, stop waiting after ``timeout`` seconds.
+        """
+
+        if timeout is not None:
+            tend = monotonic() + timeout
+        while self:
+            wait = None
+            if timeout is not None:
+                wait = tend - monotonic()
+                if wait <= 0:
+                    break
+            for req in self.poll(wait):
+                yield req
+
+    #
+    # state machine
+    #
+
+    def _start_queued(self):
+        # open connections for queued requests, within limits
+
+        limit = self.max_connections
+        while self._queue and (limit is None or len(self._active) < limit):
+            req = self._queue.popleft()
+            self._active.add(req)
+            try:
+                self._connect(req)
+            except protocol.Error as exc:
+                self._finish(req, error=exc)
+                self._completed.append(req)
+
+    def _connect(self, req):
+        owp = req.proxy
+        req._tstart = monotonic()
+        req._deadline = req._tstart + protocol._SCK_TIMEOUT
+        try:
+            req._sock = socket.socket(owp._family, socket.SOCK_STREAM,
+                                      socket.IPPROTO_TCP)
+            req._sock.setblocking(False)
+            err = req._sock.connect_ex(owp._sockaddr)
+        except IOError as err:
+            raise protocol.ConnError(*err.args)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            raise protocol.ConnError(err, os.strerror(err))
+        req._state = _CONNECTING
+        self._sel.register(req._sock, selectors.EVENT_WRITE, req)
+
+    def _advance(self, req):
+        # called when req socket is ready
+
+        req._deadline = monotonic() + protocol._SCK_TIMEOUT
+        if req._state == _CONNECTING:
+            err = req._sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                raise protocol.ConnError(err, os.strerror(err))
+            req._state = _SENDING
+        if req._state == _SENDING:
+            try:
+                req._sent += req._sock.send(req._msg[req._sent:])
+            except IOError as err:
+                raise protocol.ConnError(*err.args)
+            if req._sent == len(req._msg):
+                req._state = _RECEIVING
+                self._sel.modify(req._sock, selectors.EVENT_READ, req)
+        elif req._state == _RECEIVING:
+            try:
+                data = req._sock.recv(_RECV_SIZE)
+            except IOError as err:
+                raise protocol.ConnError(*err.args)
+            req._proto.receive_data(data)
+            self._handle_events(req)
+
+    def _handle_events(self, req):
+        # process events of req protocol state machine
+
+        while True:
+            event = req._proto.next_event()
+            if event is protocol.NEED_DATA:
+                return
+            if isinstance(event, protocol.KeepAlive):
+                if req._timeout:
+                    tcom = monotonic() - req._tstart
+                    if tcom > req._timeout:
+                        raise protocol.OwnetTimeout(tcom, req._timeout)
+            elif isinstance(event, protocol.Reply):
+                try:
+                    result = req._decode(req, event.ret, event.data)
+                except protocol.Error as exc:
+                    self._finish(req, error=exc)
+                else:
+                    self._finish(req, result=result)
+                return
+
+    def _finish(self, req, result=None, error=None):
+        # complete request and release socket
+
+        if req._sock is not None:
+            if req._state in (_CONNECTING, _SENDING, _RECEIVING):
+                self._sel.unregister(req._sock)
+            req._sock.close()
+            req._sock = None
+        req._result = result
+        req._error = error
+        req._state = _DONE
+        self._active.discard(req)
+
+
+#
+# reply decoding functions, following proxy objects semantics
+#
+
+def _check(req, ret):
+    if ret < 0:
+        raise protocol.OwnetError(-ret, req.proxy.errmess[-ret], req.path)
+
+
+def _decode_sendmess(req, ret, data):
+    return ret, data
+
+
+def _decode_ping(req, ret, data):
+    if data or ret > 0:
+        raise protocol.ProtocolError('invalid reply to ping message')
+    if ret < 0:
+        raise protocol.OwnetError(-ret, req.proxy.errmess[-ret])
+
+
+def _decode_present(req, ret, data):
+    return ret >= 0
+
+
+def _decode_dir(req, ret, data):
+    _check(req, ret)
+    if data:
+        return bytes2str(data).split(',')
+    else:
+        return []
+
+
+def _decode_get(req, ret, data):
+    _check(req, ret)
+    return protocol._get_result(req.path, ret, data)
+
+
+def _decode_read(req, ret, data):
+    _check(req, ret)
+    return data
+
+
+def _decode_write(req, ret, data):
+    _check(req, ret)
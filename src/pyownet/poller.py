@@ -0,0 +1,212 @@
+"""sharded polling of many owservers
+
+This module distributes read requests to one or more owservers over a
+pool of worker processes. Proxy objects are sent to the workers as
+connection descriptors (see the pickle support of proxy objects in
+:mod:`pyownet.protocol`), each worker keeps its own persistent
+connections, and only the decoded values are sent back.
+
+>>> from pyownet import protocol, poller
+>>> owproxy = protocol.proxy(host="owserver.example.com", port=4304)
+>>> with poller.ShardedPoller(processes=4, decode=float) as pp:
+...     res = pp.poll([(owproxy, ['/28.000028D70000/temperature',
+...                               '/26.000026D90100/temperature'])])
+>>> res
+[{'/28.000028D70000/temperature': 4.0, '/26.000026D90100/temperature': 3.9}]
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from __future__ import division
+
+import multiprocessing
+
+from . import protocol
+from . import aggregate as _aggregate
+
+# number of shards per worker process, used when splitting path lists
+_SHARDS_PER_PROCESS = 4
+
+# placeholder of values not read yet
+_PENDING = object()
+
+# persistent proxy objects owned by the current (worker) process,
+# indexed by connection descriptor
+_worker_proxies = {}
+
+
+def read_many(owproxy, paths, decode=None, aggregate=True):
+    """read all paths, return a list of values in the same order
+
+    Errors are not raised but returned in place of the corresponding
+    value: an :exc:`protocol.OwnetError` (or a ``ValueError`` raised by
+    ``decode``) affects a single path, while a connection or protocol
+    error aborts the request and is returned for all remaining paths.
+    A persistent proxy should be used, so that all reads share the
+    same connection.
+
+    If aggregate is true, channels of the same multi-channel property
+    (e.g. 'PIO.0' ... 'PIO.7') are read at once from the aggregate
+    property ('PIO.ALL'), see :mod:`pyownet.aggregate`.
+    """
+
+    results = [_PENDING] * len(paths)
+    groups = _aggregate.group(paths, owproxy) if aggregate else {}
+    # position -> aggregate path, for channels still to be read
+    owners = dict((pos, agg) for agg, members in groups.items()
+                  for pos, _ in members)
+    for i, path in enumerate(paths):
+        if results[i] is not _PENDING:
+            continue
+        try:
+            agg = owners.get(i)
+            if agg is not None:
+                members = groups[agg]
+                values = _aggregate.read(owproxy, agg,
+                                         [index for _, index in members])
+                if values is not None:
+                    for (pos, _), data in zip(members, values):
+                        results[pos] = _decode(data, decode)
+                    continue
+                # no aggregate, fall back to reading channels one by one
+                for pos, _ in members:
+                    del owners[pos]
+            results[i] = _decode(owproxy.read(path), decode)
+        except (protocol.OwnetError, ValueError) as exc:
+            results[i] = exc
+        except protocol.Error as exc:
+            results = [exc if res is _PENDING else res for res in results]
+            break
+    return results
+
+
+def _decode(data, decode):
+    # decoded data, or the ValueError raised by decode
+    if not decode:
+        return data
+    try:
+        return decode(data)
+    except ValueError as exc:
+        return exc
+
+
+def _worker_proxy(owproxy):
+    # return a persistent proxy reused across shards in this process
+
+    key = (owproxy._family, owproxy._sockaddr,
+           owproxy.flags & ~protocol.FLG_PERSISTENCE)
+    try:
+        return _worker_proxies[key]
+    except KeyError:
+        owp = _worker_proxies[key] = protocol.clone(owproxy, persistent=True)
+        return owp
+
+
+def _read_shard(shard):
+    # worker process entry point: shard is (proxy, paths, decode)
+
+    owproxy, paths, decode = shard
+    owp = _worker_proxy(owproxy)
+    results = read_many(owp, paths, decode)
+    if any(isinstance(res, protocol.ConnError) for res in results):
+        # do not reuse a possibly broken connection
+        owp.close_connection()
+    return results
+
+
+def _split(paths, nshards):
+    # split paths in at most nshards contiguous chunks of similar size
+
+    nshards = max(1, min(nshards, len(paths)))
+    size, rem = divmod(len(paths), nshards)
+    start = 0
+    for i in range(nshards):
+        stop = start + size + (1 if i < rem else 0)
+        yield paths[start:stop]
+        start = stop
+
+
+class ShardedPoller(object):
+    """Pool of worker processes for polling many owservers
+
+    Each call to :meth:`poll` splits the requested paths in shards,
+    reads them in parallel in the worker processes, and merges the
+    results back in a list of ``{path: value}`` dictionaries. Values
+    are transformed by ``decode`` (e.g. ``float``) in the workers, so
+    that parsing costs are also distributed.
+    """
+
+    def __init__(self, processes=None, decode=None):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.decode = decode
+        self._pool = multiprocessing.Pool(self.processes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """terminate worker processes"""
+
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def poll(self, targets):
+        """read paths from proxies in parallel
+
+        targets is a sequence of ``(proxy, paths)`` pairs; returns a list
+        with a ``{path: value}`` dictionary for each target
+        """
+
+        if self._pool is None:
+            raise ValueError('poll on closed ShardedPoller')
+
+        targets = [(owp, list(paths)) for owp, paths in targets]
+        npaths = sum(len(paths) for _, paths in targets)
+        if not npaths:
+            return [{} for _ in targets]
+
+        # shards are allotted to targets in proportion to their size
+        nshards = self.processes * _SHARDS_PER_PROCESS
+        shards = []
+        for owp, paths in targets:
+            if not isinstance(owp, protocol._Proxy):
+                raise TypeError('target is not a Proxy object')
+            if not paths:
+                continue
+            nsplit = -(-nshards * len(paths) // npaths)
+            shards.extend((owp, chunk, self.decode)
+                          for chunk in _split(paths, nsplit))
+
+        # shard results arrive in submission order
+        values = self._pool.imap(_read_shard, shards)
+        res = []
+        for _, paths in targets:
+            merged = {}
+            done = 0
+            while done < len(paths):
+                chunk = next(values)
+                merged.update(zip(paths[done:done + len(chunk)], chunk))
+                done += len(chunk)
+            res.append(merged)
+        return res
@@ -0,0 +1,225 @@
+"""pool of persistent owserver connections with request priorities
+
+A :class:`ConnectionPool` holds a fixed number of persistent
+connections to an owserver, shared by any number of threads through
+:class:`PooledProxy` objects. Each pooled proxy has a priority: when
+all connections are busy, waiting requests are served in order of
+priority, so that latency critical requests (alarms, actuators) jump
+ahead of bulk traffic (walks, polling). Some connections can be
+reserved to :data:`INTERACTIVE` requests.
+
+>>> from pyownet import protocol, pool
+>>> owproxy = protocol.proxy(host="owserver.example.com", port=4304)
+>>> cpool = pool.ConnectionPool(owproxy, size=4, reserved=1)
+>>> alarms = cpool.proxy(pool.INTERACTIVE)
+>>> walker = cpool.proxy(pool.BULK)
+>>> alarms.read('/28.000028D70000/temperature')
+'           4'
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import heapq
+import itertools
+import threading
+import contextlib
+
+from . import protocol
+from .protocol import monotonic
+
+# request priorities: lower values are served first
+INTERACTIVE = 0
+NORMAL = 1
+BULK = 2
+
+
+class _QueueStats(object):
+    """queue time statistics of a priority class"""
+
+    __slots__ = ('requests', 'total', 'max', 'waiting')
+
+    def __init__(self):
+        self.requests = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.waiting = 0
+
+    def add(self, wait):
+        self.requests += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+
+    def asdict(self):
+        return dict(requests=self.requests, waiting=self.waiting,
+                    wait_total=self.total, wait_max=self.max,
+                    wait_mean=self.total / self.requests if self.requests
+                    else 0.0)
+
+
+class ConnectionPool(object):
+    """Pool of ``size`` persistent connections to the owserver of owproxy
+
+    ``reserved`` connections can be used only by requests of priority
+    :data:`INTERACTIVE`; the other requests can use at most ``size -
+    reserved`` connections at the same time.
+    """
+
+    def __init__(self, owproxy, size=4, reserved=0):
+        if not isinstance(owproxy, protocol._Proxy):
+            raise TypeError('argument is not a Proxy object')
+        if size < 1:
+            raise ValueError('size must be positive')
+        if not 0 <= reserved < size:
+            raise ValueError('reserved must be in range [0, size)')
+        self.base = owproxy
+        self.size = size
+        self.reserved = reserved
+        self._idle = [protocol.clone(owproxy, persistent=True)
+                      for _ in range(size)]
+        self._members = list(self._idle)
+        self._shared_busy = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stats = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """close all idle connections"""
+
+        with self._cond:
+            for owp in self._idle:
+                owp.close_connection()
+
+    def proxy(self, priority=NORMAL):
+        """return a proxy object whose requests are sent via this pool"""
+
+        return PooledProxy(self, priority)
+
+    def metrics(self):
+        """return queue time statistics, per priority"""
+
+        with self._cond:
+            res = dict((prio, stats.asdict())
+                       for prio, stats in self._stats.items())
+            idle = len(self._idle)
+        return dict(idle=idle, busy=self.size - idle, priorities=res)
+
+    @contextlib.contextmanager
+    def connection(self, priority=NORMAL):
+        """context manager yielding a persistent proxy of the pool"""
+
+        member = self._acquire(priority)
+        try:
+            yield member
+        finally:
+            self._release(member, priority)
+
+    def _grantable(self, entry):
+        # True if the waiter entry can take a connection now
+
+        if not self._idle or self._waiters[0] is not entry:
+            return False
+        if entry[0] <= INTERACTIVE:
+            return True
+        return self._shared_busy < self.size - self.reserved
+
+    def _acquire(self, priority):
+        tic = monotonic()
+        entry = (priority, next(self._seq))
+        with self._cond:
+            stats = self._stats.get(priority)
+            if stats is None:
+                stats = self._stats[priority] = _QueueStats()
+            stats.waiting += 1
+            heapq.heappush(self._waiters, entry)
+            try:
+                while not self._grantable(entry):
+                    self._cond.wait()
+            finally:
+                stats.waiting -= 1
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                # next waiter could be grantable now
+                self._cond.notify_all()
+            if priority > INTERACTIVE:
+                self._shared_busy += 1
+            stats.add(monotonic() - tic)
+            return self._idle.pop()
+
+    def _release(self, member, priority):
+        with self._cond:
+            self._idle.append(member)
+            if priority > INTERACTIVE:
+                self._shared_busy -= 1
+            self._cond.notify_all()
+
+
+class PooledProxy(protocol._PersistentProxy):
+    """Proxy object sending requests via a :class:`ConnectionPool`
+
+    thread-safe; should not be instantiated directly, see
+    :meth:`ConnectionPool.proxy`
+    """
+
+    def __init__(self, pool, priority=NORMAL):
+        base = pool.base
+        super(PooledProxy, self).__init__(
+            base._family, base._sockaddr,
+            base.flags & ~protocol.FLG_PERSISTENCE, base.verbose,
+            base.errmess)
+        # options only: locks, idle connections are per proxy object
+        protocol._copy_options(base, self)
+        self.pool = pool
+        self.priority = priority
+
+    def __str__(self):
+        return "owserver at %s (pooled)" % (self._sockaddr, )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def close_connection(self):
+        pass
+
+    def _transact(self, msg, timeout=0):
+        # send encoded message on a pool connection
+
+        with self.pool.connection(self.priority) as member:
+            if member._sockaddr != self._sockaddr:
+                # follow address failover
+                member._switch_address((self._family, self._sockaddr))
+            return member._transact(msg, timeout)
+
+    def _transact_iter(self, msg, timeout=0):
+        # send encoded message on a pool connection, yield replies
+
+        with self.pool.connection(self.priority) as member:
+            if member._sockaddr != self._sockaddr:
+                member._switch_address((self._family, self._sockaddr))
+            for reply in member._transact_iter(msg, timeout):
+                yield reply
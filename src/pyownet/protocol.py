@@ -42,8 +42,11 @@ function 'proxy'.
 
 from __future__ import print_function
 
+import re
+import errno
 import struct
 import socket
+import threading
 try:
     from time import monotonic
 except ImportError:
@@ -114,6 +117,9 @@ MSK_DEVFORMAT = 0xFF000000
 PTH_ERRCODES = '/settings/return_codes/text.ALL'
 PTH_VERSION = '/system/configuration/version'
 PTH_PID = '/system/process/pid'
+PTH_TIMEOUT_VOLATILE = '/settings/timeout/volatile'
+PTH_TIMEOUT_STABLE = '/settings/timeout/stable'
+PTH_STRUCTURE = '/structure'
 
 #
 # implementation specific constants
@@ -129,7 +135,6 @@ _SCK_TIMEOUT = 2.0
 _SOL_SOCKET = socket.SOL_SOCKET
 _SO_KEEPALIVE = socket.SO_KEEPALIVE
 if __debug__:
-    import errno
     _ENOTCONN = errno.ENOTCONN
 
 
@@ -162,6 +167,74 @@ def bytes2str(b):
     return _b2s(b)
 
 
+class Listing(object):
+    """directory listing, split into entries only on demand
+
+    returned by dir(..., lazy=True): only the raw reply payload is kept,
+    and entries are decoded one at a time while iterating.
+    """
+
+    __slots__ = ('_data', )
+
+    def __init__(self, data):
+        self._data = bytes(data)
+
+    def __repr__(self):
+        return "<Listing of %d entries>" % len(self)
+
+    def __len__(self):
+        return self._data.count(b',') + 1 if self._data else 0
+
+    def __iter__(self):
+        data = self._data
+        if not data:
+            return
+        start = 0
+        while True:
+            end = data.find(b',', start)
+            if end < 0:
+                yield _b2s(data[start:])
+                return
+            yield _b2s(data[start:end])
+            start = end + 1
+
+    def __contains__(self, entry):
+        if not isinstance(entry, str):
+            return False
+        item = _s2b(entry)
+        data = self._data
+        if data == item or b',' + item + b',' in data:
+            return True
+        return data.startswith(item + b',') or data.endswith(b',' + item)
+
+    def __eq__(self, other):
+        if isinstance(other, Listing):
+            return self._data == other._data
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+
+    __hash__ = None
+
+
+def _get_result(path, ret, data):
+    # decode the reply to a MSG_GET request: a directory listing, made of
+    # absolute paths, or the value of the entity at path
+
+    if ret > 0:
+        # number of bytes read, only for values
+        return data
+    if not data:
+        return [] if path.endswith('/') else data
+    if all(i.startswith(b'/') for i in data.split(b',')):
+        return bytes2str(data).split(',')
+    return data
+
+
 #
 # exceptions
 #
@@ -183,6 +256,7 @@ class MalformedHeader(ProtocolError):
     """Raised for header parsing errors."""
 
     def __init__(self, msg, header):
+        super(MalformedHeader, self).__init__(msg, header)
         self.msg = msg
         self.header = header
 
@@ -195,6 +269,7 @@ class ShortRead(ProtocolError):
     """Raised if not enough data received."""
 
     def __init__(self, read, expected):
+        super(ShortRead, self).__init__(read, expected)
         self.read = read
         self.expected = expected
 
@@ -206,6 +281,7 @@ class ShortWrite(ProtocolError):
     """Raised if unable to write all data."""
 
     def __init__(self, sent, tosend):
+        super(ShortWrite, self).__init__(sent, tosend)
         self.sent = sent
         self.tosend = tosend
 
@@ -213,6 +289,10 @@ class ShortWrite(ProtocolError):
         return "sent {0.sent} bytes instead of {0.tosend}.".format(self)
 
 
+class CircuitOpen(ConnError):
+    """Raised without contacting owserver, if its circuit is open."""
+
+
 class OwnetError(Error, EnvironmentError):
     """Raised when owserver returns error code"""
     # FIXME: since python 3.3 EnvironmentError is an alias for OSError
@@ -222,6 +302,7 @@ class OwnetTimeout(Error):
     """Raised if response of server takes longer than a given timeout."""
 
     def __init__(self, elapsed, timeout):
+        super(OwnetTimeout, self).__init__(elapsed, timeout)
         self.elapsed = elapsed
         self.timeout = timeout
 
@@ -340,6 +421,217 @@ class _FromServerHeader(_Header):
     _defaults = (0, 0, 0, FLG_OWNET, 0, 0)
 
 
+#
+# sans-I/O protocol core
+#
+
+class KeepAlive(object):
+    """event: server sent a keepalive (PING) frame"""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'KeepAlive()'
+
+
+class PersistenceGranted(object):
+    """event: server granted a persistent connection for next request"""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'PersistenceGranted()'
+
+
+class Reply(object):
+    """event: server reply to a request"""
+
+    __slots__ = ('ret', 'flags', 'data', '_raw', )
+
+    def __init__(self, raw, ret, flags, data):
+        self._raw = raw
+        self.ret = ret
+        self.flags = flags
+        self.data = data
+
+    @property
+    def header(self):
+        """reply header, as a _FromServerHeader object"""
+
+        return _FromServerHeader(self._raw)
+
+    def __repr__(self):
+        return ('Reply(ret={0.ret}, flags={0.flags:#x}, data={0.data!r})'
+                .format(self))
+
+
+# next_event() return value if more data has to be received
+NEED_DATA = None
+
+# ClientProtocol states
+_IDLE, _AWAIT_REPLY, _CLOSED = range(3)
+
+
+class ClientProtocol(object):
+    """sans-I/O state machine for the client side of a connection
+
+    This class implements framing, header validation, keepalive and
+    persistence logic of the owserver protocol, independently from the
+    actual transport. Outgoing messages are obtained by 'send_request';
+    incoming bytes are passed to 'receive_data' and parsed into events
+    returned by 'next_event'. Protocol errors are raised by 'next_event'
+    as ProtocolError exceptions.
+
+    A MSG_DIR request is answered by one reply per directory entry,
+    terminated by a reply without payload: 'awaiting_reply' is True
+    until the terminating reply is returned.
+    """
+
+    def __init__(self, max_payload=MAX_PAYLOAD):
+        self.max_payload = max_payload
+        self._state = _IDLE
+        self._persistence = False
+        self._stream = False
+        self._reply = None
+        self._buf = bytearray()
+        self._pos = 0
+        self._eof = False
+
+    @property
+    def idle(self):
+        """True if ready for a new request on the same connection"""
+
+        return self._state == _IDLE
+
+    @property
+    def closed(self):
+        """True if the connection cannot be reused"""
+
+        return self._state == _CLOSED
+
+    @property
+    def awaiting_reply(self):
+        """True if (more) replies to the current request are expected"""
+
+        return self._state == _AWAIT_REPLY and self._reply is None
+
+    @property
+    def bytes_wanted(self):
+        """number of bytes needed to complete the current frame"""
+
+        size = _FromServerHeader.header_size
+        avail = len(self._buf) - self._pos
+        if avail < size:
+            return size - avail
+        payload = _FromServerHeader._struct.unpack_from(
+            self._buf, self._pos)[1]
+        return max(size + max(payload, 0) - avail, 0)
+
+    def send_request(self, msgtype, payload, flags, size=0, offset=0):
+        """return encoded request message, to be sent to the server"""
+
+        tohead = _ToServerHeader(payload=len(payload), type=msgtype,
+                                 flags=flags, size=size, offset=offset)
+        return self.send_encoded(tohead + payload)
+
+    def send_encoded(self, msg):
+        """register an already encoded request message, return it"""
+
+        if self._state != _IDLE:
+            raise ValueError('connection not ready for a new request')
+        self._state = _AWAIT_REPLY
+        _, _, msgtype, flags, _, _ = _ToServerHeader._struct.unpack_from(msg)
+        self._persistence = bool(flags & FLG_PERSISTENCE)
+        self._stream = msgtype == MSG_DIR
+        return msg
+
+    def receive_data(self, data):
+        """feed bytes received from server; empty data signals EOF"""
+
+        if data:
+            self._buf += data
+        else:
+            self._eof = True
+
+    def _consume(self, nbytes):
+        # advance read position, data is discarded only from time to time
+        # since deleting from the head of a bytearray requires a copy
+
+        self._pos += nbytes
+        if self._pos == len(self._buf):
+            del self._buf[:]
+            self._pos = 0
+        elif self._pos > MAX_PAYLOAD:
+            del self._buf[:self._pos]
+            self._pos = 0
+
+    def next_event(self):
+        """return next event, or NEED_DATA"""
+
+        if self._reply is not None:
+            reply, self._reply = self._reply, None
+            self._state = _IDLE
+            return reply
+
+        buf = self._buf
+        pos = self._pos
+        avail = len(buf) - pos
+
+        if self._state != _AWAIT_REPLY:
+            if avail:
+                raise ProtocolError('unexpected data from server')
+            return NEED_DATA
+
+        size = _FromServerHeader.header_size
+        if avail < size:
+            if self._eof:
+                self._state = _CLOSED
+                raise ShortRead(avail, size)
+            return NEED_DATA
+        version, payload = _FromServerHeader._struct.unpack_from(buf, pos)[:2]
+
+        # error conditions
+        if version != 0:
+            self._state = _CLOSED
+            raise MalformedHeader('bad version', _FromServerHeader(
+                bytes(buf[pos:pos + size])))
+        if payload > self.max_payload:
+            self._state = _CLOSED
+            raise MalformedHeader('huge payload, unwilling to read',
+                                  _FromServerHeader(
+                                      bytes(buf[pos:pos + size])))
+
+        if payload < 0:
+            # Server said PING to keep connection alive during lenghty op
+            self._consume(size)
+            return KeepAlive()
+
+        if avail < size + payload:
+            if self._eof:
+                self._state = _CLOSED
+                raise ShortRead(avail - size, payload)
+            return NEED_DATA
+
+        raw = bytes(buf[pos:pos + size])
+        _, _, ret, flags, dsize, _ = _FromServerHeader._struct.unpack(raw)
+        if not 0 <= dsize <= payload:
+            self._state = _CLOSED
+            raise MalformedHeader('invalid data size', _FromServerHeader(raw))
+        pos += size
+        reply = Reply(raw, ret, flags, bytes(buf[pos:pos + dsize]))
+        self._consume(size + payload)
+
+        if self._stream and payload and ret >= 0:
+            # a directory entry, more replies follow
+            return reply
+        if self._persistence and flags & FLG_PERSISTENCE:
+            # persistence granted, signaled just before the reply
+            self._reply = reply
+            return PersistenceGranted()
+        self._state = _CLOSED
+        return reply
+
+
 #
 # connection object (internal)
 #
@@ -347,16 +639,18 @@ class _FromServerHeader(_Header):
 class _OwnetConnection(object):
     """This class encapsulates a connection to an owserver."""
 
-    def __init__(self, sockaddr, family=socket.AF_INET, verbose=False):
+    def __init__(self, sockaddr, family=socket.AF_INET, verbose=False,
+                 connect_timeout=_SCK_TIMEOUT, max_payload=MAX_PAYLOAD):
         """establish a connection with server at sockaddr"""
 
         self.verbose = verbose
         self.peername = None
+        self._proto = ClientProtocol(max_payload)
 
         self.socket = socket.socket(family=family,
                                     type=socket.SOCK_STREAM,
                                     proto=socket.IPPROTO_TCP)
-        self.socket.settimeout(_SCK_TIMEOUT)
+        self.socket.settimeout(connect_timeout)
         # FIXME: is _SO_KEEPALIVE really useful?
         self.socket.setsockopt(_SOL_SOCKET, _SO_KEEPALIVE, 1)
 
@@ -364,6 +658,8 @@ class _OwnetConnection(object):
             self.socket.connect(sockaddr)
         except IOError as err:
             raise ConnError(*err.args)
+        if connect_timeout != _SCK_TIMEOUT:
+            self.socket.settimeout(_SCK_TIMEOUT)
 
         assert self.socket.getpeername() == sockaddr
         self.peername = sockaddr
@@ -408,42 +704,79 @@ class _OwnetConnection(object):
     def req(self, msgtype, payload, flags, size=0, offset=0, timeout=0):
         """send message to server and return response"""
 
-        if timeout < 0:
-            raise ValueError("timeout cannot be negative!")
-
         tohead = _ToServerHeader(payload=len(payload), type=msgtype,
                                  flags=flags, size=size, offset=offset)
+        return self.sendreq(tohead + payload, timeout)
+
+    def sendreq(self, msg, timeout=0):
+        """send encoded message (header + payload) and return response"""
+
+        if timeout < 0:
+            raise ValueError("timeout cannot be negative!")
 
         tstartcom = monotonic()  # set timer when communication begins
-        self._send_msg(tohead, payload)
+        self._send_msg(self._proto.send_encoded(msg))
+        return self._next_reply(tstartcom, timeout)
+
+    def sendreq_iter(self, msg, timeout=0):
+        """send encoded message and yield responses, as received
+
+        for MSG_DIR requests, one response per directory entry is
+        yielded, the last response terminating the listing.
+        """
+
+        if timeout < 0:
+            raise ValueError("timeout cannot be negative!")
+
+        tstartcom = monotonic()
+        self._send_msg(self._proto.send_encoded(msg))
+        while True:
+            reply = self._next_reply(tstartcom, timeout)
+            yield reply
+            if not self._proto.awaiting_reply:
+                break
+
+    def _next_reply(self, tstartcom, timeout):
+        # receive next reply, return (ret, flags, data)
 
         while True:
-            fromhead, data = self._read_msg()
+            event = self._proto.next_event()
 
-            if fromhead.payload >= 0:
+            if event is NEED_DATA:
+                self._recv_data()
+                continue
+
+            if self.verbose:
+                print('<-', repr(event))
+
+            if isinstance(event, Reply):
                 # we received a valid answer and return the result
-                return fromhead.ret, fromhead.flags, data
+                return event.ret, event.flags, event.data
 
-            assert msgtype != MSG_NOP
+            if isinstance(event, KeepAlive):
+                # Server said PING to keep connection alive during lenghty op
+                # check if timeout has expired
+                if timeout:
+                    tcom = monotonic() - tstartcom
+                    if tcom > timeout:
+                        raise OwnetTimeout(tcom, timeout)
 
-            # we did not exit the loop because payload is negative
-            # Server said PING to keep connection alive during lenghty op
+    @property
+    def reusable(self):
+        """True if server granted persistence for next request"""
 
-            # check if timeout has expired
-            if timeout:
-                tcom = monotonic() - tstartcom
-                if tcom > timeout:
-                    raise OwnetTimeout(tcom, timeout)
+        return self._proto.idle
 
-    def _send_msg(self, header, payload):
+    def _send_msg(self, msg):
         """send message to server"""
 
+        size = _ToServerHeader.header_size
         if self.verbose:
-            print('->', repr(header))
-            print('..', repr(payload))
-        assert header.payload == len(payload)
+            print('->', repr(_ToServerHeader(msg[:size])))
+            print('..', repr(msg[size:]))
+        assert _ToServerHeader(msg[:size]).payload == len(msg) - size
         try:
-            sent = self.socket.send(header + payload)
+            sent = self.socket.send(msg)
         except IOError as err:
             raise ConnError(*err.args)
 
@@ -451,99 +784,143 @@ class _OwnetConnection(object):
         # investigate under which situations socket.send should be retried
         # instead of aborted.
         # FIXME FIXME FIXME
-        if sent < len(header + payload):
-            raise ShortWrite(sent, len(header + payload))
-        assert sent == len(header + payload), sent
+        if sent < len(msg):
+            raise ShortWrite(sent, len(msg))
+        assert sent == len(msg), sent
 
-    def _read_msg(self):
-        """read message from server"""
+    def _recv_data(self):
+        """receive data for the current frame from server"""
 
         #
         # NOTE:
-        # '_recv_socket(nbytes)' was implemented as
-        # 'socket.recv(nbytes, socket.MSG_WAITALL)'
-        # but socket.MSG_WAITALL proved not reliable
+        # exactly the bytes missing from the current frame are requested,
+        # 'socket.recv(nbytes, socket.MSG_WAITALL)' proved not reliable
         #
+        try:
+            data = self.socket.recv(self._proto.bytes_wanted)
+        except IOError as err:
+            raise ConnError(*err.args)
 
-        def _recv_socket(nbytes):
-            """read nbytes bytes from self.socket"""
-
-            #
-            # code below is written under the assumption that
-            # 'nbytes' is smallish so that the 'while len(buf) < nbytes' loop
-            # is entered rarerly
-            #
-            try:
-                buf = self.socket.recv(nbytes)
-            except IOError as err:
-                raise ConnError(*err.args)
-
-            if not buf:
-                raise ShortRead(0, nbytes)
+        if not data and self.verbose:
+            print('ee', 'connection closed by server')
+        self._proto.receive_data(data)
 
-            while len(buf) < nbytes:
-                try:
-                    tmp = self.socket.recv(nbytes - len(buf))
-                except IOError as err:
-                    raise ConnError(*err.args)
 
-                if not tmp:
-                    if self.verbose:
-                        print('ee', repr(buf))
-                    raise ShortRead(len(buf), nbytes)
+#
+# path parsing
+#
 
-                buf += tmp
+# device id in FDI or FI format, e.g. '28.000028D70000' or '28000028D70000'
+_DEVICE_RE = re.compile(r'^([0-9A-Fa-f]{2})\.?[0-9A-Fa-f]{12}(?=/|$)')
+# index of an aggregate property, e.g. 'PIO.0', 'PIO.A', 'PIO.ALL'
+_INDEX_RE = re.compile(r'\.(\d+|[A-Z]|ALL|BYTE)$')
 
-            assert len(buf) == nbytes, (buf, len(buf), nbytes)
-            return buf
 
-        data = _recv_socket(_FromServerHeader.header_size)
-        header = _FromServerHeader(data)
-        if self.verbose:
-            print('<-', repr(header))
+def _split_device(path):
+    """split path in upper case family code and device property
 
-        # error conditions
-        if header.version != 0:
-            raise MalformedHeader('bad version', header)
-        if header.payload > MAX_PAYLOAD:
-            raise MalformedHeader('huge payload, unwilling to read', header)
+    family is None if path does not contain a device id; e.g.
+    '/bus.0/28.000028d70000/temperature' gives ('28', 'temperature')
+    """
 
-        if header.payload > 0:
-            payload = _recv_socket(header.payload)
-            if self.verbose:
-                print('..', repr(payload))
-            assert header.size <= header.payload
-            payload = payload[:header.size]
-        else:
-            payload = bytes()
-        return header, payload
+    parts = [i for i in path.split('/') if i]
+    for i, part in enumerate(parts):
+        match = _DEVICE_RE.match(part)
+        if match:
+            return match.group(1).upper(), '/'.join(parts[i + 1:])
+    return None, '/'.join(parts)
 
 
 #
 # proxy objects
 #
 
+class _Lockable(object):
+    """base of objects guarded by self._lock, that can be pickled
+
+    the lock is not pickled, a new one is created on unpickling
+    """
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
 class _Proxy(object):
     """Proxy object with methods to query an owserver,
     socket connection is non persistent, stateless, thread-safe
     """
 
+    # class of connection objects, can be overridden per instance
+    # e.g. for recording the owserver traffic
+    _connection_factory = _OwnetConnection
+
+    # owserver cache timeouts (s), see 'learn_cache_timeouts'
+    cache_timeouts = None
+
+    # circuit breaker (breaker.CircuitBreaker), or None
+    breaker = None
+
+    # addresses of equivalent owservers (failover.Failover), or None
+    failover = None
+
+    # adaptive timeouts (timeouts.AdaptiveTimeouts), or None
+    timeouts = None
+
+    # property schema (schema.SchemaCache), or None
+    schema = None
+
+    # largest reply payload accepted, and largest read size
+    max_payload = MAX_PAYLOAD
+
+    # reading cache shared among processes (shmcache.ShmCache), or None
+    read_cache = None
+
+    # hedging policy (hedge.Hedger), or None
+    hedger = None
+
+    # bus routing cache (routing.RoutingCache), or None
+    routing = None
+
+    # optional attributes above, copied by 'clone' if set per instance;
+    # connection state and other per instance attributes are not copied
+    _options = ('_connection_factory', 'cache_timeouts', 'breaker',
+                'failover', 'timeouts', 'schema', 'max_payload', 'read_cache',
+                'hedger', 'routing', )
+
     def __init__(self, family, address, flags=0,
                  verbose=False, errmess=_errtuple(), ):
         if flags & FLG_PERSISTENCE:
             raise ValueError('cannot set FLG_PERSISTENCE')
 
-        # save init args
-        self._family, self._sockaddr = family, address
+        # save init args; (family, sockaddr) is replaced as a whole, so
+        # that concurrent threads never see a mixed address
+        self._endpoint = (family, address)
         self.flags = flags
         self.verbose = verbose
         self.errmess = errmess
+        # path -> time of last uncached read, for 'max_staleness' reads
+        self._uncached_reads = {}
 
     def __str__(self):
         return "owserver at %s" % (self._sockaddr, )
 
+    @property
+    def _family(self):
+        return self._endpoint[0]
+
+    @property
+    def _sockaddr(self):
+        return self._endpoint[1]
+
     def _init_errcodes(self):
-        # fetch errcodes array from owserver
+        # fetch errcodes array from owserver; errmess is replaced as a
+        # whole, so that concurrent threads see either tuple, complete
         try:
             self.errmess = _errtuple(
                 m for m in bytes2str(self.read(PTH_ERRCODES)).split(','))
@@ -551,6 +928,36 @@ class _Proxy(object):
             # failed, leave the default empty errcodes
             pass
 
+    def learn_cache_timeouts(self):
+        """fetch owserver cache timeouts, used by max_staleness reads"""
+
+        self.cache_timeouts = {
+            'volatile': float(bytes2str(self.read(PTH_TIMEOUT_VOLATILE))),
+            'stable': float(bytes2str(self.read(PTH_TIMEOUT_STABLE))),
+        }
+
+    def _cache_timeout(self, path):
+        # upper bound on age of values cached by owserver for path, or None
+
+        if self.cache_timeouts is None:
+            return None
+        if self.schema is not None:
+            info = self.schema.lookup(self, path)
+            if info is not None and info.change == 'v':
+                return self.cache_timeouts['volatile']
+            elif info is not None and info.change == 's':
+                return self.cache_timeouts['stable']
+        return max(self.cache_timeouts.values())
+
+    def _stale(self, path, now, max_staleness):
+        # True if a cached read of path could be older than max_staleness
+
+        timeout = self._cache_timeout(path)
+        if timeout is not None and timeout <= max_staleness:
+            return False
+        last = self._uncached_reads.get(path)
+        return last is None or now - last > max_staleness
+
     def __enter__(self):
         return self
 
@@ -558,7 +965,22 @@ class _Proxy(object):
         pass
 
     def _new_connection(self):
-        return _OwnetConnection(self._sockaddr, self._family, self.verbose)
+        family, sockaddr = self._endpoint
+        adaptive = self.timeouts
+        if adaptive is None:
+            return self._connection_factory(sockaddr, family, self.verbose,
+                                            max_payload=self.max_payload)
+        tic = monotonic()
+        try:
+            conn = self._connection_factory(
+                sockaddr, family, self.verbose,
+                connect_timeout=adaptive.connect_timeout(sockaddr),
+                max_payload=self.max_payload)
+        except ConnError:
+            adaptive.expired_connect(sockaddr)
+            raise
+        adaptive.sample_connect(sockaddr, monotonic() - tic)
+        return conn
 
     def sendmess(self, msgtype, payload, flags=0, size=0, offset=0, timeout=0):
         """ retcode, data = sendmess(msgtype, payload)
@@ -568,12 +990,130 @@ class _Proxy(object):
         flags |= self.flags
         assert not (flags & FLG_PERSISTENCE)
 
+        tohead = _ToServerHeader(payload=len(payload), type=msgtype,
+                                 flags=flags, size=size, offset=offset)
+        return self._sendreq(tohead + payload, timeout)
+
+    def _sendreq(self, msg, timeout=0):
+        # send encoded message, return retcode, data
+
+        routing = self.routing
+        if routing is None:
+            return self._send(msg, timeout)
+        return routing._call(self, msg, timeout)
+
+    def _send(self, msg, timeout=0):
+        # send message, moving to other addresses if failover
+
+        if self.failover is not None:
+            return self._sendreq_failover(msg, timeout)
+        return self._guarded(msg, timeout)
+
+    def _sendreq_failover(self, msg, timeout=0):
+        # send message, moving to next address on connection errors
+
+        addrs = self.failover.addresses()
+        if self._endpoint not in addrs:
+            # address no more valid after re-resolution
+            self._switch_address(addrs[0])
+        for attempt in range(len(addrs)):
+            try:
+                return self._guarded(msg, timeout)
+            except ConnError:
+                if attempt == len(addrs) - 1:
+                    raise
+                try:
+                    i = addrs.index(self._endpoint)
+                except ValueError:
+                    # switched meanwhile by another thread
+                    i = -1
+                self._switch_address(addrs[(i + 1) % len(addrs)])
+
+    def _switch_address(self, addr):
+        # move proxy to addr, a (family, sockaddr) tuple
+
+        self._endpoint = tuple(addr)
+        if self.breaker is not None:
+            self.breaker = self.breaker._moved(*addr)
+
+    def _guarded(self, msg, timeout=0):
+        # send message, guarded by circuit breaker if any
+
+        breaker = self.breaker
+        if breaker is None:
+            return self._timed(msg, timeout)
+        breaker._admit(self)
+        try:
+            res = self._timed(msg, timeout)
+        except ConnError:
+            breaker._record(False)
+            raise
+        breaker._record(True)
+        return res
+
+    def _timed(self, msg, timeout=0):
+        # send message, with adaptive timeout if none given
+
+        adaptive = self.timeouts
+        if adaptive is None:
+            return self._hedged(msg, timeout)
+        key = adaptive.key(self._sockaddr, msg)
+        if not timeout:
+            timeout = adaptive.timeout(key)
+        tic = monotonic()
+        try:
+            res = self._hedged(msg, timeout)
+        except OwnetTimeout:
+            adaptive.expired(key)
+            raise
+        adaptive.sample(key, monotonic() - tic)
+        return res
+
+    def _hedged(self, msg, timeout=0):
+        # send message, with a duplicate request if slow, if hedging
+
+        hedger = self.hedger
+        if hedger is None:
+            return self._transact(msg, timeout)
+        return hedger._call(self, msg, timeout)
+
+    def _transact(self, msg, timeout=0):
+        # send encoded message on a new connection
+
         with self._new_connection() as conn:
-            ret, _, data = conn.req(
-                msgtype, payload, flags, size, offset, timeout)
+            ret, _, data = conn.sendreq(msg, timeout)
 
         return ret, data
 
+    def _stream(self, msg, timeout=0):
+        # send message, yield (retcode, data) of each reply as received,
+        # guarded by circuit breaker if any
+
+        breaker = self.breaker
+        if breaker is not None:
+            breaker._admit(self)
+        try:
+            for reply in self._transact_iter(msg, timeout):
+                yield reply
+        except ConnError:
+            if breaker is not None:
+                breaker._record(False)
+            raise
+        if breaker is not None:
+            breaker._record(True)
+
+    def _transact_iter(self, msg, timeout=0):
+        # send encoded message on a new connection, yield replies
+
+        with self._new_connection() as conn:
+            for ret, _, data in conn.sendreq_iter(msg, timeout):
+                yield ret, data
+
+    def prepare_read(self, path, size=None, offset=0):
+        """return a PreparedRead object for repeated reads of path"""
+
+        return PreparedRead(self, path, size, offset)
+
     def ping(self):
         """sends a NOP packet and waits response; returns None"""
 
@@ -594,8 +1134,12 @@ class _Proxy(object):
         else:
             return True
 
-    def dir(self, path='/', slash=True, bus=False, timeout=0):
-        """list entities at path"""
+    def dir(self, path='/', slash=True, bus=False, timeout=0, lazy=False):
+        """list entities at path
+
+        if lazy is True, a Listing object is returned instead of a list,
+        for large directories.
+        """
 
         if slash:
             msg = MSG_DIRALLSLASH
@@ -609,23 +1153,143 @@ class _Proxy(object):
         ret, data = self.sendmess(msg, str2bytez(path), flags, timeout=timeout)
         if ret < 0:
             raise OwnetError(-ret, self.errmess[-ret], path)
+        if lazy:
+            return Listing(data)
         if data:
             return bytes2str(data).split(',')
         else:
             return []
 
-    def read(self, path, size=MAX_PAYLOAD, offset=0, timeout=0):
-        """read data at path"""
+    def get(self, path='/', slash=True, bus=False, timeout=0):
+        """list entities at path if a directory, else read data at path
 
-        if size > MAX_PAYLOAD:
-            raise ValueError("size cannot exceed %d" % MAX_PAYLOAD)
+        a single request is sent to owserver: return a list of str, as
+        dir(path, slash, bus), for directories, or bytes, as read(path),
+        for other entities.
+        """
+
+        if slash:
+            msg = MSG_GETSLASH
+        else:
+            msg = MSG_GET
+        if bus:
+            flags = self.flags | FLG_BUS_RET
+        else:
+            flags = self.flags & ~FLG_BUS_RET
+
+        ret, data = self.sendmess(msg, str2bytez(path), flags,
+                                  size=self.max_payload, timeout=timeout)
+        if ret < 0:
+            raise OwnetError(-ret, self.errmess[-ret], path)
+        return _get_result(path, ret, data)
+
+    def iterdir(self, path='/', bus=False, timeout=0):
+        """list entities at path, yielding them as soon as received
+
+        entities are listed without trailing slash, as by
+        dir(path, slash=False); timeout applies to the whole listing.
+        """
+
+        if bus:
+            flags = self.flags | FLG_BUS_RET
+        else:
+            flags = self.flags & ~FLG_BUS_RET
+
+        payload = str2bytez(path)
+        tohead = _ToServerHeader(payload=len(payload), type=MSG_DIR,
+                                 flags=flags)
+        stream = self._stream(tohead + payload, timeout)
+        ret = 0
+        try:
+            for ret, data in stream:
+                if ret >= 0 and data:
+                    yield bytes2str(data)
+        finally:
+            # abandoned listings close their connection
+            stream.close()
+        if ret < 0:
+            raise OwnetError(-ret, self.errmess[-ret], path)
+
+    def read(self, path, size=None, offset=0, timeout=0,
+             max_staleness=None):
+        """read data at path
 
-        ret, data = self.sendmess(MSG_READ, str2bytez(path),
+        size defaults to max_payload, the largest size allowed.
+
+        if max_staleness is given, FLG_UNCACHED is set only if a value
+        cached by owserver could be older than max_staleness seconds.
+
+        if the proxy has a schema, the default size is replaced by the
+        size of the property, and reads of directories or write only
+        properties fail without a request to owserver.
+
+        if the proxy has a read_cache, full reads are served from it
+        when a value not older than max_staleness (default: the cache
+        ttl) was saved there, by this or another process.
+        """
+
+        if size is None:
+            size = self.max_payload
+        elif size > self.max_payload:
+            raise ValueError("size cannot exceed %d" % self.max_payload)
+        full = size == self.max_payload and not offset
+
+        cache = self.read_cache
+        if not full or self.flags & FLG_UNCACHED:
+            # partial and uncached reads do not use the cache
+            cache = None
+
+        if self.schema is not None:
+            info = self.schema.lookup(self, path)
+            if info is not None:
+                self._check_readable(info, path)
+                if full and info.size > 0:
+                    size = info.size
+
+        if cache is not None:
+            entry = cache.get(path, self.flags, max_staleness)
+            if entry is not None:
+                return entry.value
+
+        flags = 0
+        if max_staleness is not None:
+            tic = monotonic()
+            if self._stale(path, tic, max_staleness):
+                flags = FLG_UNCACHED
+
+        ret, data = self.sendmess(MSG_READ, str2bytez(path), flags,
                                   size=size, offset=offset, timeout=timeout)
         if ret < 0:
             raise OwnetError(-ret, self.errmess[-ret], path)
+        if flags:
+            # value sampled from bus not before tic
+            self._uncached_reads[path] = tic
+        if cache is not None:
+            cache.put(path, data, self.flags)
         return data
 
+    def read_value(self, path, timeout=0, max_staleness=None):
+        """read data at path, decoded according to the proxy schema
+
+        without a schema, or for properties not in the schema, the
+        undecoded data is returned.
+        """
+
+        schema = self.schema
+        info = None if schema is None else schema.lookup(self, path)
+        data = self.read(path, timeout=timeout, max_staleness=max_staleness)
+        if info is None:
+            return data
+        return info.decode(data)
+
+    def _check_readable(self, info, path):
+        # raise the same error as owserver for unreadable properties
+
+        if info.directory:
+            raise OwnetError(errno.EISDIR, self.errmess[errno.EISDIR], path)
+        if not info.readable:
+            raise OwnetError(errno.EACCES, self.errmess[errno.EACCES], path)
+
     def write(self, path, data, offset=0, timeout=0):
         """write data at path
 
@@ -647,20 +1311,45 @@ class _Proxy(object):
 
 class _PersistentProxy(_Proxy):
     """Proxy object with methods to query an owserver,
-    socket connection is persistent, statefull, not thread-safe
+    socket connection is persistent, statefull, thread-safe
+
+    each request takes an idle connection, or opens a new one, and gives
+    it back when done: concurrent threads never share a connection.
     """
 
+    # idle connections kept for reuse (approximate bound)
+    max_idle = 4
+
     def __init__(self, family, address,
                  flags=0, verbose=False, errmess=_errtuple(), ):
         super(_PersistentProxy, self).__init__(
             family, address, flags, verbose, errmess)
 
-        self.conn = None
+        # stack of idle connections: list append and pop are atomic,
+        # also on free-threaded builds, so no lock is needed
+        self._idle = []
         self.flags |= FLG_PERSISTENCE
 
+    @property
+    def conn(self):
+        """idle connection that will be reused next, or None"""
+
+        try:
+            return self._idle[-1]
+        except IndexError:
+            return None
+
+    @conn.setter
+    def conn(self, conn):
+        # replace all idle connections with conn; None just drops them
+        old, self._idle = self._idle, [] if conn is None else [conn]
+        for i in old:
+            if i is not conn:
+                i.shutdown()
+
     def __enter__(self):
-        if not self.conn:
-            self.conn = self._new_connection()
+        if not self._idle:
+            self._idle.append(self._new_connection())
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -669,12 +1358,20 @@ class _PersistentProxy(_Proxy):
     def __del__(self):
         self.close_connection()
 
+    def __getstate__(self):
+        # a live socket cannot be pickled: only the connection descriptor
+        # is saved, a new connection will be opened on first use
+        state = self.__dict__.copy()
+        state['_idle'] = []
+        return state
+
     def close_connection(self):
-        if self.conn:
-            self.conn.shutdown()
-            self.conn = None
-        else:
-            assert self.conn is None
+        while True:
+            try:
+                conn = self._idle.pop()
+            except IndexError:
+                break
+            conn.shutdown()
 
     def sendmess(self, msgtype, payload, flags=0, size=0, offset=0, timeout=0):
         """
@@ -682,47 +1379,162 @@ class _PersistentProxy(_Proxy):
         send generic message and returns retcode, data
         """
 
-        # reuse last valid connection or create new
-        conn = self.conn or self._new_connection()
-        # invalidate last connection
-        self.conn = None
-
         flags |= self.flags
         assert (flags & FLG_PERSISTENCE)
-        ret, rflags, data = conn.req(
-            msgtype, payload, flags, size, offset, timeout)
-        if rflags & FLG_PERSISTENCE:
-            # persistence granted, save connection object for reuse
-            self.conn = conn
+
+        tohead = _ToServerHeader(payload=len(payload), type=msgtype,
+                                 flags=flags, size=size, offset=offset)
+        return self._sendreq(tohead + payload, timeout)
+
+    def _switch_address(self, addr):
+        self.close_connection()
+        super(_PersistentProxy, self)._switch_address(addr)
+
+    def _checkout(self):
+        # take an idle connection, or open a new one
+
+        try:
+            return self._idle.pop()
+        except IndexError:
+            return self._new_connection()
+
+    def _checkin(self, conn, endpoint):
+        # save conn for reuse, if persistence was granted and the proxy
+        # did not move to another address meanwhile
+
+        keep = conn.reusable and endpoint is self._endpoint
+        if keep and len(self._idle) < self.max_idle:
+            self._idle.append(conn)
         else:
-            # discard connection object
             conn.shutdown()
 
+    def _transact(self, msg, timeout=0):
+        # send encoded message on a persistent connection
+
+        endpoint = self._endpoint
+        conn = self._checkout()
+        ret, _, data = conn.sendreq(msg, timeout)
+        self._checkin(conn, endpoint)
         return ret, data
 
+    def _transact_iter(self, msg, timeout=0):
+        # send encoded message on a persistent connection, yield replies;
+        # other requests, while the replies are consumed, use another one
+
+        endpoint = self._endpoint
+        conn = self._checkout()
+        complete = False
+        try:
+            for ret, _, data in conn.sendreq_iter(msg, timeout):
+                yield ret, data
+            complete = True
+        finally:
+            if complete:
+                self._checkin(conn, endpoint)
+            else:
+                conn.shutdown()
+
+
+class PreparedRead(object):
+    """read request encoded once, for repeated execution
+
+    Objects of this class are returned by the 'prepare_read' method of
+    proxy objects; the flags of the proxy are frozen at creation time.
+    """
+
+    __slots__ = ('proxy', 'path', '_msg', )
+
+    def __init__(self, proxy, path, size=None, offset=0):
+        if size is None:
+            size = proxy.max_payload
+        elif size > proxy.max_payload:
+            raise ValueError("size cannot exceed %d" % proxy.max_payload)
+
+        payload = str2bytez(path)
+        tohead = _ToServerHeader(payload=len(payload), type=MSG_READ,
+                                 flags=proxy.flags, size=size, offset=offset)
+        self.proxy = proxy
+        self.path = path
+        self._msg = bytes(tohead + payload)
+
+    def __repr__(self):
+        return "PreparedRead(%r) on %s" % (self.path, self.proxy)
+
+    def read(self, timeout=0):
+        """read data at path"""
+
+        ret, data = self.proxy._sendreq(self._msg, timeout)
+        if ret < 0:
+            raise OwnetError(-ret, self.proxy.errmess[-ret], self.path)
+        return data
+
 
 #
 # factory functions
 #
 
 def proxy(host='localhost', port=4304, flags=0, persistent=False,
-          verbose=False, ):
+          verbose=False, breaker=None, failover=False, alternates=(),
+          ttl=60.0, timeouts=None, schema=None, max_payload=MAX_PAYLOAD,
+          errmess=None, ):
     """factory function that returns a proxy object for an owserver at
     host, port.
+
+    if breaker is True, requests are guarded by the circuit breaker
+    shared by all proxies of the same endpoint, see
+    'breaker.circuit_breaker'; a CircuitBreaker object can also be given.
+
+    host names are resolved by 'failover.resolve', whose results are
+    cached for ttl seconds. If failover is True, or alternates, a list
+    of (host, port) tuples of equivalent owservers, is given, the proxy
+    keeps all their addresses and moves to the next one on connection
+    errors; names are resolved again every ttl seconds.
+
+    if timeouts is True, calls without an explicit timeout get adaptive
+    timeouts from the AdaptiveTimeouts object shared by all proxies, see
+    'timeouts.adaptive_timeouts'; an AdaptiveTimeouts object can also be
+    given.
+
+    if schema is True, property sizes and types are looked up in the
+    SchemaCache object shared by all proxies, see 'schema.schema_cache';
+    a SchemaCache object can also be given.
+
+    max_payload is the largest reply payload accepted by the proxy, and
+    the largest size of reads.
+
+    if errmess, the list of owserver error messages, is given, it is not
+    read from owserver.
     """
 
-    # resolve host name/port
-    try:
-        gai = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM,
-                                 socket.IPPROTO_TCP)
-    except socket.gaierror as err:
-        raise ConnError(*err.args)
-
-    # gai is a (non empty) list of tuples, search for the first working one
-    assert gai
-    for (family, _type, _proto, _, sockaddr) in gai:
-        assert _type is socket.SOCK_STREAM and _proto is socket.IPPROTO_TCP
+    from .failover import Failover, resolve
+
+    if failover or alternates:
+        failover = Failover([(host, port)] + list(alternates), ttl)
+        addrs = failover.addresses()
+    else:
+        failover = None
+        # resolve host name/port, through the shared cache
+        addrs = resolve(host, port, ttl)
+
+    if breaker is True:
+        from .breaker import circuit_breaker
+    if timeouts is True:
+        from .timeouts import adaptive_timeouts
+
+    # addrs is a (non empty) list of tuples, search for the first working one
+    assert addrs
+    for (family, sockaddr) in addrs:
         owp = _Proxy(family, sockaddr, flags, verbose)
+        if breaker is True:
+            owp.breaker = circuit_breaker(family, sockaddr)
+        elif breaker:
+            owp.breaker = breaker
+        if timeouts is True:
+            owp.timeouts = adaptive_timeouts()
+        elif timeouts:
+            owp.timeouts = timeouts
+        if max_payload != MAX_PAYLOAD:
+            owp.max_payload = max_payload
         try:
             # check if there is an owserver listening
             owp.ping()
@@ -737,9 +1549,20 @@ def proxy(host='localhost', port=4304, flags=0, persistent=False,
         # no server listening on (family, sockaddr) found:
         raise ConnError(*lasterr)
 
+    if failover is not None:
+        owp.failover = failover
+
+    if schema is True:
+        from .schema import schema_cache
+        owp.schema = schema_cache()
+    elif schema:
+        owp.schema = schema
+
     # init errno to errmessage mapping
-    # FIXME: should this be only optional?
-    owp._init_errcodes()
+    if errmess is None:
+        owp._init_errcodes()
+    else:
+        owp.errmess = _errtuple(errmess)
 
     if persistent:
         owp = clone(owp, persistent=True)
@@ -761,5 +1584,26 @@ def clone(proxy, persistent=True):
     else:
         pclass = _Proxy
 
-    return pclass(proxy._family, proxy._sockaddr,
-                  proxy.flags & ~FLG_PERSISTENCE, proxy.verbose, proxy.errmess)
+    owp = pclass(proxy._family, proxy._sockaddr,
+                 proxy.flags & ~FLG_PERSISTENCE, proxy.verbose, proxy.errmess)
+    _copy_options(proxy, owp)
+    return owp
+
+
+def _copy_options(proxy, owp):
+    # copy optional attributes, not set by the constructor
+
+    attrs = vars(proxy)
+    for key in _Proxy._options:
+        if key in attrs:
+            setattr(owp, key, attrs[key])
+
+
+def _wrap(proxy, **options):
+    # clone of proxy, of the same kind, with options set; used by the
+    # 'wrap' methods of caches, recorders and policies
+
+    owp = clone(proxy, persistent=isinstance(proxy, _PersistentProxy))
+    for key, val in options.items():
+        setattr(owp, key, val)
+    return owp
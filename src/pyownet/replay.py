@@ -0,0 +1,277 @@
+"""record and replay of owserver traffic
+
+A :class:`Recorder` captures all the messages exchanged by proxy
+objects with an owserver: each request and each chunk of data received
+(keepalive frames included) is saved to a compact binary file, together
+with its timing. A :class:`Replayer` serves the recorded replies back,
+with the original or scaled timing, to proxy objects not connected to
+any server. Client side changes can therefore be profiled offline and
+deterministically against real traffic patterns.
+
+>>> from pyownet import protocol, replay
+>>> with replay.Recorder('capture.owr') as rec:
+...     owproxy = rec.wrap(protocol.proxy('owserver.example.com'))
+...     owproxy.read('/28.000028D70000/temperature')
+'           4'
+>>> owproxy = replay.Replayer('capture.owr', scale=0).proxy()
+>>> owproxy.read('/28.000028D70000/temperature')
+'           4'
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import ast
+import time
+import struct
+import socket
+import threading
+import functools
+import collections
+
+from . import protocol
+from .protocol import monotonic
+
+# file format: magic, then a sequence of records, each made of
+# a fixed size header (time, kind, connection id, data length) and data
+_MAGIC = b'OWREC\x00\x00\x01'
+_RECORD = struct.Struct('<dBII')
+
+# record kinds
+_OPEN = 0       # data: family, connect time, repr of sockaddr
+_SEND = 1       # data: message sent to server
+_RECV = 2       # data: bytes received from server
+_CLOSE = 3      # no data
+
+_OPENDATA = struct.Struct('<id')
+
+
+class Recorder(object):
+    """Record owserver traffic to file ``filename``
+
+    Recorder objects are thread-safe: proxy objects wrapped by the same
+    recorder may be used concurrently.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'wb')
+        self._file.write(_MAGIC)
+        self._lock = threading.Lock()
+        self._ids = 0
+        self._tstart = monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """close capture file"""
+
+        with self._lock:
+            self._file.close()
+
+    def wrap(self, owproxy):
+        """return a clone of owproxy, whose traffic is recorded"""
+
+        return protocol._wrap(owproxy, _connection_factory=functools.partial(
+            _RecordingConnection, self))
+
+    def _new_id(self):
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    def _write(self, kind, connid, data=b''):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(_RECORD.pack(monotonic() - self._tstart, kind,
+                                          connid, len(data)))
+            self._file.write(data)
+
+
+class _RecordingConnection(protocol._OwnetConnection):
+    """connection object that records the traffic"""
+
+    def __init__(self, recorder, sockaddr, family=socket.AF_INET,
+                 verbose=False, connect_timeout=protocol._SCK_TIMEOUT,
+                 max_payload=protocol.MAX_PAYLOAD):
+        self._recorder = recorder
+        self._id = recorder._new_id()
+        tic = monotonic()
+        super(_RecordingConnection, self).__init__(sockaddr, family, verbose,
+                                                   connect_timeout,
+                                                   max_payload)
+        recorder._write(_OPEN, self._id, _OPENDATA.pack(
+            family, monotonic() - tic) + repr(sockaddr).encode('ascii'))
+
+    def shutdown(self):
+        self._recorder._write(_CLOSE, self._id)
+        super(_RecordingConnection, self).shutdown()
+
+    def _send_msg(self, msg):
+        self._recorder._write(_SEND, self._id, msg)
+        super(_RecordingConnection, self)._send_msg(msg)
+
+    def _recv_data(self):
+        pos = len(self._proto._buf)
+        super(_RecordingConnection, self)._recv_data()
+        # the sans-I/O core buffer is compacted only when fully consumed,
+        # so that received data is found at its end
+        self._recorder._write(_RECV, self._id, bytes(self._proto._buf[pos:]))
+
+
+#
+# replay
+#
+
+_Session = collections.namedtuple('_Session', 'family sockaddr connect steps')
+
+
+class Replayer(object):
+    """Replay owserver traffic recorded in file ``filename``
+
+    Each connection opened by a replay proxy is served by the next
+    recorded connection, in order of opening. Delays between a request
+    and the reply data are multiplied by ``scale``: 1 reproduces the
+    original timing, 0 serves replies as fast as possible. If ``strict``
+    requests have to match the recorded ones, otherwise a
+    :exc:`protocol.ProtocolError` is raised.
+    """
+
+    def __init__(self, filename, scale=1.0, strict=True):
+        self.filename = filename
+        self.scale = scale
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._sessions = collections.deque(_load(filename))
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def proxy(self, persistent=False, flags=0):
+        """return a proxy object served by this replayer"""
+
+        if self._sessions:
+            family, sockaddr = (self._sessions[0].family,
+                                self._sessions[0].sockaddr)
+        else:
+            family, sockaddr = socket.AF_INET, ('replay', 0)
+        owp = protocol._Proxy(family, sockaddr, flags)
+        if persistent:
+            owp = protocol.clone(owp, persistent=True)
+        owp._connection_factory = functools.partial(_ReplayConnection, self)
+        return owp
+
+    def _next_session(self):
+        with self._lock:
+            try:
+                return self._sessions.popleft()
+            except IndexError:
+                raise protocol.ConnError('replay: no more recorded '
+                                         'connections')
+
+
+def _load(filename):
+    # load recorded sessions, in order of opening
+
+    with open(filename, 'rb') as fil:
+        if fil.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError('%s: not a capture file' % filename)
+        sessions = collections.OrderedDict()
+        while True:
+            head = fil.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                break
+            tstamp, kind, connid, size = _RECORD.unpack(head)
+            data = fil.read(size)
+            if kind == _OPEN:
+                family, connect = _OPENDATA.unpack_from(data)
+                sockaddr = _parse_sockaddr(data[_OPENDATA.size:])
+                sessions[connid] = _Session(family, sockaddr, connect, [])
+            elif connid in sessions:
+                sessions[connid].steps.append((tstamp, kind, data))
+    return sessions.values()
+
+
+def _parse_sockaddr(data):
+    # sockaddr is saved as repr of a tuple of str and int
+
+    try:
+        return ast.literal_eval(data.decode('ascii'))
+    except (ValueError, SyntaxError):
+        return ('replay', 0)
+
+
+class _ReplayConnection(protocol._OwnetConnection):
+    """connection object served by recorded traffic"""
+
+    def __init__(self, replayer, sockaddr, family=socket.AF_INET,
+                 verbose=False, connect_timeout=protocol._SCK_TIMEOUT,
+                 max_payload=protocol.MAX_PAYLOAD):
+        self.verbose = verbose
+        self.peername = sockaddr
+        self.socket = None
+        self._proto = protocol.ClientProtocol(max_payload)
+        self._replayer = replayer
+        self._session = replayer._next_session()
+        self._steps = collections.deque(self._session.steps)
+        self._tsend = None
+        self._trec = None
+        _sleep(self._session.connect * replayer.scale)
+
+    def __del__(self):
+        pass
+
+    def __str__(self):
+        return "_ReplayConnection -> {0}".format(self.peername)
+
+    def shutdown(self):
+        pass
+
+    def _send_msg(self, msg):
+        # find next recorded request
+        while self._steps and self._steps[0][1] != _SEND:
+            self._steps.popleft()
+        if not self._steps:
+            raise protocol.ConnError('replay: no more recorded requests')
+        tstamp, _, recorded = self._steps.popleft()
+        if self._replayer.strict and recorded != msg:
+            raise protocol.ProtocolError(
+                'replay: request {0!r} does not match recorded {1!r}'.format(
+                    msg, recorded))
+        self._tsend = monotonic()
+        self._trec = tstamp
+
+    def _recv_data(self):
+        if not self._steps or self._steps[0][1] != _RECV:
+            # recording ended here, as if server closed connection
+            self._proto.receive_data(b'')
+            return
+        tstamp, _, data = self._steps.popleft()
+        due = self._tsend + (tstamp - self._trec) * self._replayer.scale
+        _sleep(due - monotonic())
+        self._proto.receive_data(data)
+
+
+def _sleep(delay):
+    if delay > 0:
+        time.sleep(delay)
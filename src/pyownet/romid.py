@@ -0,0 +1,254 @@
+"""compact index of 1-wire ROM ids
+
+Each 1-wire device is identified by a 64 bit ROM id: family code, 48 bit
+serial number and CRC-8. This module packs the device names returned by
+:meth:`dir` into integers, ``family << 56 | serial << 8 | crc``, and
+keeps them in a :class:`RomIndex`, a sorted :class:`array.array` of 8
+bytes per device: membership tests and family selections are binary
+searches, and names are rebuilt in any ``FLG_FORMAT_*`` format only when
+needed.
+
+>>> from pyownet import protocol, romid
+>>> owproxy = protocol.proxy(host="owserver.example.com", port=4304)
+>>> index = romid.RomIndex.from_dir(owproxy.dir())
+>>> '/28.000028D70000/' in index
+True
+>>> [romid.to_name(i) for i in index.family(0x28)]
+['28.000028D70000']
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import re
+import array
+import bisect
+import numbers
+
+from . import protocol
+
+# array type code of unsigned 64 bit integers ('Q' not in python 2)
+for _TYPECODE in ('Q', 'L'):
+    try:
+        if array.array(_TYPECODE).itemsize == 8:
+            break
+    except ValueError:
+        pass
+else:
+    raise ImportError('no 64 bit unsigned array type')
+
+# device name, in any FLG_FORMAT_* format
+_NAME_RE = re.compile(
+    r'^([0-9A-Fa-f]{2})\.?([0-9A-Fa-f]{12})(?:\.?([0-9A-Fa-f]{2}))?$')
+
+# format strings of family, serial and crc, by FLG_FORMAT_* flag
+_FORMATS = {
+    protocol.FLG_FORMAT_FDI: '{0:02X}.{1:012X}',
+    protocol.FLG_FORMAT_FI: '{0:02X}{1:012X}',
+    protocol.FLG_FORMAT_FDIDC: '{0:02X}.{1:012X}.{2:02X}',
+    protocol.FLG_FORMAT_FDIC: '{0:02X}.{1:012X}{2:02X}',
+    protocol.FLG_FORMAT_FIDC: '{0:02X}{1:012X}.{2:02X}',
+    protocol.FLG_FORMAT_FIC: '{0:02X}{1:012X}{2:02X}',
+}
+
+
+def _crc8_table():
+    # Dallas/Maxim CRC-8, polynomial x^8 + x^5 + x^4 + 1, reflected
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x8C if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC8 = _crc8_table()
+
+
+def crc8(data):
+    """Dallas/Maxim CRC-8 of data (bytes)"""
+
+    crc = 0
+    for byte in bytearray(data):
+        crc = _CRC8[crc ^ byte]
+    return crc
+
+
+def _serial_crc(family, serial):
+    # crc of family code and serial, in order of display
+    return crc8(bytearray([family]) + bytearray.fromhex(
+        '{0:012X}'.format(serial)))
+
+
+def _parse(name):
+    # return ROM id of name, None if name is not a device name
+
+    match = _NAME_RE.match(name)
+    if match is None:
+        return None
+    family = int(match.group(1), 16)
+    serial = int(match.group(2), 16)
+    crc = _serial_crc(family, serial)
+    if match.group(3) is not None and int(match.group(3), 16) != crc:
+        raise ValueError('CRC error in device name {0!r}'.format(name))
+    return family << 56 | serial << 8 | crc
+
+
+def parse(path):
+    """return the ROM id of the device at path, e.g. '/28.000028D70000/'
+
+    the device name is the last component of path, in any FLG_FORMAT_*
+    format; if a CRC is given it is checked.
+    """
+
+    name = path.rstrip('/').rpartition('/')[2]
+    romid = _parse(name)
+    if romid is None:
+        raise ValueError('not a device name: {0!r}'.format(path))
+    return romid
+
+
+def split(romid):
+    """return (family, serial, crc) of romid"""
+
+    return romid >> 56, romid >> 8 & 0xFFFFFFFFFFFF, romid & 0xFF
+
+
+def to_name(romid, flags=protocol.FLG_FORMAT_FDI):
+    """return the device name of romid, in the format of flags"""
+
+    return _FORMATS[flags & protocol.MSK_DEVFORMAT].format(*split(romid))
+
+
+class RomIndex(object):
+    """Sorted set of ROM ids, 8 bytes per device
+
+    RomIndex objects are immutable: set operations return new objects.
+    Membership can be tested for ROM ids or device paths.
+    """
+
+    __slots__ = ('_ids', )
+
+    def __init__(self, romids=()):
+        self._ids = array.array(_TYPECODE, sorted(set(romids)))
+
+    @classmethod
+    def from_dir(cls, entries, errors=None):
+        """return index of the devices in a dir() listing
+
+        entries which are not devices (e.g. '/bus.0/') are skipped;
+        device names with a wrong CRC are skipped, and (path, exception)
+        appended to errors, if given.
+        """
+
+        romids = []
+        for path in entries:
+            try:
+                romid = _parse(path.rstrip('/').rpartition('/')[2])
+            except ValueError as exc:
+                if errors is not None:
+                    errors.append((path, exc))
+                continue
+            if romid is not None:
+                romids.append(romid)
+        return cls(romids)
+
+    @classmethod
+    def _from_sorted(cls, ids):
+        index = cls.__new__(cls)
+        index._ids = ids
+        return index
+
+    def __repr__(self):
+        return 'RomIndex([{0}])'.format(', '.join(
+            repr(to_name(i)) for i in self._ids))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __eq__(self, other):
+        if not isinstance(other, RomIndex):
+            return NotImplemented
+        return self._ids == other._ids
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+
+    __hash__ = None
+
+    def __contains__(self, item):
+        if not isinstance(item, numbers.Integral):
+            try:
+                item = parse(item)
+            except (ValueError, AttributeError):
+                return False
+        i = bisect.bisect_left(self._ids, item)
+        return i < len(self._ids) and self._ids[i] == item
+
+    def family(self, code):
+        """return index of the devices of family code, e.g. 0x28"""
+
+        lo = bisect.bisect_left(self._ids, code << 56)
+        hi = bisect.bisect_left(self._ids, (code + 1) << 56)
+        return self._from_sorted(self._ids[lo:hi])
+
+    def families(self):
+        """return {family code: number of devices}"""
+
+        res = {}
+        for romid in self._ids:
+            code = romid >> 56
+            res[code] = res.get(code, 0) + 1
+        return res
+
+    def difference(self, other):
+        """devices in this index but not in other"""
+
+        exclude = set(other)
+        return self._from_sorted(array.array(
+            _TYPECODE, (i for i in self._ids if i not in exclude)))
+
+    def intersection(self, other):
+        """devices in both indexes"""
+
+        include = set(other)
+        return self._from_sorted(array.array(
+            _TYPECODE, (i for i in self._ids if i in include)))
+
+    def union(self, other):
+        """devices in any of the indexes"""
+
+        return RomIndex(list(self._ids) + list(other))
+
+    __sub__ = difference
+    __and__ = intersection
+    __or__ = union
+
+    def paths(self, flags=protocol.FLG_FORMAT_FDI, slash=True):
+        """yield device paths, as returned by dir(), in format of flags"""
+
+        fmt = '/' + _FORMATS[flags & protocol.MSK_DEVFORMAT]
+        if slash:
+            fmt += '/'
+        for romid in self._ids:
+            yield fmt.format(*split(romid))
@@ -0,0 +1,250 @@
+"""bus routing cache, to spare owserver device searches
+
+A request for a path like ``/28.000028D70000/temperature`` does not say
+on which bus the device is, so owserver has to look for it; on systems
+with many buses (e.g. several DS2482 channels) the search is expensive.
+A :class:`RoutingCache` learns the bus of each device from a bus-aware
+listing (``dir(bus=True)``, i.e. ``FLG_BUS_RET``) and rewrites reads,
+writes and presence checks of the proxy objects it wraps to the
+``/bus.N/28.000028D70000/temperature`` form. If a request fails on the
+learned bus but succeeds without routing, the device has moved: its
+entry is dropped, and it stays unrouted until learned again.
+
+>>> from pyownet import protocol, routing
+>>> owproxy = protocol.proxy(host="owserver.example.com", port=4304)
+>>> routes = routing.RoutingCache()
+>>> routes.learn(owproxy)
+2
+>>> routes.route('/28.000028D70000/temperature')
+'/bus.0/28.000028D70000/temperature'
+>>> owproxy = routes.wrap(owproxy)
+>>> owproxy.read('/28.000028D70000/temperature')
+b'           4'
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import errno
+import threading
+
+from . import protocol
+from .protocol import monotonic
+
+# message types addressing a single entity, whose path can be routed;
+# listings are not routed, since the returned paths would change
+ROUTABLE = frozenset((
+    protocol.MSG_READ, protocol.MSG_WRITE, protocol.MSG_PRESENCE, ))
+
+# errors of a routed request meaning that the device is not on the
+# learned bus; other errors are not retried, e.g. a failed write could
+# have been performed anyway
+NOT_ON_BUS = frozenset((errno.ENOENT, errno.ENODEV, ))
+
+_HEADER = protocol._ToServerHeader
+
+
+class RoutingCache(protocol._Lockable):
+    """Bus of each device of an owserver, learned from bus listings
+
+    Every ``probe`` routed reads, one is sent unrouted, to keep track of
+    the latency saved by routing; ``probe=0`` disables probing.
+
+    RoutingCache objects are thread-safe; a routing cache should be
+    shared only among proxies of the same owserver.
+    """
+
+    def __init__(self, probe=64):
+        self.probe = probe
+        # device name -> bus path, e.g. '/bus.0'; replaced as a whole,
+        # so that lookups need no lock
+        self._routes = {}
+        self._lock = threading.Lock()
+        self._counts = dict(routed=0, unrouted=0, fallbacks=0,
+                            invalidated=0)
+        self._reads = 0
+        # read latencies: [total seconds, number of reads]
+        self._latency = dict(routed=[0.0, 0], unrouted=[0.0, 0])
+
+    def __len__(self):
+        return len(self._routes)
+
+    def wrap(self, owproxy):
+        """return a clone of owproxy, whose requests are routed"""
+
+        return protocol._wrap(owproxy, routing=self)
+
+    def learn(self, owproxy, timeout=0):
+        """list all buses of owproxy, replacing the known routes
+
+        returns the number of devices found.
+        """
+
+        routes = {}
+        for entry in owproxy.dir('/', bus=True, timeout=timeout):
+            if entry.strip('/').startswith('bus.'):
+                routes.update(self._parse(
+                    owproxy.dir(entry, bus=True, timeout=timeout)))
+        self._routes = routes
+        return len(routes)
+
+    def update(self, entries):
+        """learn routes from entries of a bus-aware listing
+
+        e.g. ``['/bus.0/28.000028D70000/', ...]``; entries other than
+        devices directly on a bus are ignored.
+        """
+
+        found = list(self._parse(entries))
+        with self._lock:
+            routes = dict(self._routes)
+            routes.update(found)
+            self._routes = routes
+
+    def invalidate(self, device):
+        """forget the bus of device"""
+
+        with self._lock:
+            if device in self._routes:
+                routes = dict(self._routes)
+                del routes[device]
+                self._routes = routes
+                self._counts['invalidated'] += 1
+
+    def bus(self, device):
+        """return the bus path of device, e.g. '/bus.0', or None"""
+
+        return self._routes.get(device)
+
+    def route(self, path):
+        """return path rewritten to the bus of its device, or None
+
+        ``/uncached/`` paths are routed to ``/uncached/bus.N/``.
+        """
+
+        prefix, device, rest = _split(path)
+        bus = self._routes.get(device)
+        if bus is None:
+            return None
+        return prefix + bus + '/' + device + rest
+
+    def metrics(self):
+        """return counts of routed requests, and the latency saving
+
+        'unrouted' counts requests for devices with no known bus, and
+        probes; 'fallbacks' are routed requests that failed and were
+        resent unrouted. 'routed_latency' and 'unrouted_latency' are the
+        mean read latencies (seconds), and 'saving' their difference,
+        None until both are known.
+        """
+
+        with self._lock:
+            res = dict(self._counts)
+            means = dict((k, t / n if n else None)
+                         for k, (t, n) in self._latency.items())
+        res['devices'] = len(self._routes)
+        res['routed_latency'] = means['routed']
+        res['unrouted_latency'] = means['unrouted']
+        if None in means.values():
+            res['saving'] = None
+        else:
+            res['saving'] = means['unrouted'] - means['routed']
+        return res
+
+    @staticmethod
+    def _parse(entries):
+        # yield (device, bus) of '/bus.N/device' entries
+
+        for entry in entries:
+            parts = entry.strip('/').split('/')
+            if len(parts) != 2 or not parts[0].startswith('bus.'):
+                continue
+            if protocol._DEVICE_RE.match(parts[1]):
+                yield parts[1], '/' + parts[0]
+
+    def _sample(self, key, latency):
+        with self._lock:
+            acc = self._latency[key]
+            acc[0] += latency
+            acc[1] += 1
+
+    def _call(self, owproxy, msg, timeout=0):
+        # send encoded message via owproxy._send, routed if possible
+
+        header = _HEADER(msg[:_HEADER.header_size])
+        if header.type not in ROUTABLE:
+            return owproxy._send(msg, timeout)
+        payload = msg[_HEADER.header_size:]
+        end = payload.find(b'\x00')
+        path = protocol.bytes2str(payload[:end])
+        device = _split(path)[1]
+        if device is None:
+            return owproxy._send(msg, timeout)
+        routed = self.route(path)
+        timed = header.type == protocol.MSG_READ
+
+        with self._lock:
+            if routed is not None and timed and self.probe:
+                self._reads += 1
+                if self._reads % self.probe == 0:
+                    # probe, to measure the unrouted latency
+                    routed = None
+            self._counts['unrouted' if routed is None else 'routed'] += 1
+
+        if routed is None:
+            tic = monotonic()
+            ret, data = owproxy._send(msg, timeout)
+            if timed and ret >= 0:
+                self._sample('unrouted', monotonic() - tic)
+            return ret, data
+
+        rpayload = protocol.str2bytez(routed) + payload[end + 1:]
+        rmsg = _HEADER(payload=len(rpayload), type=header.type,
+                       flags=header.flags, size=header.size,
+                       offset=header.offset) + rpayload
+        tic = monotonic()
+        ret, data = owproxy._send(rmsg, timeout)
+        if ret >= 0:
+            if timed:
+                self._sample('routed', monotonic() - tic)
+            return ret, data
+        if -ret not in NOT_ON_BUS:
+            return ret, data
+
+        # not found on the learned bus: retry unrouted; if this succeeds
+        # the device has moved, otherwise the error is not due to routing
+        with self._lock:
+            self._counts['fallbacks'] += 1
+        ret, data = owproxy._send(msg, timeout)
+        if ret >= 0:
+            self.invalidate(device)
+        return ret, data
+
+
+def _split(path):
+    # split '/[uncached/]device/rest' in ('[/uncached]', 'device', '/rest');
+    # device is None if path does not start with a device name
+
+    prefix = ''
+    if path.startswith('/uncached/'):
+        prefix, path = '/uncached', path[len('/uncached'):]
+    parts = path.split('/', 2)
+    if len(parts) < 2 or parts[0] or not protocol._DEVICE_RE.match(parts[1]):
+        return prefix, None, ''
+    rest = '/' + parts[2] if len(parts) > 2 else ''
+    return prefix, parts[1], rest
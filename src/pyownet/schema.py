@@ -0,0 +1,214 @@
+"""property schema of device families, from owserver /structure
+
+owserver describes the properties of each device family in the
+``/structure`` directory: e.g. ``/structure/28/temperature`` reads
+``t,000000,000001,ro,000012,v,``, a read only temperature formatted on
+12 characters and cached as a volatile value. A :class:`SchemaCache`,
+assigned to the ``schema`` attribute of a proxy object, loads these
+descriptions once per family: reads then use the exact property size,
+fail at once for unreadable properties, and values can be decoded to
+the right python type.
+
+>>> from pyownet import protocol, schema
+>>> owproxy = protocol.proxy(host="owserver.example.com", schema=True)
+>>> owproxy.schema.lookup(owproxy, '/28.000028D70000/temperature')
+PropertyInfo(type='t', index=0, elements=1, access='ro', size=12, change='v')
+>>> owproxy.read_value('/28.000028D70000/temperature')
+4.0
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import threading
+import collections
+
+from . import protocol
+
+
+_PropertyInfo = collections.namedtuple(
+    '_PropertyInfo', 'type index elements access size change')
+
+
+class PropertyInfo(_PropertyInfo):
+    """description of a device property, from owserver '/structure'
+
+    e.g. 't,000000,000001,ro,000012,v,' is a read only temperature,
+    formatted on 12 chars, volatile; 'D' is the type of directories.
+    """
+
+    __slots__ = ()
+
+    # types decoded as numbers
+    _FLOATS = frozenset('fgpt')
+    _INTS = frozenset('iu')
+
+    @classmethod
+    def parse(cls, data):
+        """parse a '/structure' entry"""
+
+        fields = protocol.bytes2str(data).split(',')
+        try:
+            return cls(fields[0], int(fields[1]), int(fields[2]), fields[3],
+                       int(fields[4]), fields[5])
+        except (IndexError, ValueError):
+            raise protocol.ProtocolError(
+                'invalid structure entry %r' % (data, ))
+
+    @property
+    def directory(self):
+        return self.type == 'D'
+
+    @property
+    def readable(self):
+        return not self.directory and self.access in ('ro', 'rw')
+
+    @property
+    def writable(self):
+        return not self.directory and self.access in ('wo', 'rw')
+
+    def decode(self, data):
+        """decode data read from owserver to a python value
+
+        numbers are returned as float or int, yes/no values as bool,
+        ascii values as str and binary or unknown values as bytes;
+        aggregate ('.ALL') values as a list.
+        """
+
+        if self.type == 'b' or self.type not in (
+                self._FLOATS | self._INTS | frozenset('ay')):
+            return data
+        if self.index < 0:
+            values = protocol.bytes2str(data).split(',')
+            return [self._decode(i) for i in values]
+        return self._decode(protocol.bytes2str(data))
+
+    def _decode(self, value):
+        if self.type in self._FLOATS:
+            return float(value)
+        elif self.type in self._INTS:
+            return int(value)
+        elif self.type == 'y':
+            return bool(int(value))
+        return value
+
+
+class SchemaCache(protocol._Lockable):
+    """Property descriptions, loaded from owserver '/structure'
+
+    Properties of a family are loaded all together, on first lookup of
+    a path of that family; loaded families are kept for the lifetime of
+    the cache. A schema cache should be shared only among proxies of
+    owservers of the same version.
+    """
+
+    def __init__(self):
+        # family -> {property: PropertyInfo}
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        if self is _shared_schema:
+            return (schema_cache, ())
+        return super(SchemaCache, self).__reduce__()
+
+    def clear(self):
+        """forget all loaded families"""
+
+        with self._lock:
+            self._families.clear()
+
+    def families(self):
+        """return a {family: {property: PropertyInfo}} dict of loaded
+        families"""
+
+        with self._lock:
+            return dict(self._families)
+
+    def update(self, families):
+        """add families, a {family: {property: PropertyInfo}} dict, e.g.
+        saved by families(), without reading them from owserver"""
+
+        with self._lock:
+            self._families.update(families)
+
+    def family(self, owproxy, family):
+        """return the {property: PropertyInfo} dict of family
+
+        if not yet loaded, it is read via owproxy.
+        """
+
+        with self._lock:
+            props = self._families.get(family)
+        if props is None:
+            # concurrent loads of the same family are harmless
+            props = self._load(owproxy, family)
+            with self._lock:
+                props = self._families.setdefault(family, props)
+        return props
+
+    def lookup(self, owproxy, path):
+        """return the PropertyInfo of path, or None if unknown"""
+
+        family, prop = protocol._split_device(path)
+        if family is None or not prop:
+            return None
+        props = self.family(owproxy, family)
+        info = props.get(prop)
+        if info is None:
+            # aggregate elements are not always listed one by one
+            base = protocol._INDEX_RE.sub('', prop)
+            if base != prop:
+                info = next((v for k, v in props.items()
+                             if protocol._INDEX_RE.sub('', k) == base), None)
+                if info is not None and prop.endswith('.ALL'):
+                    info = info._replace(
+                        index=-1, size=info.elements * (info.size + 1) - 1)
+        return info
+
+    @staticmethod
+    def _load(owproxy, family):
+        # read all '/structure' entries of family
+
+        props = {}
+        root = '{0}/{1}/'.format(protocol.PTH_STRUCTURE, family)
+        dirs = ['']
+        try:
+            while dirs:
+                sub = dirs.pop()
+                for entry in owproxy.dir(root + sub):
+                    name = entry[len(root):]
+                    if name.endswith('/'):
+                        dirs.append(name)
+                        props[name.rstrip('/')] = PropertyInfo(
+                            'D', 0, 1, 'ro', 0, 'f')
+                    else:
+                        props[name] = PropertyInfo.parse(owproxy.read(entry))
+        except protocol.OwnetError:
+            # family or structure not known to owserver
+            pass
+        return props
+
+
+_shared_schema = SchemaCache()
+
+
+def schema_cache():
+    """return the SchemaCache object shared by all proxies"""
+
+    return _shared_schema
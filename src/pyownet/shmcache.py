@@ -0,0 +1,413 @@
+"""reading cache shared by processes on the same host
+
+Several processes (e.g. the workers of a web application) reading the
+same sensors each load the 1-wire bus with the same requests. A
+:class:`ShmCache` is a fixed size hash table of ``path -> (value,
+timestamp, flags)`` in a memory mapped file, e.g. in ``/dev/shm``,
+shared by all processes opening it: a proxy object wrapped by the cache
+looks up the table before reading from owserver, with no inter process
+communication on a hit. A :class:`Refresher` thread in each process
+competes for leadership: only the leader re-reads cached paths, keeping
+them fresh for all.
+
+>>> from pyownet import protocol, shmcache
+>>> cache = shmcache.ShmCache('/dev/shm/pyownet.cache', ttl=10)
+>>> owproxy = cache.wrap(protocol.proxy(host="owserver.example.com"))
+>>> refresher = shmcache.Refresher(cache, owproxy)
+>>> refresher.start()
+>>> owproxy.read('/28.000028D70000/temperature')
+'           4'
+
+The module requires :mod:`fcntl`, i.e. a POSIX platform.
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import mmap
+import time
+import zlib
+import errno
+import fcntl
+import struct
+import threading
+import collections
+
+from . import protocol
+from .protocol import str2bytez
+
+# file header: magic, number of slots, max path and value length
+_HEADER = struct.Struct('<8sIII')
+_MAGIC = b'OWSHMC\x00\x01'
+_DATA_OFFSET = 64
+
+# slot: sequence number, path hash, timestamp, flags, path and value length;
+# followed by path and value bytes
+_SLOT = struct.Struct('<IIdIHH')
+_SEQ = struct.Struct('<I')
+
+# slots examined for each path, before evicting the oldest one
+_PROBES = 16
+
+# seqlock read attempts, before giving up as a miss
+_RETRIES = 8
+
+# request flags that change the value read, part of the cache key
+KEY_FLAGS = protocol.MSK_TEMPSCALE | protocol.MSK_PRESSURESCALE
+KEY_FLAGS |= protocol.MSK_DEVFORMAT | protocol.FLG_ALIAS
+KEY_FLAGS |= protocol.FLG_UNCACHED
+
+#: a cached reading: raw value, wall clock time of reading, request flags
+Entry = collections.namedtuple('Entry', 'value timestamp flags')
+
+
+class ShmCache(object):
+    """Hash table of readings, in the memory mapped file ``filename``
+
+    The file is created, if it does not exist, with ``slots`` entries
+    for paths up to ``path_size`` bytes and values up to ``value_size``
+    bytes; otherwise its geometry is read from the file. Entries older
+    than ``ttl`` seconds are not used.
+
+    Reads are lock free: each slot is guarded by a sequence number
+    (seqlock), odd while a write is in progress. Writes are serialized
+    by a lock on the file.
+    """
+
+    def __init__(self, filename, slots=4096, path_size=96, value_size=64,
+                 ttl=10.0):
+        if ttl <= 0:
+            raise ValueError('ttl must be positive')
+        self.filename = filename
+        self.ttl = ttl
+        self._create(filename, slots, path_size, value_size)
+
+        self._leader = None
+        self._lock = threading.Lock()
+        self._file = open(filename, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        magic, self.slots, self.path_size, self.value_size = \
+            _HEADER.unpack_from(self._mm)
+        self._slot_size = _SLOT.size + self.path_size + self.value_size
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError('%s: not a reading cache' % filename)
+        if len(self._mm) < _DATA_OFFSET + self.slots * self._slot_size:
+            self.close()
+            raise ValueError('%s: truncated file' % filename)
+
+    @staticmethod
+    def _create(filename, slots, path_size, value_size):
+        # atomically create filename, unless it already exists
+
+        if os.path.exists(filename):
+            return
+        if slots <= 0 or not 0 < path_size < 1 << 16 or \
+                not 0 < value_size < 1 << 16:
+            raise ValueError('invalid cache geometry')
+        tmpname = '%s.%d' % (filename, os.getpid())
+        with open(tmpname, 'wb') as fil:
+            fil.write(_HEADER.pack(_MAGIC, slots, path_size, value_size))
+            slot_size = _SLOT.size + path_size + value_size
+            fil.truncate(_DATA_OFFSET + slots * slot_size)
+        try:
+            os.link(tmpname, filename)
+        except OSError as err:
+            # created meanwhile by another process
+            if err.errno != errno.EEXIST:
+                raise
+        finally:
+            os.unlink(tmpname)
+
+    def __reduce__(self):
+        # reopen the same file in other processes
+        return (ShmCache, (self.filename, self.slots, self.path_size,
+                           self.value_size, self.ttl))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """unmap the cache file, release leadership"""
+
+        self.resign()
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = None
+
+    def wrap(self, owproxy):
+        """return a clone of owproxy, whose reads use this cache"""
+
+        return protocol._wrap(owproxy, read_cache=self)
+
+    #
+    # table access
+    #
+
+    def _probe(self, key):
+        # offsets of the slots where key can be found
+        start = zlib.crc32(key) & 0xffffffff
+        for i in range(min(_PROBES, self.slots)):
+            yield _DATA_OFFSET + (start + i) % self.slots * self._slot_size
+
+    def _load(self, offset):
+        # consistent copy of the slot at offset, or None
+
+        mm = self._mm
+        for _ in range(_RETRIES):
+            seq = _SEQ.unpack_from(mm, offset)[0]
+            if seq & 1:
+                continue
+            raw = mm[offset:offset + self._slot_size]
+            if _SEQ.unpack_from(mm, offset)[0] == seq:
+                return raw
+        return None
+
+    def _lookup(self, key):
+        # return (value, timestamp, flags) of key, or None
+
+        hkey = zlib.crc32(key) & 0xffffffff
+        for offset in self._probe(key):
+            raw = self._load(offset)
+            if raw is None:
+                # slot is being written
+                continue
+            _, hsh, tstamp, flags, plen, vlen = _SLOT.unpack_from(raw)
+            if not plen:
+                # empty slot, end of probe sequence
+                return None
+            if hsh == hkey and raw[_SLOT.size:_SLOT.size + plen] == key:
+                start = _SLOT.size + self.path_size
+                return Entry(raw[start:start + vlen], tstamp, flags)
+        return None
+
+    def get(self, path, flags=0, max_age=None):
+        """return the Entry of path, if read with flags, or None
+
+        entries older than max_age seconds (default: ttl) are ignored.
+        """
+
+        entry = self._lookup(str2bytez(path)[:-1])
+        if entry is None or entry.flags != flags & KEY_FLAGS:
+            return None
+        if max_age is None:
+            max_age = self.ttl
+        if time.time() - entry.timestamp > max_age:
+            return None
+        return entry
+
+    def put(self, path, value, flags=0, timestamp=None):
+        """save a reading of path; return False if it does not fit"""
+
+        key = str2bytez(path)[:-1]
+        value = bytes(value)
+        if len(key) > self.path_size or len(value) > self.value_size:
+            return False
+        if timestamp is None:
+            timestamp = time.time()
+        hkey = zlib.crc32(key) & 0xffffffff
+        with self._write_lock():
+            mm = self._mm
+            target = oldest = None
+            for offset in self._probe(key):
+                _, hsh, tstamp, _, plen, _ = _SLOT.unpack_from(mm, offset)
+                start = offset + _SLOT.size
+                if not plen or (hsh == hkey and mm[start:start + plen] == key):
+                    target = offset
+                    break
+                if oldest is None or tstamp < oldest[0]:
+                    oldest = (tstamp, offset)
+            if target is None:
+                target = oldest[1]
+            seq = _SEQ.unpack_from(mm, target)[0]
+            _SEQ.pack_into(mm, target, seq + 1)
+            _SLOT.pack_into(mm, target, seq + 1, hkey, timestamp,
+                            flags & KEY_FLAGS, len(key), len(value))
+            start = target + _SLOT.size
+            mm[start:start + len(key)] = key
+            start += self.path_size
+            mm[start:start + len(value)] = value
+            _SEQ.pack_into(mm, target, (seq + 2) & 0xffffffff)
+        return True
+
+    def entries(self):
+        """yield (path, Entry) of all cached readings"""
+
+        vstart = _SLOT.size + self.path_size
+        for i in range(self.slots):
+            raw = self._load(_DATA_OFFSET + i * self._slot_size)
+            if raw is None:
+                continue
+            _, _, tstamp, flags, plen, vlen = _SLOT.unpack_from(raw)
+            if plen:
+                path = protocol.bytes2str(raw[_SLOT.size:_SLOT.size + plen])
+                yield path, Entry(raw[vstart:vstart + vlen], tstamp, flags)
+
+    def _write_lock(self):
+        return _FileLock(self._lock, self._file)
+
+    #
+    # leader election
+    #
+
+    def elect(self):
+        """try to become the leader, return True if this process is
+
+        leadership lasts until resign or close, or the end of the
+        process.
+        """
+
+        if self._leader is not None:
+            return True
+        fil = open(self.filename + '.leader', 'a')
+        try:
+            fcntl.flock(fil.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            fil.close()
+            return False
+        self._leader = fil
+        return True
+
+    def resign(self):
+        """release leadership, if this process is the leader"""
+
+        if self._leader is not None:
+            self._leader.close()
+            self._leader = None
+
+    def refresh(self, owproxy, min_age=0, errors=None):
+        """read again from owserver the entries older than min_age
+
+        return the number of entries refreshed. Entries that cannot be
+        read are skipped, and (path, exception) appended to errors, if
+        given; connection errors are raised.
+        """
+
+        num = 0
+        now = time.time()
+        for path, entry in self.entries():
+            if now - entry.timestamp < min_age:
+                continue
+            try:
+                ret, data = owproxy.sendmess(
+                    protocol.MSG_READ, str2bytez(path), entry.flags,
+                    size=self.value_size)
+            except protocol.ConnError:
+                raise
+            except protocol.Error as exc:
+                if errors is not None:
+                    errors.append((path, exc))
+                continue
+            if ret < 0:
+                if errors is not None:
+                    errors.append((path, protocol.OwnetError(
+                        -ret, owproxy.errmess[-ret], path)))
+            elif self.put(path, data, entry.flags):
+                num += 1
+        return num
+
+
+class _FileLock(object):
+    """exclusive lock among threads and processes"""
+
+    def __init__(self, lock, fil):
+        self._tlock = lock
+        self._file = fil
+
+    def __enter__(self):
+        self._tlock.acquire()
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._tlock.release()
+
+
+class Refresher(object):
+    """Keep the entries of cache fresh, if elected leader
+
+    Every ``interval`` seconds (default: half the cache ttl) the thread
+    tries to become the leader of the cache; the leader re-reads all
+    entries older than ``interval`` via a persistent clone of owproxy.
+    Start a refresher in each process: if the leader dies, another
+    process takes over.
+    """
+
+    def __init__(self, cache, owproxy, interval=None):
+        if not isinstance(owproxy, protocol._Proxy):
+            raise TypeError('argument is not a Proxy object')
+        self.cache = cache
+        self.interval = cache.ttl / 2.0 if interval is None else interval
+        self._proxy = protocol.clone(owproxy, persistent=True)
+        # formatting flags are taken from each entry
+        self._proxy.flags &= ~KEY_FLAGS
+        self._proxy.read_cache = None
+        self._stop = threading.Event()
+        self._thread = None
+        # refresh cycles done as leader
+        self.cycles = 0
+        # failed reads, and the last error
+        self.errors = 0
+        self.last_error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        """start background refresh"""
+
+        if self._thread is not None:
+            raise ValueError('refresher already started')
+        self._thread = threading.Thread(target=self._run,
+                                        name='pyownet-shmcache')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """stop background refresh, release leadership"""
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._proxy.close_connection()
+        # let the refresher of another process take over
+        self.cache.resign()
+
+    def _run(self):
+        while not self._stop.is_set():
+            tic = time.time()
+            if self.cache.elect():
+                errors = []
+                try:
+                    self.cache.refresh(self._proxy, self.interval, errors)
+                except protocol.Error as exc:
+                    # owserver unreachable, entries age out
+                    errors.append((None, exc))
+                if errors:
+                    self.errors += len(errors)
+                    self.last_error = errors[-1][1]
+                self.cycles += 1
+            self._stop.wait(max(self.interval - (time.time() - tic), 0))
@@ -0,0 +1,275 @@
+"""warm-start state of owservers, persisted to file
+
+Before serving the first useful sample, a freshly started program
+pays for the owserver error messages, the discovery of the devices on
+each bus, their types, and the property schema of their families: on
+large networks this takes many requests and much bus traffic. A
+:class:`WarmState` keeps all of these in a JSON file: proxy objects are
+initialized from the file at startup, and serve at once, while the
+state is revalidated in a background thread and saved again. Only
+what is not known yet, e.g. the type of a new device or the schema of
+a new family, is read from owserver during revalidation.
+
+>>> from pyownet import state
+>>> warm = state.WarmState('/var/lib/myapp/owstate.json')
+>>> owproxy = warm.proxy('owserver.example.com', 4304, schema=True,
+...                      routing=True)
+>>> owproxy.read('/28.000028D70000/temperature')
+b'           4'
+>>> warm.join()
+>>> warm.devices('owserver.example.com', 4304)
+{'/bus.0': {'28.000028D70000': 'DS18B20'}}
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import json
+import time
+import tempfile
+import threading
+
+from . import protocol
+from . import routing as _routing
+from . import schema as _schema
+
+# version of the file format
+VERSION = 1
+
+# atomic rename, also on Windows; os.rename on Python 2
+_replace = getattr(os, 'replace', os.rename)
+
+
+class WarmState(object):
+    """Error messages, devices per bus and property schema of owservers
+
+    The state is loaded from filename, if it exists and is valid, and
+    saved there, atomically, after each revalidation.
+
+    WarmState objects are thread-safe.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._servers = self._load()
+        self._threads = []
+        # last error of a background revalidation, or None
+        self.error = None
+
+    def _load(self):
+        # read servers from file, or return an empty dict
+
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get('version') != VERSION:
+            return {}
+        return _native(data.get('servers', {}))
+
+    def save(self):
+        """write the state to file, atomically"""
+
+        with self._lock:
+            data = json.dumps({'version': VERSION, 'servers': self._servers},
+                              indent=1, sort_keys=True)
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.pyownet-state')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            _replace(tmp, self.filename)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+    def _entry(self, host, port):
+        return self._servers.get('{0}:{1}'.format(host, port))
+
+    def errmess(self, host='localhost', port=4304):
+        """return the saved error messages of owserver, or None"""
+
+        entry = self._entry(host, port)
+        return None if entry is None else list(entry['errcodes'])
+
+    def devices(self, host='localhost', port=4304):
+        """return the saved devices of owserver, or None
+
+        devices are returned as ``{bus: {device: type}}``, e.g.
+        ``{'/bus.0': {'28.000028D70000': 'DS18B20'}}``.
+        """
+
+        entry = self._entry(host, port)
+        if entry is None:
+            return None
+        return dict((bus, dict(devs)) for bus, devs in
+                    entry['devices'].items())
+
+    def families(self, host='localhost', port=4304):
+        """return the saved schema of owserver, or None
+
+        the schema is returned as ``{family: {property: PropertyInfo}}``,
+        as expected by SchemaCache.update.
+        """
+
+        entry = self._entry(host, port)
+        if entry is None:
+            return None
+        return dict((family, dict((prop, _schema.PropertyInfo(*fields))
+                                  for prop, fields in props.items()))
+                    for family, props in entry['schema'].items())
+
+    def proxy(self, host='localhost', port=4304, routing=None,
+              revalidate=True, **kwargs):
+        """return a proxy object for owserver at host, port
+
+        the proxy is initialized from the saved state: error messages
+        are not read from owserver, the proxy schema (if any) is loaded
+        with the saved families, and the routing cache (if routing is
+        True, or a RoutingCache object) with the saved devices. Other
+        arguments are passed to protocol.proxy.
+
+        if revalidate is True, the state is revalidated in a background
+        thread, see join(); errors are saved in the error attribute.
+        """
+
+        errmess = self.errmess(host, port)
+        if errmess is not None:
+            kwargs.setdefault('errmess', errmess)
+        owp = protocol.proxy(host, port, **kwargs)
+        families = self.families(host, port)
+        if families and owp.schema is not None:
+            owp.schema.update(families)
+        if routing is True:
+            routing = _routing.RoutingCache()
+        if routing is not None:
+            routing.update(_bus_entries(self.devices(host, port) or {}))
+            owp.routing = routing
+        if revalidate:
+            thread = threading.Thread(target=self._revalidate,
+                                      args=(owp, host, port),
+                                      name='pyownet-state')
+            thread.daemon = True
+            with self._lock:
+                self._threads.append(thread)
+            thread.start()
+        return owp
+
+    def join(self, timeout=None):
+        """wait for background revalidations to complete"""
+
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def _revalidate(self, owproxy, host, port):
+        # revalidate in a background thread, saving errors
+
+        try:
+            self.revalidate(owproxy, host, port)
+        except (protocol.Error, IOError, OSError) as exc:
+            self.error = exc
+
+    def revalidate(self, owproxy, host='localhost', port=4304):
+        """bring the state of owserver at host, port up to date
+
+        requests are sent via owproxy; bus listings are always read,
+        but types of devices and schema of families already known are
+        not. The routing cache of owproxy, if any, is updated too. The
+        state is saved to file.
+        """
+
+        owp = protocol.clone(owproxy, persistent=False)
+        owp.routing = None
+
+        try:
+            errcodes = protocol.bytes2str(
+                owp.read(protocol.PTH_ERRCODES)).split(',')
+            owproxy.errmess = protocol._errtuple(errcodes)
+        except protocol.OwnetError:
+            errcodes = list(owp.errmess)
+
+        known = {}
+        for devs in (self.devices(host, port) or {}).values():
+            known.update(devs)
+        devices = {}
+        for bus in owp.dir('/', bus=True):
+            if not bus.startswith('/bus.'):
+                continue
+            found = devices[bus.rstrip('/')] = {}
+            for entry in owp.dir(bus, bus=True):
+                device = entry.rstrip('/').split('/')[-1]
+                if not protocol._DEVICE_RE.match(device):
+                    continue
+                if device not in known:
+                    try:
+                        known[device] = protocol.bytes2str(
+                            owp.read(entry.rstrip('/') + '/type')).strip()
+                    except protocol.OwnetError:
+                        # device gone meanwhile
+                        continue
+                found[device] = known[device]
+
+        schema = owp.schema
+        if schema is None:
+            schema = _schema.SchemaCache()
+            schema.update(self.families(host, port) or {})
+        families = set(device[:2].upper() for devs in devices.values()
+                       for device in devs)
+        saved = dict((family, dict((prop, list(info)) for prop, info in
+                                   schema.family(owp, family).items()))
+                     for family in families)
+
+        with self._lock:
+            self._servers['{0}:{1}'.format(host, port)] = dict(
+                saved=time.time(), errcodes=errcodes, devices=devices,
+                schema=saved)
+        self.save()
+
+        routes = owproxy.routing
+        if routes is not None:
+            entries = list(_bus_entries(devices))
+            routes.update(entries)
+            current = set(i.split('/')[2] for i in entries)
+            for device in known:
+                if device not in current:
+                    routes.invalidate(device)
+
+
+def _native(obj):
+    # json strings of obj as native str: json returns unicode on python2
+
+    if isinstance(obj, dict):
+        return dict((_native(k), _native(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return [_native(i) for i in obj]
+    if str is bytes and isinstance(obj, type(u'')):
+        return obj.encode('utf-8')
+    return obj
+
+
+def _bus_entries(devices):
+    # yield '/bus.N/device' paths of a {bus: {device: type}} dict
+
+    for bus, devs in devices.items():
+        for device in devs:
+            yield bus + '/' + device
@@ -0,0 +1,242 @@
+"""memory mapped ring buffer of sensor samples
+
+This module implements a persistent store for polled readings. Samples
+are saved as fixed width records ``(timestamp, sensor, value, status)``
+in a ring buffer backed by a memory mapped file, so that the history
+survives a process restart without any reload step. Sensor paths are
+interned in a table saved beside the ring file and records refer to
+them by index.
+
+>>> from pyownet import store
+>>> st = store.SampleStore('samples.ring', capacity=1 << 20)
+>>> st.feed({'/28.000028D70000/temperature': b'         4.0'})
+>>> list(st)
+[(1546300800.0, '/28.000028D70000/temperature', 4.0, 0)]
+
+If NumPy is available, :meth:`SampleStore.query` returns zero copy views
+of the records in a given time range.
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import io
+import os
+import mmap
+import struct
+import time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import protocol
+
+# file header: magic, capacity, next write position, number of records
+_HEADER = struct.Struct('<8sQQQ')
+_MAGIC = b'OWRING\x00\x01'
+_DATA_OFFSET = 64
+
+# record: timestamp, sensor index, value, status
+_RECORD = struct.Struct('<dIdi')
+
+# status codes: 0 is a valid value, > 0 is an owserver errno
+ST_OK = 0
+ST_ERROR = -1
+ST_NOTANUMBER = -2
+
+if numpy is not None:
+    #: NumPy dtype of a record
+    dtype = numpy.dtype([('timestamp', '<f8'), ('sensor', '<u4'),
+                         ('value', '<f8'), ('status', '<i4')])
+    assert dtype.itemsize == _RECORD.size
+
+
+class SampleStore(object):
+    """Ring buffer of samples in a memory mapped file
+
+    The ring file ``filename`` is created with room for ``capacity``
+    records if it does not exist; otherwise it is reopened and
+    ``capacity``, if given, must agree with the saved one. The path
+    table is kept in ``filename + '.paths'``.
+    """
+
+    def __init__(self, filename, capacity=None):
+        self.filename = filename
+        self._pathfile = filename + '.paths'
+
+        if not os.path.exists(filename):
+            if not capacity or capacity <= 0:
+                raise ValueError('capacity required for new store')
+            with open(filename, 'wb') as fil:
+                fil.write(_HEADER.pack(_MAGIC, capacity, 0, 0))
+                fil.truncate(_DATA_OFFSET + capacity * _RECORD.size)
+            # a stale path table belongs to some other store
+            open(self._pathfile, 'w').close()
+
+        self._pathtable = None
+        self._file = open(filename, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        magic, self.capacity, self._head, self._count = _HEADER.unpack_from(
+            self._mm)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError('%s: not a sample store' % filename)
+        if capacity and capacity != self.capacity:
+            self.close()
+            raise ValueError('%s: capacity is %d' % (filename, self.capacity))
+        if len(self._mm) < _DATA_OFFSET + self.capacity * _RECORD.size:
+            self.close()
+            raise ValueError('%s: truncated file' % filename)
+
+        # interned path table
+        self.paths = []
+        self._index = {}
+        if os.path.exists(self._pathfile):
+            with io.open(self._pathfile, 'r', encoding='ascii') as fil:
+                for line in fil:
+                    self._intern(line.rstrip('\n'), save=False)
+        self._pathtable = io.open(self._pathfile, 'a', encoding='ascii')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for i in self._order():
+            tstamp, sensor, value, status = _RECORD.unpack_from(
+                self._mm, _DATA_OFFSET + i * _RECORD.size)
+            yield tstamp, self.paths[sensor], value, status
+
+    def close(self):
+        """flush data and close files"""
+
+        if self._mm is None:
+            # already closed
+            return
+        self.flush()
+        self._mm.close()
+        self._mm = None
+        self._file.close()
+        if self._pathtable is not None:
+            self._pathtable.close()
+
+    def flush(self):
+        """flush data to disk"""
+
+        if self._pathtable is not None:
+            self._pathtable.flush()
+        self._mm.flush()
+
+    def _intern(self, path, save=True):
+        # return index of path in path table, adding it if needed
+
+        try:
+            return self._index[path]
+        except KeyError:
+            pass
+        if '\n' in path:
+            raise ValueError('invalid path %r' % path)
+        idx = self._index[path] = len(self.paths)
+        self.paths.append(path)
+        if save:
+            # saved at once, records must never refer to a lost path
+            self._pathtable.write(path + u'\n')
+            self._pathtable.flush()
+        return idx
+
+    def _order(self):
+        # record indexes in chronological order
+
+        start = (self._head - self._count) % self.capacity
+        for i in range(self._count):
+            yield (start + i) % self.capacity
+
+    def append(self, timestamp, path, value, status=ST_OK):
+        """append a sample, overwriting the oldest one if full"""
+
+        sensor = self._intern(path)
+        _RECORD.pack_into(self._mm, _DATA_OFFSET + self._head * _RECORD.size,
+                          timestamp, sensor, value, status)
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        _HEADER.pack_into(self._mm, 0, _MAGIC, self.capacity,
+                          self._head, self._count)
+
+    def feed(self, results, timestamp=None):
+        """append poller results
+
+        ``results`` is a ``{path: value}`` mapping, as returned for each
+        target by :meth:`pyownet.poller.ShardedPoller.poll`; values can
+        be numbers, ``bytes`` as returned by :meth:`read`, or exceptions.
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+        for path, value in results.items():
+            status = ST_OK
+            if isinstance(value, protocol.OwnetError):
+                status = value.errno
+            elif isinstance(value, Exception):
+                status = ST_ERROR
+            else:
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    status = ST_NOTANUMBER
+            if status != ST_OK:
+                value = float('nan')
+            self.append(timestamp, path, value, status)
+
+    def view(self):
+        """zero copy NumPy views of all records, in chronological order
+
+        Returns a list of at most two record arrays, since the ring buffer
+        content could wrap around the end of the file.
+        """
+
+        if numpy is None:
+            raise ImportError('NumPy is required for record views')
+        data = numpy.frombuffer(self._mm, dtype=dtype,
+                                count=self.capacity, offset=_DATA_OFFSET)
+        start = (self._head - self._count) % self.capacity
+        if start + self._count <= self.capacity:
+            return [data[start:start + self._count]]
+        return [data[start:], data[:self._head]]
+
+    def query(self, start=None, stop=None):
+        """zero copy NumPy views of the records with start <= t < stop
+
+        Timestamps are assumed non decreasing in order of insertion.
+        """
+
+        res = []
+        for chunk in self.view():
+            lo, hi = 0, len(chunk)
+            if start is not None:
+                lo = chunk['timestamp'].searchsorted(start, 'left')
+            if stop is not None:
+                hi = chunk['timestamp'].searchsorted(stop, 'left')
+            if lo < hi:
+                res.append(chunk[lo:hi])
+        return res
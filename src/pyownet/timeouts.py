@@ -0,0 +1,198 @@
+"""adaptive timeouts, from round trip time estimates
+
+A single static timeout is either too short for slow devices (e.g. a
+12 bit temperature conversion) or too long to quickly detect a hung
+server. An :class:`AdaptiveTimeouts` object, assigned to the
+``timeouts`` attribute of a proxy object, measures the duration of
+each call and keeps smoothed round trip time estimates, in the style
+of TCP retransmission timeouts (RFC 6298): calls without an explicit
+timeout get a timeout derived from them, and so does the socket
+connect.
+
+>>> from pyownet import protocol, timeouts
+>>> owproxy = protocol.proxy(host="owserver.example.com", timeouts=True)
+>>> owproxy.timeouts is timeouts.adaptive_timeouts()
+True
+>>> owproxy.read('/28.000028D70000/temperature')
+'           4'
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import threading
+
+from . import protocol
+
+_HEADER = protocol._ToServerHeader
+
+
+class RttEstimator(object):
+    """smoothed round trip time and variance, as for TCP (RFC 6298)"""
+
+    __slots__ = ('srtt', 'rttvar', 'backoff', 'samples', )
+
+    ALPHA = 1 / 8.0
+    BETA = 1 / 4.0
+    K = 4
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.backoff = 1
+        self.samples = 0
+
+    # classes with __slots__ are pickled by Python 2 only via __getstate__
+    def __getstate__(self):
+        return tuple(getattr(self, i) for i in self.__slots__)
+
+    def __setstate__(self, state):
+        for key, val in zip(self.__slots__, state):
+            setattr(self, key, val)
+
+    def sample(self, rtt):
+        """update estimates with a measured round trip time"""
+
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2.0
+        else:
+            self.rttvar += self.BETA * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += self.ALPHA * (rtt - self.srtt)
+        self.backoff = 1
+        self.samples += 1
+
+    def expired(self):
+        """double the timeout, after a timeout expired"""
+
+        self.backoff = min(self.backoff * 2, 64)
+
+    def rto(self, lower, upper):
+        """timeout, clamped to the [lower, upper] interval"""
+
+        if self.srtt is None:
+            return upper
+        rto = (self.srtt + self.K * self.rttvar) * self.backoff
+        return min(max(rto, lower), upper)
+
+
+class AdaptiveTimeouts(protocol._Lockable):
+    """Timeouts derived from round trip time estimates
+
+    Estimates are kept for each owserver address and, for each of them,
+    for each message type and property type (family code and property
+    name, e.g. '28' and 'temperature'): per call timeouts are taken as
+    ``srtt + 4 * rttvar``, within ``[min_timeout, max_timeout]``. Connect
+    timeouts are estimated in the same way for each owserver address,
+    within ``[min_connect, max_connect]``.
+    """
+
+    def __init__(self, min_timeout=1.0, max_timeout=60.0, min_connect=0.2,
+                 max_connect=protocol._SCK_TIMEOUT):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_connect = min_connect
+        self.max_connect = max_connect
+        self._rtt = {}
+        self._connect = {}
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        if self is _shared_timeouts:
+            return (adaptive_timeouts, ())
+        return super(AdaptiveTimeouts, self).__reduce__()
+
+    @staticmethod
+    def key(sockaddr, msg):
+        """estimate key of an encoded message to sockaddr"""
+
+        msgtype = _HEADER._struct.unpack_from(msg)[2]
+        end = msg.find(b'\x00', _HEADER.header_size)
+        path = protocol.bytes2str(bytes(msg[_HEADER.header_size:end]))
+        return (sockaddr, msgtype) + _property_type(path)
+
+    def _estimator(self, table, key):
+        try:
+            return table[key]
+        except KeyError:
+            return table.setdefault(key, RttEstimator())
+
+    def timeout(self, key):
+        """per call timeout for messages with key"""
+
+        with self._lock:
+            return self._estimator(self._rtt, key).rto(self.min_timeout,
+                                                       self.max_timeout)
+
+    def sample(self, key, rtt):
+        with self._lock:
+            self._estimator(self._rtt, key).sample(rtt)
+
+    def expired(self, key):
+        with self._lock:
+            self._estimator(self._rtt, key).expired()
+
+    def connect_timeout(self, sockaddr):
+        """connect timeout for owserver at sockaddr"""
+
+        with self._lock:
+            return self._estimator(self._connect, sockaddr).rto(
+                self.min_connect, self.max_connect)
+
+    def sample_connect(self, sockaddr, elapsed):
+        with self._lock:
+            self._estimator(self._connect, sockaddr).sample(elapsed)
+
+    def expired_connect(self, sockaddr):
+        with self._lock:
+            self._estimator(self._connect, sockaddr).expired()
+
+    def metrics(self):
+        """return a list of dictionaries, one per estimate"""
+
+        res = []
+        with self._lock:
+            for kind, table in (('connect', self._connect),
+                                ('request', self._rtt)):
+                for key, est in table.items():
+                    if kind == 'connect':
+                        key, timeout = (key, ), est.rto(self.min_connect,
+                                                        self.max_connect)
+                    else:
+                        timeout = est.rto(self.min_timeout, self.max_timeout)
+                    res.append(dict(
+                        kind=kind, sockaddr=key[0], key=key[1:],
+                        srtt=est.srtt, rttvar=est.rttvar, timeout=timeout,
+                        samples=est.samples))
+        return res
+
+
+_shared_timeouts = AdaptiveTimeouts()
+
+
+def adaptive_timeouts():
+    """return the AdaptiveTimeouts object shared by all proxies"""
+
+    return _shared_timeouts
+
+
+def _property_type(path):
+    # family code and property name of path
+
+    family, prop = protocol._split_device(path)
+    return family or '', protocol._INDEX_RE.sub('', prop)
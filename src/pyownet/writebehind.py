@@ -0,0 +1,277 @@
+"""write-behind queue for owserver writes
+
+Control loops often issue bursts of writes to the same actuator, of
+which only the last value matters. A :class:`WriteBehind` object
+queues writes per path and returns at once: a background thread sends
+them to the owserver over a persistent connection, and a write still
+queued when a new value for the same path arrives is superseded by it
+(last write wins).
+
+>>> from pyownet import protocol, writebehind
+>>> owproxy = protocol.proxy(host="owserver.example.com", port=4304)
+>>> with writebehind.WriteBehind(owproxy) as wb:
+...     for value in (b'1', b'0', b'1'):
+...         pending = wb.write('/29.000029AA0000/PIO.0', value)
+...     pending.result()
+
+"""
+
+#
+# Copyright 2013-2019 Stefano Miccoli
+#
+# This python package is free software: you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Lesser GNU General Public License for more details.
+#
+# You should have received a copy of the Lesser GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import threading
+import collections
+
+from . import protocol
+from . import aggregate as _aggregate
+from .protocol import monotonic
+
+# offset is a signed 32 bit field of the request header
+_MAX_OFFSET = 0x7fffffff
+
+
+class PendingWrite(object):
+    """A write queued on a :class:`WriteBehind` object
+
+    should not be instantiated directly
+    """
+
+    def __init__(self, path, data, offset):
+        self.path = path
+        self.data = data
+        self.offset = offset
+        self.superseded = False
+        self._tqueued = monotonic()
+        self._event = threading.Event()
+        self._error = None
+
+    def __repr__(self):
+        return "<PendingWrite {0!r} = {1!r}>".format(self.path, self.data)
+
+    def done(self):
+        """True if the write is completed"""
+
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """wait for completion, return True unless timeout expired"""
+
+        self._event.wait(timeout)
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """wait for completion, raise the write exception if any"""
+
+        if not self.wait(timeout):
+            raise ValueError('write not completed')
+        if self._error is not None:
+            raise self._error
+
+    def exception(self, timeout=None):
+        """wait for completion, return the write exception or None"""
+
+        if not self.wait(timeout):
+            raise ValueError('write not completed')
+        return self._error
+
+    def _set_done(self, error=None):
+        self._error = error
+        self._event.set()
+
+
+class WriteBehind(object):
+    """Queue writes to owserver, coalescing writes to the same path
+
+    Writes are sent in order of arrival by a background thread, on a
+    persistent clone of ``owproxy``. If ``delay`` is given, each write
+    is held for ``delay`` seconds after it was first queued, so that
+    bursts can be collapsed into a single bus write: the latency of a
+    write is therefore bounded by ``delay`` plus the time needed to send
+    the writes queued before it.
+
+    A superseded write completes together with the write that replaced
+    it, with the same outcome, and its ``superseded`` attribute is set.
+
+    Writes queued for several channels of the same multi-channel
+    property (e.g. 'PIO.0' ... 'PIO.7') are sent together as a single
+    write of the aggregate property ('PIO.ALL') when they cover all its
+    channels, see :func:`pyownet.aggregate.write`, unless ``aggregate``
+    is false.
+    """
+
+    def __init__(self, owproxy, delay=0, timeout=0, aggregate=True):
+        if not isinstance(owproxy, protocol._Proxy):
+            raise TypeError('argument is not a Proxy object')
+        if delay < 0:
+            raise ValueError("delay cannot be negative!")
+        self.delay = delay
+        self.timeout = timeout
+        self.aggregate = aggregate
+        self._proxy = protocol.clone(owproxy, persistent=True)
+        # (path, offset) -> list of PendingWrite, in order of first arrival
+        self._queue = collections.OrderedDict()
+        self._inflight = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run,
+                                        name='pyownet-writebehind')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._queue) + bool(self._inflight)
+
+    def write(self, path, data, offset=0):
+        """queue a write, return a :class:`PendingWrite` object"""
+
+        if not isinstance(data, (bytes, bytearray, )):
+            raise TypeError("'data' argument must be binary")
+        # check arguments at once, not in the flush thread
+        protocol.str2bytez(path)
+        if not 0 <= offset <= _MAX_OFFSET:
+            raise ValueError("offset out of range")
+
+        pending = PendingWrite(path, bytes(data), offset)
+        with self._cond:
+            if self._closed:
+                raise ValueError('write on closed WriteBehind object')
+            writes = self._queue.setdefault((path, offset), [])
+            for old in writes:
+                old.superseded = True
+            writes.append(pending)
+            self._cond.notify()
+        return pending
+
+    def flush(self, timeout=None):
+        """wait for completion of all writes queued so far
+
+        Return True if all of them are completed, False if ``timeout``
+        seconds expired.
+        """
+
+        with self._cond:
+            waiting = [i for writes in self._queue.values() for i in writes]
+            waiting.extend(self._inflight)
+        if timeout is not None:
+            tend = monotonic() + timeout
+        for pending in waiting:
+            if timeout is not None:
+                timeout = max(tend - monotonic(), 0)
+            if not pending.wait(timeout):
+                return False
+        return True
+
+    def close(self):
+        """send queued writes, stop flush thread and close connection"""
+
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._proxy.close_connection()
+
+    def _next(self):
+        # wait for next write to send, return a batch: a list with the
+        # list of PendingWrite of the write, and of the other channels
+        # of the same aggregate property, if any
+
+        with self._cond:
+            while True:
+                if self._queue:
+                    key = next(iter(self._queue))
+                    due = self._queue[key][0]._tqueued + self.delay
+                    wait = due - monotonic()
+                    if wait <= 0 or self._closed:
+                        batch = [self._queue.pop(key)]
+                        batch.extend(self._pop_channels(key))
+                        self._inflight = [i for writes in batch
+                                          for i in writes]
+                        return batch
+                elif self._closed:
+                    return None
+                else:
+                    wait = None
+                self._cond.wait(wait)
+
+    def _pop_channels(self, key):
+        # remove from queue and return writes to other channels of the
+        # aggregate property of key
+
+        path, offset = key
+        split = self._split
+        channel = split(path) if self.aggregate else None
+        if channel is None or offset:
+            return []
+        siblings = [(p, o) for p, o in self._queue
+                    if not o and split(p) is not None]
+        return [self._queue.pop(i) for i in siblings
+                if split(i[0])[0] == channel[0]]
+
+    def _split(self, path):
+        return _aggregate.split(path, self._proxy)
+
+    def _send(self, batch):
+        # send a batch of writes, return the error of each of them
+
+        if len(batch) > 1:
+            path = self._split(batch[0][-1].path)[0]
+            updates = dict((self._split(writes[-1].path)[1],
+                            writes[-1].data) for writes in batch)
+            try:
+                if _aggregate.write(self._proxy, path, updates,
+                                    timeout=self.timeout):
+                    return [None] * len(batch)
+            except protocol.Error as exc:
+                return [exc] * len(batch)
+        errors = []
+        for writes in batch:
+            last = writes[-1]
+            try:
+                self._proxy.write(last.path, last.data, offset=last.offset,
+                                  timeout=self.timeout)
+            except protocol.Error as exc:
+                errors.append(exc)
+            else:
+                errors.append(None)
+        return errors
+
+    def _run(self):
+        # flush thread
+
+        while True:
+            batch = self._next()
+            if batch is None:
+                break
+            try:
+                errors = self._send(batch)
+            except Exception as exc:
+                # unexpected error: fail the batch, keep the thread alive
+                errors = [exc] * len(batch)
+            with self._cond:
+                self._inflight = []
+            for writes, error in zip(batch, errors):
+                for pending in writes:
+                    pending._set_done(error)
@@ -0,0 +1,174 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+import socket
+
+from pyownet import protocol, aggregate, poller, schema, writebehind
+
+DEV = '/29.000029AA0000/'
+
+
+class _Switch(protocol._Proxy):
+    # proxy object serving a DS2408 switch, logging requests
+
+    def __init__(self, has_all=True):
+        super(_Switch, self).__init__(socket.AF_INET, ('127.0.0.1', 0))
+        self.pio = [b'0'] * 8
+        self.has_all = has_all
+        self.log = []
+
+    def read(self, path, size=protocol.MAX_PAYLOAD, offset=0, timeout=0,
+             max_staleness=None):
+        self.log.append(('read', path))
+        channel = aggregate.split(path)
+        if path == DEV + 'PIO.ALL' and self.has_all:
+            return b','.join(self.pio)
+        elif channel and channel[0] == DEV + 'PIO.ALL':
+            return self.pio[channel[1]]
+        elif path == DEV + 'temperature':
+            return b'     21.5'
+        raise protocol.OwnetError(2, 'not found', path)
+
+    def write(self, path, data, offset=0, timeout=0):
+        self.log.append(('write', path))
+        channel = aggregate.split(path)
+        if path == DEV + 'PIO.ALL' and self.has_all:
+            self.pio = data.split(b',')
+        elif channel and channel[0] == DEV + 'PIO.ALL':
+            self.pio[channel[1]] = data
+        else:
+            raise protocol.OwnetError(2, 'not found', path)
+
+    def close_connection(self):
+        pass
+
+
+class Test_aggregate(unittest.TestCase):
+
+    def test_split(self):
+        self.assertEqual(aggregate.split('/29.000029AA0000/PIO.7'),
+                         ('/29.000029AA0000/PIO.ALL', 7))
+        self.assertEqual(aggregate.split('/12.000012000000/PIO.B'),
+                         ('/12.000012000000/PIO.ALL', 1))
+        self.assertEqual(aggregate.split('/bus.0/3A.0000000000AB/sensed.A'),
+                         ('/bus.0/3A.0000000000AB/sensed.ALL', 0))
+        self.assertEqual(aggregate.split('/1D.00001DAA0000/counters.B'),
+                         ('/1D.00001DAA0000/counters.ALL', 1))
+        for path in ('/29.000029AA0000/PIO.ALL', '/29.000029AA0000/PIO.BYTE',
+                     '/28.000028D70000/temperature', '/28.000028170000',
+                     '/A2.000000000012', '/29.000029AA0000/PIO.a',
+                     '/29.000029AA0000/pages/page.0',
+                     '/26.000026000000/offset.0',
+                     '/1D.00001DAA0000/counter.A'):
+            self.assertIsNone(aggregate.split(path), path)
+
+    def test_schema(self):
+        owp = _Switch()
+        owp.schema = schema.SchemaCache()
+        owp.schema.update({'29': {
+            'PIO.ALL': schema.PropertyInfo('y', -1, 8, 'rw', 1, 'v'),
+            'pages/page.ALL': schema.PropertyInfo('b', -1, 1, 'rw', 32, 's'),
+            'delay.ALL': schema.PropertyInfo('u', -1, 2, 'rw', 12, 's'),
+        }})
+        self.assertEqual(aggregate.split(DEV + 'PIO.7', owp),
+                         (DEV + 'PIO.ALL', 7))
+        self.assertEqual(aggregate.split(DEV + 'delay.1', owp),
+                         (DEV + 'delay.ALL', 1))
+        for path in (DEV + 'PIO.8', DEV + 'pages/page.0', DEV + 'delay.2'):
+            self.assertIsNone(aggregate.split(path, owp), path)
+        # properties unknown to the schema
+        self.assertEqual(aggregate.split(DEV + 'sensed.0', owp),
+                         (DEV + 'sensed.ALL', 0))
+        self.assertIsNone(aggregate.split(DEV + 'offset.0', owp))
+        self.assertIsNone(aggregate.read(owp, DEV + 'PIO.ALL', [8]))
+        self.assertIsNone(aggregate.read(owp, DEV + 'pages/page.ALL', [0]))
+        self.assertEqual(owp.log, [])
+        updates = dict((i, b'1') for i in range(8))
+        self.assertTrue(aggregate.write(owp, DEV + 'PIO.ALL', updates))
+        self.assertEqual(owp.log, [('write', DEV + 'PIO.ALL')])
+
+    def test_group(self):
+        paths = [DEV + 'PIO.1', DEV + 'temperature', DEV + 'PIO.3',
+                 DEV + 'sensed.0', DEV + 'PIO.1']
+        self.assertEqual(dict(aggregate.group(paths)),
+                         {DEV + 'PIO.ALL': [(0, 1), (2, 3), (4, 1)]})
+
+    def test_read(self):
+        owp = _Switch()
+        owp.pio[6] = b'1'
+        self.assertEqual(aggregate.read(owp, DEV + 'PIO.ALL', [6, 0]),
+                         [b'1', b'0'])
+        self.assertIsNone(aggregate.read(owp, DEV + 'PIO.ALL', [8]))
+        self.assertIsNone(aggregate.read(_Switch(False), DEV + 'PIO.ALL',
+                                         [0, 1]))
+
+    def test_write(self):
+        owp = _Switch()
+        updates = dict((i, b'1') for i in range(8))
+        # partial updates are never aggregated
+        self.assertFalse(aggregate.write(owp, DEV + 'PIO.ALL',
+                                         {0: b'1', 2: b'1', 7: b'1'}))
+        self.assertEqual(owp.pio, [b'0'] * 8)
+        self.assertEqual(owp.log, [('read', DEV + 'PIO.ALL')])
+        updates[3] = b'0'
+        self.assertTrue(aggregate.write(owp, DEV + 'PIO.ALL', updates))
+        self.assertEqual(owp.pio, [b'1', b'1', b'1', b'0', b'1', b'1', b'1',
+                                   b'1'])
+        self.assertEqual(owp.log[1:], [('read', DEV + 'PIO.ALL'),
+                                       ('write', DEV + 'PIO.ALL')])
+        self.assertFalse(aggregate.write(_Switch(False), DEV + 'PIO.ALL',
+                                         updates))
+
+    def test_read_many(self):
+        paths = [DEV + 'PIO.3', DEV + 'temperature', DEV + 'PIO.2',
+                 DEV + 'nonexistent', DEV + 'PIO.3']
+        expected = [1, 21.5, 0, protocol.OwnetError, 1]
+        for owp in (_Switch(), _Switch(False)):
+            owp.pio[3] = b'1'
+            res = poller.read_many(owp, paths, float)
+            for value, exp in zip(res, expected):
+                if isinstance(exp, type):
+                    self.assertIsInstance(value, exp)
+                else:
+                    self.assertEqual(value, exp)
+        owp = _Switch()
+        poller.read_many(owp, paths)
+        self.assertEqual([i[1] for i in owp.log],
+                         [DEV + 'PIO.ALL', DEV + 'temperature',
+                          DEV + 'nonexistent'])
+        owp = _Switch()
+        poller.read_many(owp, paths, aggregate=False)
+        self.assertEqual(len(owp.log), len(paths))
+
+    def test_writebehind(self):
+        owp = _Switch()
+        with writebehind.WriteBehind(owp, delay=0.1) as wb:
+            wb._proxy = owp
+            pending = [wb.write(DEV + 'PIO.%d' % i, b'1') for i in (1, 4, 5)]
+            pending.append(wb.write(DEV + 'PIO.4', b'0'))
+            other = wb.write(DEV + 'temperature', b'0')
+            for i in pending:
+                self.assertIsNone(i.result(1))
+            self.assertIsInstance(other.exception(1), protocol.OwnetError)
+            # all channels: a single aggregate write
+            pending = [wb.write(DEV + 'PIO.%d' % i, b'1') for i in range(8)]
+            for i in pending:
+                self.assertIsNone(i.result(1))
+        self.assertEqual(owp.pio, [b'1'] * 8)
+        self.assertEqual(owp.log, [('read', DEV + 'PIO.ALL'),
+                                   ('write', DEV + 'PIO.1'),
+                                   ('write', DEV + 'PIO.4'),
+                                   ('write', DEV + 'PIO.5'),
+                                   ('write', DEV + 'temperature'),
+                                   ('read', DEV + 'PIO.ALL'),
+                                   ('write', DEV + 'PIO.ALL')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+import pickle
+import socket
+
+from pyownet import protocol, breaker
+from . import (HOST, PORT)
+
+
+class Test_CircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        # a tcp port with no listener
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        self.dead = protocol._Proxy(socket.AF_INET, sock.getsockname())
+        sock.close()
+
+    def test_trip(self):
+        brk = breaker.CircuitBreaker(failure_threshold=2,
+                                     recovery_timeout=60)
+        self.dead.breaker = brk
+        for _ in range(2):
+            self.assertEqual(brk.state, brk.CLOSED)
+            self.assertRaises(protocol.ConnError, self.dead.ping)
+        self.assertEqual(brk.state, brk.OPEN)
+        self.assertRaises(protocol.CircuitOpen, self.dead.ping)
+        owp = protocol.clone(self.dead, persistent=True)
+        self.assertIs(owp.breaker, brk)
+        self.assertRaises(protocol.CircuitOpen, owp.read, '/')
+        met = brk.metrics()
+        self.assertEqual(met['state'], brk.OPEN)
+        self.assertEqual((met['calls'], met['failures'], met['rejected'],
+                          met['opened']), (4, 2, 2, 1))
+
+    def test_recovery(self):
+        brk = breaker.CircuitBreaker(failure_threshold=1,
+                                     recovery_timeout=0)
+        self.dead.breaker = brk
+        self.assertRaises(protocol.ConnError, self.dead.ping)
+        self.assertEqual(brk.state, brk.OPEN)
+        # failed probe
+        self.assertRaises(protocol.ConnError, self.dead.ping)
+        self.assertEqual(brk.state, brk.OPEN)
+        self.assertEqual(brk.metrics()['probes'], 1)
+        try:
+            owp = protocol.proxy(HOST, PORT)
+        except protocol.ConnError as exc:
+            self.skipTest('no owserver on %s:%s, got:%s' % (HOST, PORT, exc))
+        # successful probe
+        owp.breaker = brk
+        self.assertIsNone(owp.ping())
+        self.assertEqual(brk.state, brk.CLOSED)
+        self.assertEqual(brk.metrics()['probes'], 2)
+
+    def test_registry(self):
+        addr = self.dead._family, self.dead._sockaddr
+        brk = breaker.circuit_breaker(*addr, failure_threshold=1)
+        self.assertIs(breaker.circuit_breaker(*addr), brk)
+        self.dead.breaker = brk
+        self.assertRaises(protocol.ConnError, self.dead.ping)
+        self.assertRaises(protocol.CircuitOpen, self.dead.ping)
+        self.assertIs(pickle.loads(pickle.dumps(self.dead)).breaker, brk)
+        brk = breaker.CircuitBreaker()
+        self.assertEqual(pickle.loads(pickle.dumps(brk)).metrics(),
+                         brk.metrics())
+        self.assertRaises(protocol.ConnError, protocol.proxy, *addr[1],
+                          breaker=True)
+        self.assertRaises(ValueError, breaker.CircuitBreaker, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+if sys.version_info < (3, ):
+    from urllib2 import (urlopen, HTTPError)
+else:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+import json
+import time
+import socket
+import threading
+
+from pyownet import protocol, exporter
+from . import (HOST, PORT)
+
+
+class Test_Exporter(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.proxy = protocol.proxy(HOST, PORT)
+        except protocol.ConnError as exc:
+            raise unittest.SkipTest('no owserver on %s:%s, got:%s' %
+                                    (HOST, PORT, exc))
+        cls.paths = [i + 'type' for i in cls.proxy.dir()] + ['/nonexistent']
+
+    def test_arguments(self):
+        self.assertRaises(TypeError, exporter.Exporter, object(), [])
+        self.assertRaises(ValueError, exporter.Exporter, self.proxy, [],
+                          interval=0)
+        self.assertRaises(ValueError, exporter.Exporter, self.proxy, [],
+                          max_workers=0)
+
+    def test_refresh(self):
+        exp = exporter.Exporter(self.proxy, self.paths)
+        exp.refresh()
+        samples = exp.samples()
+        self.assertEqual(sorted(samples), sorted(self.paths))
+        for path in self.paths[:-1]:
+            self.assertEqual(samples[path].value, self.proxy.read(path))
+            self.assertIsNone(samples[path].error)
+        self.assertIsNone(samples['/nonexistent'].value)
+        self.assertEqual(samples['/nonexistent'].errors, 1)
+        self.assertEqual(exp.cycles, 1)
+        res = json.loads(exp.json())
+        self.assertEqual(res['/nonexistent']['errors'], 1)
+        text = exp.prometheus()
+        self.assertIn('owfs_read_errors_total{path="/nonexistent"} 1\n',
+                      text)
+        self.assertIn('owfs_refresh_cycles_total 1\n', text)
+
+    def test_serve(self):
+        with exporter.Exporter(self.proxy, self.paths, interval=0.05,
+                               max_workers=2) as exp:
+            exp.start()
+            self.assertRaises(ValueError, exp.start)
+            server = exp.serve(port=0)
+            url = 'http://127.0.0.1:%d/' % server.server_address[1]
+            time.sleep(0.2)
+            self.assertGreater(exp.cycles, 1)
+            res = json.loads(urlopen(url + 'json').read().decode())
+            self.assertEqual(sorted(res), sorted(self.paths))
+            text = urlopen(url + 'metrics').read().decode()
+            self.assertIn('# TYPE owfs_value gauge\n', text)
+            self.assertRaises(HTTPError, urlopen, url + 'other')
+        cycles = exp.cycles
+        time.sleep(0.1)
+        self.assertEqual(exp.cycles, cycles)
+
+
+class _ScriptedProxy(protocol._Proxy):
+    # replies from a dictionary, no owserver needed
+
+    def __init__(self, values):
+        super(_ScriptedProxy, self).__init__(socket.AF_INET,
+                                             ('127.0.0.1', 0))
+        self.values = values
+
+    def read(self, path, timeout=0):
+        value = self.values[path]
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+class Test_output(unittest.TestCase):
+
+    def test_values(self):
+        owp = _ScriptedProxy({'/t': b'  21.5', '/inf': b'inf',
+                              '/nan': b'nan', '/bin': b'\xff\x00',
+                              '/bug': KeyError('x')})
+        exp = exporter.Exporter(owp, sorted(owp.values))
+        exp.refresh()
+        res = json.loads(exp.json())
+        self.assertEqual(res['/t']['value'], 21.5)
+        self.assertEqual(res['/bin']['value'], 'ff00')
+        self.assertEqual(res['/nan']['value'], 'nan')
+        # unexpected exceptions are recorded as errors
+        self.assertIsNone(res['/bug']['value'])
+        self.assertEqual(res['/bug']['errors'], 1)
+        self.assertIn('KeyError', res['/bug']['error'])
+        text = exp.prometheus()
+        for line in ('owfs_value{path="/t"} 21.5 ',
+                     'owfs_value{path="/inf"} +Inf ',
+                     'owfs_value{path="/nan"} NaN '):
+            self.assertIn(line, text)
+        self.assertNotIn('path="/bin"} ', text.split('# HELP')[1])
+
+
+class Test_unreachable(unittest.TestCase):
+
+    def test_refresh(self):
+        # a free port, where no owserver is listening
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        addr = sock.getsockname()
+        sock.close()
+        owp = protocol._Proxy(socket.AF_INET, addr)
+        exp = exporter.Exporter(owp, ['/a', '/b'], interval=0.01,
+                                max_workers=2)
+        exp.start()
+        tend = time.time() + 5
+        while exp.cycles < 2 and time.time() < tend:
+            time.sleep(0.01)
+        self.assertGreaterEqual(exp.cycles, 2)
+        samples = exp.samples()
+        self.assertIsNotNone(samples['/a'].error)
+        self.assertGreaterEqual(samples['/b'].errors, 2)
+        closer = threading.Thread(target=exp.close)
+        closer.daemon = True
+        closer.start()
+        closer.join(5)
+        self.assertFalse(closer.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+import pickle
+import socket
+
+from pyownet import protocol, failover
+from . import (HOST, PORT)
+
+
+class Test_Failover(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.proxy = protocol.proxy(HOST, PORT)
+        except protocol.ConnError as exc:
+            raise unittest.SkipTest('no owserver on %s:%s, got:%s' %
+                                    (HOST, PORT, exc))
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        cls.dead = sock.getsockname()
+        sock.close()
+
+    def test_resolve(self):
+        addrs = failover.resolve(HOST, PORT, ttl=60)
+        self.assertIn((self.proxy._family, self.proxy._sockaddr), addrs)
+        self.assertIs(failover.resolve(HOST, PORT, ttl=60), addrs)
+        self.assertRaises(protocol.ConnError, failover.resolve,
+                          'nonexistent.fake', PORT)
+
+    def test_proxy_resolve(self):
+        # also proxies with no failover resolve names via the cache
+        failover._gai_cache.pop((HOST, PORT), None)
+        owp = protocol.proxy(HOST, PORT)
+        self.assertIsNone(owp.failover)
+        self.assertIn((owp._family, owp._sockaddr),
+                      failover._gai_cache[(HOST, PORT)][1])
+
+    def test_pickle(self):
+        fo = failover.Failover([(HOST, PORT)])
+        addrs = fo.addresses()
+        dup = pickle.loads(pickle.dumps(fo))
+        self.assertIsNone(dup._addrs)
+        self.assertEqual(dup.addresses(), addrs)
+        # state saved by older versions
+        dup.__setstate__({'servers': fo.servers, 'ttl': fo.ttl,
+                          '_addrs': None, '_expiry': None})
+        self.assertEqual(dup.addresses(), addrs)
+
+    def test_failover(self):
+        owp = protocol.proxy(*self.dead, alternates=[(HOST, PORT)])
+        live = (owp._family, owp._sockaddr)
+        self.assertEqual(live, (self.proxy._family, self.proxy._sockaddr))
+        self.assertEqual(owp.failover.addresses()[0],
+                         (socket.AF_INET, self.dead))
+        for persistent in (False, True):
+            owp = protocol.clone(owp, persistent)
+            owp._switch_address((socket.AF_INET, self.dead))
+            self.assertEqual(owp.dir(), self.proxy.dir())
+            self.assertEqual((owp._family, owp._sockaddr), live)
+        owp = pickle.loads(pickle.dumps(owp))
+        self.assertEqual(owp.failover.servers, [self.dead, (HOST, int(PORT))])
+
+    def test_stale_address(self):
+        owp = protocol.clone(self.proxy, persistent=False)
+        owp.failover = failover.Failover([(HOST, PORT)])
+        owp._switch_address((socket.AF_INET, self.dead))
+        self.assertIsNone(owp.ping())
+        self.assertIn((owp._family, owp._sockaddr),
+                      owp.failover.addresses())
+
+    def test_exceptions(self):
+        owp = protocol.clone(self.proxy, persistent=False)
+        owp.failover = failover.Failover([self.dead])
+        owp._switch_address((socket.AF_INET, self.dead))
+        self.assertRaises(protocol.ConnError, owp.ping)
+        self.assertRaises(protocol.ConnError, protocol.proxy, *self.dead,
+                          failover=True)
+        self.assertRaises(ValueError, failover.Failover, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+import time
+import pickle
+import socket
+import threading
+
+from pyownet import protocol, hedge
+from . import (HOST, PORT)
+
+
+class _ScriptedProxy(protocol._Proxy):
+    # proxy whose requests take the delays given in 'script', or fail
+    # after (delay, exception) items
+
+    def __init__(self, script):
+        super(_ScriptedProxy, self).__init__(socket.AF_INET,
+                                             ('127.0.0.1', 0))
+        self.script = list(script)
+        self.lock = threading.Lock()
+        self.sent = 0
+
+    def _transact(self, msg, timeout=0):
+        with self.lock:
+            self.sent += 1
+            delay = self.script.pop(0) if self.script else 0
+        delay, exc = delay if isinstance(delay, tuple) else (delay, None)
+        time.sleep(delay)
+        if exc is not None:
+            raise exc
+        return 0, str(delay).encode()
+
+
+class Test_Hedger(unittest.TestCase):
+
+    def _proxy(self, hedger, script):
+        owp = _ScriptedProxy([0] * hedger.min_samples + script)
+        owp.hedger = hedger
+        self.addCleanup(hedger.close)
+        for _ in range(hedger.min_samples):
+            owp.read('/learn')
+        return owp
+
+    def test_arguments(self):
+        self.assertRaises(ValueError, hedge.Hedger, percentile=100)
+        self.assertRaises(ValueError, hedge.Hedger, max_rate=2)
+        self.assertRaises(ValueError, hedge.Hedger, window=8, min_samples=9)
+
+    def test_learn(self):
+        hedger = hedge.Hedger(min_samples=4, window=8)
+        owp = _ScriptedProxy([])
+        owp.hedger = hedger
+        key = (owp._sockaddr, protocol.MSG_READ)
+        for _ in range(3):
+            owp.read('/learn')
+            self.assertIsNone(hedger.delay(*key))
+        owp.read('/learn')
+        self.assertGreaterEqual(hedger.delay(*key), hedger.min_delay)
+        self.assertIsNone(hedger.delay(owp._sockaddr, protocol.MSG_DIRALL))
+
+    def test_hedge_wins(self):
+        hedger = hedge.Hedger(min_samples=4, window=8, min_delay=0.01)
+        owp = self._proxy(hedger, [0.5, 0])
+        tic = time.time()
+        self.assertEqual(owp.read('/slow'), b'0')
+        self.assertLess(time.time() - tic, 0.4)
+        metrics = hedger.metrics()
+        self.assertEqual((metrics['hedged'], metrics['won']), (1, 1))
+        # writes are never hedged
+        owp.sendmess(protocol.MSG_WRITE, b'/slow\x001', size=1)
+        self.assertEqual(hedger.metrics()['calls'], 5)
+
+    def test_primary_wins(self):
+        hedger = hedge.Hedger(min_samples=4, window=8, min_delay=0.01)
+        owp = self._proxy(hedger, [0.05, 0.5])
+        self.assertEqual(owp.read('/slow'), b'0.05')
+        metrics = hedger.metrics()
+        self.assertEqual((metrics['hedged'], metrics['won']), (1, 0))
+
+    def test_rate_cap(self):
+        hedger = hedge.Hedger(min_samples=4, window=8, min_delay=0.01,
+                              max_rate=0, burst=1)
+        owp = self._proxy(hedger, [0.2, 0, 0.05])
+        self.assertEqual(owp.read('/slow'), b'0')
+        self.assertEqual(owp.read('/slow'), b'0.05')
+        metrics = hedger.metrics()
+        self.assertEqual((metrics['hedged'], metrics['suppressed']), (1, 1))
+
+    def test_errors(self):
+        hedger = hedge.Hedger(min_samples=4, window=8, min_delay=0.05)
+        refused = protocol.ConnError(111, 'refused')
+        owp = self._proxy(hedger, [(0, refused), (0.2, refused), 0,
+                                   (0.2, refused), (0, refused)])
+        # fails before hedge delay: no hedge
+        self.assertRaises(protocol.ConnError, owp.read, '/fail')
+        self.assertEqual(hedger.metrics()['hedged'], 0)
+        # primary fails after hedge is sent, hedge replies
+        self.assertEqual(owp.read('/fail'), b'0')
+        # both fail
+        self.assertRaises(protocol.ConnError, owp.read, '/fail')
+        self.assertEqual(hedger.metrics()['hedged'], 2)
+
+    def test_close(self):
+        with hedge.Hedger(min_samples=4, window=8, min_delay=0.01) as hedger:
+            owp = self._proxy(hedger, [0.2, 0])
+            self.assertEqual(owp.read('/slow'), b'0')
+            # a proxy does not shut down the hedger, maybe shared
+            with hedger.wrap(owp):
+                pass
+            self.assertTrue([i for i in threading.enumerate()
+                             if i.name == 'pyownet-hedge'])
+        # the primary request, still running, was waited for
+        self.assertEqual(owp.script, [])
+        self.assertFalse([i for i in threading.enumerate()
+                          if i.name == 'pyownet-hedge'])
+        # hedger is still usable
+        self.assertEqual(owp.read('/fast'), b'0')
+        hedger.close()
+        self.assertEqual(hedger.metrics()['calls'], 6)
+
+    def test_pickle(self):
+        hedger = hedge.Hedger(percentile=90, min_samples=4, window=8)
+        dup = pickle.loads(pickle.dumps(hedger))
+        self.assertEqual((dup.percentile, dup.window), (90, 8))
+
+
+class Test_hedged_proxy(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.proxy = protocol.proxy(HOST, PORT)
+        except protocol.ConnError as exc:
+            raise unittest.SkipTest('no owserver on %s:%s, got:%s' %
+                                    (HOST, PORT, exc))
+
+    def test_requests(self):
+        hedger = hedge.Hedger(min_samples=4, window=8)
+        for persistent in (False, True):
+            owp = hedger.wrap(protocol.clone(self.proxy, persistent))
+            self.assertIsNone(self.proxy.hedger)
+            for _ in range(3):
+                self.assertEqual(owp.dir(), self.proxy.dir())
+                for i in owp.dir():
+                    self.assertEqual(owp.read(i + 'type'),
+                                     self.proxy.read(i + 'type'))
+                    self.assertTrue(owp.present(i))
+            self.assertRaises(protocol.OwnetError, owp.read, '/')
+            with owp:
+                pass
+        hedger.close()
+        self.assertGreater(hedger.metrics()['calls'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
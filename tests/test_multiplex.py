@@ -0,0 +1,78 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from pyownet import protocol
+try:
+    from pyownet import multiplex
+except ImportError:
+    multiplex = None
+from . import (HOST, PORT)
+
+
+@unittest.skipIf(multiplex is None, 'selectors module not available')
+class Test_Multiplexer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.proxy = protocol.proxy(HOST, PORT)
+        except protocol.ConnError as exc:
+            raise unittest.SkipTest('no owserver on %s:%s, got:%s' %
+                                    (HOST, PORT, exc))
+
+    def test_requests(self):
+        with multiplex.Multiplexer(max_connections=2) as mux:
+            reqs = [mux.ping(self.proxy),
+                    mux.present(self.proxy, '/'),
+                    mux.present(self.proxy, '/nonexistent'),
+                    mux.dir(self.proxy),
+                    mux.read(self.proxy, '/'),
+                    mux.submit(self.proxy, protocol.MSG_NOP, bytes())]
+            self.assertEqual(len(mux), len(reqs))
+            done = list(mux.as_completed())
+            self.assertEqual(len(mux), 0)
+        self.assertEqual(sorted(map(id, done)), sorted(map(id, reqs)))
+        self.assertIsNone(reqs[0].result())
+        self.assertTrue(reqs[1].result())
+        self.assertFalse(reqs[2].result())
+        self.assertEqual(reqs[3].result(), self.proxy.dir())
+        self.assertIsInstance(reqs[4].exception(), protocol.OwnetError)
+        self.assertRaises(protocol.OwnetError, reqs[4].result)
+        self.assertEqual(reqs[5].result(), self.proxy.sendmess(
+            protocol.MSG_NOP, bytes()))
+
+    def test_read(self):
+        paths = [i + 'type' for i in self.proxy.dir()]
+        with multiplex.Multiplexer() as mux:
+            reqs = [mux.read(self.proxy, i) for i in paths]
+            self.assertRaises(ValueError, reqs[0].result)
+            for req in mux.as_completed():
+                self.assertEqual(req.result(), self.proxy.read(req.path))
+
+    def test_get(self):
+        paths = ['/'] + [i + 'type' for i in self.proxy.dir()]
+        with multiplex.Multiplexer() as mux:
+            reqs = [mux.get(self.proxy, i) for i in paths]
+            for req in mux.as_completed():
+                self.assertEqual(req.result(), self.proxy.get(req.path))
+            self.assertTrue(all(req.done() for req in reqs))
+
+    def test_exceptions(self):
+        mux = multiplex.Multiplexer()
+        self.assertRaises(TypeError, mux.ping, 1)
+        self.assertRaises(TypeError, mux.dir, self.proxy, 1)
+        self.assertRaises(TypeError, mux.write, self.proxy, '/', 1)
+        self.assertRaises(ValueError, mux.read, self.proxy, '/',
+                          protocol.MAX_PAYLOAD + 1)
+        mux.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from pyownet import protocol, poller
+from . import (HOST, PORT)
+
+
+class Test_split(unittest.TestCase):
+
+    def test_split(self):
+        paths = ['/%d' % i for i in range(10)]
+        for n in range(1, 13):
+            chunks = list(poller._split(paths, n))
+            self.assertEqual(len(chunks), min(n, len(paths)))
+            self.assertEqual(sum(chunks, []), paths)
+            sizes = [len(i) for i in chunks]
+            self.assertLessEqual(max(sizes) - min(sizes), 1)
+        self.assertEqual(list(poller._split([], 4)), [[]])
+
+
+class Test_ShardedPoller(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.proxy = protocol.proxy(HOST, PORT)
+        except protocol.ConnError as exc:
+            raise unittest.SkipTest('no owserver on %s:%s, got:%s' %
+                                    (HOST, PORT, exc))
+
+    def test_poll(self):
+        paths = self.proxy.dir() + ['/nonexistent']
+        with poller.ShardedPoller(processes=2) as pp:
+            res = pp.poll([(self.proxy, []),
+                           (self.proxy, [i + 'type' for i in paths])])
+        self.assertEqual(res[0], {})
+        self.assertEqual(len(res[1]), len(paths))
+        for path in paths[:-1]:
+            self.assertEqual(res[1][path + 'type'],
+                             self.proxy.read(path + 'type'))
+        self.assertIsInstance(res[1]['/nonexistenttype'],
+                              protocol.OwnetError)
+
+    def test_closed(self):
+        pp = poller.ShardedPoller(processes=1)
+        pp.close()
+        self.assertRaises(ValueError, pp.poll, [(self.proxy, ['/'])])
+
+
+if __name__ == '__main__':
+    unittest.main()
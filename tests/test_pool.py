@@ -0,0 +1,119 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+import time
+import socket
+import threading
+
+from pyownet import protocol, pool
+from . import (HOST, PORT)
+
+
+class Test_ConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        # no connection is opened by the pool itself
+        self.base = protocol._Proxy(socket.AF_INET, ('127.0.0.1', 0))
+
+    def start(self, cpool, priority, order):
+        def worker():
+            with cpool.connection(priority):
+                order.append(priority)
+        thread = threading.Thread(target=worker)
+        thread.start()
+        # wait until queued
+        while not cpool.metrics()['priorities'].get(
+                priority, {}).get('waiting'):
+            time.sleep(0.001)
+        return thread
+
+    def test_arguments(self):
+        self.assertRaises(TypeError, pool.ConnectionPool, object())
+        self.assertRaises(ValueError, pool.ConnectionPool, self.base, 0)
+        self.assertRaises(ValueError, pool.ConnectionPool, self.base, 2, 2)
+
+    def test_priority(self):
+        cpool = pool.ConnectionPool(self.base, size=1)
+        order = []
+        member = cpool._acquire(pool.NORMAL)
+        threads = [self.start(cpool, pool.BULK, order),
+                   self.start(cpool, pool.INTERACTIVE, order)]
+        self.assertEqual(cpool.metrics()['busy'], 1)
+        cpool._release(member, pool.NORMAL)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [pool.INTERACTIVE, pool.BULK])
+        metrics = cpool.metrics()
+        self.assertEqual(metrics['idle'], 1)
+        for prio in (pool.INTERACTIVE, pool.BULK):
+            stats = metrics['priorities'][prio]
+            self.assertEqual((stats['requests'], stats['waiting']), (1, 0))
+            self.assertGreater(stats['wait_max'], 0)
+        self.assertLessEqual(metrics['priorities'][pool.INTERACTIVE]
+                             ['wait_max'],
+                             metrics['priorities'][pool.BULK]['wait_max'])
+
+    def test_reserved(self):
+        cpool = pool.ConnectionPool(self.base, size=2, reserved=1)
+        order = []
+        with cpool.connection(pool.BULK):
+            thread = self.start(cpool, pool.BULK, order)
+            self.assertEqual(cpool.metrics()['idle'], 1)
+            with cpool.connection(pool.INTERACTIVE):
+                self.assertEqual(cpool.metrics()['idle'], 0)
+            self.assertEqual(order, [])
+        thread.join()
+        self.assertEqual(order, [pool.BULK])
+
+    def test_options(self):
+        base = protocol._PersistentProxy(socket.AF_INET, ('127.0.0.1', 0))
+        base.max_payload = 1024
+        # e.g. state of a proxy subclass
+        base.lock = threading.Lock()
+        cpool = pool.ConnectionPool(base, size=1)
+        owp = cpool.proxy()
+        self.assertEqual(owp.max_payload, 1024)
+        # per proxy state is not shared with the base proxy
+        self.assertIsNot(owp._idle, base._idle)
+        self.assertIsNot(owp._uncached_reads, base._uncached_reads)
+        self.assertFalse(hasattr(owp, 'lock'))
+
+
+class Test_PooledProxy(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.proxy = protocol.proxy(HOST, PORT)
+        except protocol.ConnError as exc:
+            raise unittest.SkipTest('no owserver on %s:%s, got:%s' %
+                                    (HOST, PORT, exc))
+
+    def test_requests(self):
+        with pool.ConnectionPool(self.proxy, size=2, reserved=1) as cpool:
+            owp = cpool.proxy(pool.BULK)
+            self.assertIs(owp.errmess, self.proxy.errmess)
+            self.assertIsNone(owp.ping())
+            self.assertEqual(owp.dir(), self.proxy.dir())
+            for i in owp.dir():
+                self.assertEqual(owp.read(i + 'type'),
+                                 self.proxy.read(i + 'type'))
+            self.assertRaises(protocol.OwnetError, owp.read, '/')
+            prep = cpool.proxy(pool.INTERACTIVE).prepare_read('/')
+            self.assertRaises(protocol.OwnetError, prep.read)
+            # connections are persistent, last used is reused first
+            self.assertEqual(sum(m.conn is not None for m in cpool._members),
+                             1)
+            stats = cpool.metrics()['priorities']
+            self.assertEqual(stats[pool.INTERACTIVE]['requests'], 1)
+        self.assertTrue(all(m.conn is None for m in cpool._members))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,10 @@ if sys.version_info < (2, 7, ):
 else:
     import unittest
 
+import pickle
+import socket
+import threading
+
 from pyownet import protocol
 from . import (HOST, PORT, FAKEHOST, FAKEPORT)
 
@@ -41,6 +45,84 @@ class _TestProxyMix(object):
             if self.proxy.present(i + 'temperature'):
                 self.proxy.read(i + 'temperature')
 
+    def test_prepare_read(self):
+        for i in self.proxy.dir(bus=False):
+            prep = self.proxy.prepare_read(i + 'type')
+            self.assertEqual(prep.read(), self.proxy.read(i + 'type'))
+            self.assertEqual(prep.read(), self.proxy.read(i + 'type'))
+        prep = self.proxy.prepare_read('/nonexistent')
+        self.assertRaises(protocol.OwnetError, prep.read)
+        self.assertRaises(ValueError, self.proxy.prepare_read, '/',
+                          protocol.MAX_PAYLOAD + 1)
+        self.assertRaises(TypeError, self.proxy.prepare_read, 1)
+
+    def test_max_staleness(self):
+        for i in self.proxy.dir(bus=False):
+            path = i + 'type'
+            data = self.proxy.read(path, max_staleness=0)
+            tic = self.proxy._uncached_reads[path]
+            self.assertEqual(self.proxy.read(path, max_staleness=60), data)
+            self.assertEqual(self.proxy._uncached_reads[path], tic)
+            self.assertEqual(self.proxy.read(path, max_staleness=0), data)
+            self.assertGreater(self.proxy._uncached_reads[path], tic)
+        self.assertRaises(protocol.OwnetError, self.proxy.read,
+                          '/nonexistent', max_staleness=0)
+        self.assertNotIn('/nonexistent', self.proxy._uncached_reads)
+
+    def test_lazy_dir(self):
+        listing = self.proxy.dir(lazy=True)
+        self.assertIsInstance(listing, protocol.Listing)
+        self.assertEqual(listing, self.proxy.dir())
+        self.assertEqual(len(listing), len(self.proxy.dir()))
+        for i in listing:
+            self.assertIn(i, listing)
+
+    def test_max_payload(self):
+        owp = protocol.clone(self.proxy, persistent=False)
+        owp.max_payload = 16
+        self.assertRaises(ValueError, owp.read, '/', 17)
+        self.assertRaises(ValueError, owp.prepare_read, '/', 17)
+        self.assertRaises(protocol.ProtocolError, owp.dir)
+        owp.max_payload = 2 * protocol.MAX_PAYLOAD
+        self.assertEqual(owp.dir(), self.proxy.dir())
+        self.assertRaises(protocol.OwnetError, owp.read, '/nonexistent',
+                          2 * protocol.MAX_PAYLOAD)
+        self.assertEqual(protocol.clone(owp).max_payload, owp.max_payload)
+
+    def test_small_payload(self):
+        # default sizes follow max_payload
+        owp = protocol.proxy(HOST, PORT, max_payload=1024)
+        self.assertGreater(len(owp.errmess), 0)
+        for i in owp.dir():
+            value = self.proxy.read(i + 'type')
+            self.assertEqual(owp.read(i + 'type'), value)
+            self.assertEqual(owp.prepare_read(i + 'type').read(), value)
+            self.assertEqual(owp.get(i + 'type'), value)
+        self.assertRaises(ValueError, owp.read, '/', 1025)
+
+    def test_get(self):
+        self.assertEqual(self.proxy.get(), self.proxy.dir())
+        for i in self.proxy.dir(bus=False):
+            self.assertEqual(self.proxy.get(i), self.proxy.dir(i))
+            self.assertEqual(self.proxy.get(i.rstrip('/'), slash=False),
+                             self.proxy.dir(i, slash=False))
+            self.assertEqual(self.proxy.get(i + 'type'),
+                             self.proxy.read(i + 'type'))
+        self.assertRaises(protocol.OwnetError, self.proxy.get, '/nonexistent')
+
+    def test_iterdir(self):
+        self.assertEqual(list(self.proxy.iterdir()),
+                         self.proxy.dir(slash=False))
+        for i in self.proxy.dir(bus=False):
+            self.assertEqual(list(self.proxy.iterdir(i)),
+                             self.proxy.dir(i, slash=False))
+        it = self.proxy.iterdir()
+        next(it)
+        it.close()
+        self.proxy.ping()
+        it = self.proxy.iterdir('/nonexistent')
+        self.assertRaises(protocol.OwnetError, list, it)
+
     def test_exceptions(self):
         self.assertRaises(protocol.OwnetError, self.proxy.dir, '/nonexistent')
         self.assertRaises(protocol.OwnetError, self.proxy.read, '/')
@@ -48,6 +130,50 @@ class _TestProxyMix(object):
         self.assertRaises(TypeError, self.proxy.write, '/', 1)
         self.assertRaises(TypeError, self.proxy.write, 1, b'abc')
 
+    def test_pickle(self):
+        self.proxy.ping()
+        owp = pickle.loads(pickle.dumps(self.proxy))
+        self.assertIs(type(owp), type(self.proxy))
+        self.assertEqual(owp.flags, self.proxy.flags)
+        self.assertIsNone(getattr(owp, 'conn', None))
+        self.assertIsNone(owp.ping())
+
+    def test_clone_pickle(self):
+        # clones share no connection with the original proxy
+        self.proxy.ping()
+        for persistent in (False, True):
+            owp = protocol.clone(self.proxy, persistent)
+            self.assertIsNone(getattr(owp, 'conn', None))
+            dup = pickle.loads(pickle.dumps(owp))
+            self.assertIs(type(dup), type(owp))
+            self.assertIsNone(dup.ping())
+            if persistent:
+                self.assertIsNot(owp._idle, getattr(self.proxy, '_idle', None))
+                owp.close_connection()
+                dup.close_connection()
+
+    def test_threads(self):
+        # concurrent requests on a single proxy object
+        paths = [i + 'type' for i in self.proxy.dir()]
+        expected = [self.proxy.read(i) for i in paths]
+        results = []
+
+        def worker():
+            for _ in range(20):
+                values = [self.proxy.read(i) for i in paths]
+                results.append(values == expected)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [True] * 160)
+        if isinstance(self.proxy, protocol._PersistentProxy):
+            self.assertLessEqual(len(self.proxy._idle), 8)
+            self.proxy.close_connection()
+            self.assertIsNone(self.proxy.conn)
+
     def test_context(self):
         with self.proxy as owp:
             try:
@@ -59,6 +185,22 @@ class _TestProxyMix(object):
         except AttributeError:
             pass
 
+    def test_conn(self):
+        if not isinstance(self.proxy, protocol._PersistentProxy):
+            self.skipTest('not a persistent proxy')
+        owp = protocol.clone(self.proxy)
+        owp.ping()
+        old = owp.conn
+        self.assertIsNotNone(old)
+        # assigning conn replaces the idle connections
+        owp.conn = None
+        self.assertIsNone(owp.conn)
+        owp.ping()
+        self.assertIsNot(owp.conn, old)
+        owp.conn = owp.conn
+        self.assertEqual(len(owp._idle), 1)
+        owp.close_connection()
+
 
 class Test_Proxy(_TestProxyMix, unittest.TestCase, ):
 
@@ -116,6 +258,130 @@ class Test_clone_TF(Test_PersistentProxy):
         self.proxy = protocol.clone(self.__class__.proxy, persistent=False)
 
 
+class Test_staleness(unittest.TestCase):
+
+    def test_stale(self):
+        owp = protocol._Proxy(0, None)
+        self.assertTrue(owp._stale('/a', 100, 10))
+        owp._uncached_reads['/a'] = 95
+        self.assertFalse(owp._stale('/a', 100, 10))
+        self.assertTrue(owp._stale('/a', 100, 4))
+        owp.cache_timeouts = {'volatile': 15, 'stable': 300}
+        self.assertTrue(owp._stale('/b', 100, 60))
+        self.assertFalse(owp._stale('/b', 100, 300))
+        self.assertIsNone(protocol._Proxy.cache_timeouts)
+
+
+class Test_ClientProtocol(unittest.TestCase):
+
+    @staticmethod
+    def frame(payload=0, ret=0, flags=0, data=b'', version=0):
+        header = protocol._FromServerHeader(
+            version=version, payload=payload, ret=ret, flags=flags,
+            size=len(data))
+        return header + data.ljust(max(payload, 0), b'\x00')
+
+    def events(self, proto, data, chunk=1):
+        # feed data in chunks, collect events
+        res = []
+        for i in range(0, len(data), chunk):
+            proto.receive_data(data[i:i + chunk])
+            event = proto.next_event()
+            while event is not protocol.NEED_DATA:
+                res.append(event)
+                event = proto.next_event()
+        return res
+
+    def test_reply(self):
+        for chunk in (1, 5, 24, 100):
+            proto = protocol.ClientProtocol()
+            msg = proto.send_request(protocol.MSG_READ, b'/a\x00', 0, 10)
+            self.assertEqual(len(msg),
+                             protocol._ToServerHeader.header_size + 3)
+            self.assertRaises(ValueError, proto.send_encoded, msg)
+            stream = b''.join([self.frame(-1), self.frame(-1),
+                               self.frame(4, 3, data=b'abc')])
+            evs = self.events(proto, stream, chunk)
+            self.assertEqual([type(e) for e in evs],
+                             [protocol.KeepAlive, protocol.KeepAlive,
+                              protocol.Reply])
+            self.assertEqual((evs[-1].ret, evs[-1].data), (3, b'abc'))
+            self.assertTrue(proto.closed)
+
+    def test_persistence(self):
+        proto = protocol.ClientProtocol()
+        for i in range(3):
+            proto.send_request(protocol.MSG_NOP, b'', protocol.FLG_PERSISTENCE)
+            evs = self.events(proto, self.frame(
+                flags=protocol.FLG_PERSISTENCE), 7)
+            self.assertEqual([type(e) for e in evs],
+                             [protocol.PersistenceGranted, protocol.Reply])
+            self.assertTrue(proto.idle)
+        proto.send_request(protocol.MSG_NOP, b'', protocol.FLG_PERSISTENCE)
+        self.events(proto, self.frame())
+        self.assertTrue(proto.closed)
+        # persistence not requested
+        proto = protocol.ClientProtocol()
+        proto.send_request(protocol.MSG_NOP, b'', 0)
+        evs = self.events(proto, self.frame(flags=protocol.FLG_PERSISTENCE))
+        self.assertEqual([type(e) for e in evs], [protocol.Reply])
+        self.assertTrue(proto.closed)
+
+    def test_stream(self):
+        flg = protocol.FLG_PERSISTENCE
+        for flags in (0, flg):
+            proto = protocol.ClientProtocol()
+            proto.send_request(protocol.MSG_DIR, b'/\x00', flags)
+            stream = b''.join([self.frame(3, data=b'/a'), self.frame(-1),
+                               self.frame(3, data=b'/b')])
+            evs = self.events(proto, stream, 2)
+            self.assertEqual([e.data for e in evs if
+                              isinstance(e, protocol.Reply)], [b'/a', b'/b'])
+            self.assertTrue(proto.awaiting_reply)
+            evs = self.events(proto, self.frame(flags=flags))
+            self.assertEqual(type(evs[-1]), protocol.Reply)
+            self.assertFalse(proto.awaiting_reply)
+            self.assertEqual(proto.idle, bool(flags))
+        # error terminates listing
+        proto = protocol.ClientProtocol()
+        proto.send_request(protocol.MSG_DIR, b'/\x00', 0)
+        evs = self.events(proto, self.frame(ret=-1))
+        self.assertEqual(evs[-1].ret, -1)
+        self.assertTrue(proto.closed)
+
+    def test_bytes_wanted(self):
+        proto = protocol.ClientProtocol()
+        proto.send_request(protocol.MSG_NOP, b'', 0)
+        frame = self.frame(5, data=b'12345')
+        self.assertEqual(proto.bytes_wanted, 24)
+        proto.receive_data(frame[:10])
+        self.assertEqual(proto.bytes_wanted, 14)
+        proto.receive_data(frame[10:26])
+        self.assertEqual(proto.bytes_wanted, 3)
+
+    def test_errors(self):
+        cases = ((self.frame(version=1), protocol.MalformedHeader),
+                 (self.frame(protocol.MAX_PAYLOAD + 1),
+                  protocol.MalformedHeader),
+                 (self.frame(5, data=b'12345')[:-1], protocol.ShortRead),
+                 (self.frame()[:-1], protocol.ShortRead),
+                 (b'', protocol.ShortRead), )
+        for data, exc in cases:
+            proto = protocol.ClientProtocol()
+            proto.send_request(protocol.MSG_NOP, b'', 0)
+            proto.receive_data(data)
+            proto.receive_data(b'')
+            self.assertRaises(exc, proto.next_event)
+            self.assertTrue(proto.closed)
+        proto = protocol.ClientProtocol(max_payload=4)
+        proto.send_request(protocol.MSG_NOP, b'', 0)
+        proto.receive_data(self.frame(5, data=b'12345'))
+        self.assertRaises(protocol.MalformedHeader, proto.next_event)
+        proto = protocol.ClientProtocol()
+        proto.receive_data(b'\x00')
+        self.assertRaises(protocol.ProtocolError, proto.next_event)
+
+
 class Test_misc(unittest.TestCase):
 
     def test_exceptions(self):
@@ -129,6 +395,57 @@ class Test_misc(unittest.TestCase):
         self.assertRaises(TypeError, protocol._FromServerHeader, bad=0)
         self.assertRaises(TypeError, protocol._ToServerHeader, bad=0)
 
+    def test_listing(self):
+        listing = protocol.Listing(b'/a/,/b,/c/')
+        self.assertEqual(list(listing), ['/a/', '/b', '/c/'])
+        self.assertEqual(len(listing), 3)
+        for i in ('/a/', '/b', '/c/'):
+            self.assertIn(i, listing)
+        for i in ('/a', '/b/', '/c', '', 1):
+            self.assertNotIn(i, listing)
+        self.assertEqual(listing, protocol.Listing(b'/a/,/b,/c/'))
+        self.assertNotEqual(listing, ['/a/'])
+        self.assertEqual(list(protocol.Listing(b'')), [])
+        self.assertEqual(len(protocol.Listing(b'')), 0)
+
+    def test_wrap(self):
+        for pclass in (protocol._Proxy, protocol._PersistentProxy):
+            base = pclass(socket.AF_INET, ('127.0.0.1', 0))
+            owp = protocol._wrap(base, max_payload=1024)
+            self.assertIs(type(owp), pclass)
+            self.assertEqual(owp.max_payload, 1024)
+            self.assertEqual(base.max_payload, protocol.MAX_PAYLOAD)
+        self.assertRaises(TypeError, protocol._wrap, object())
+
+    def test_split_device(self):
+        split = protocol._split_device
+        self.assertEqual(split('/bus.0/1d.00001DAA0000/counters.A'),
+                         ('1D', 'counters.A'))
+        self.assertEqual(split('/1D00001DAA0000'), ('1D', ''))
+        self.assertEqual(split('/settings/timeout/volatile'),
+                         (None, 'settings/timeout/volatile'))
+        # no partial match of a longer name
+        for path in ('/1D.00001DAA0000FF/counters.A', '/1D00001DAA0000X'):
+            self.assertEqual(split(path)[0], None)
+
+    def test_get_result(self):
+        res = protocol._get_result
+        self.assertEqual(res('/', 0, b'/10.67C6697351FF/,/bus.0/'),
+                         ['/10.67C6697351FF/', '/bus.0/'])
+        self.assertEqual(res('/10.67C6697351FF/temperature', 12,
+                             b'         1.6'), b'         1.6')
+        self.assertEqual(res('/a', 0, b'1,0'), b'1,0')
+        self.assertEqual(res('/a/', 0, b''), [])
+        self.assertEqual(res('/a', 0, b''), b'')
+
+    def test_pickle_exceptions(self):
+        for exc in (protocol.MalformedHeader('bad version', b'\x00'),
+                    protocol.ShortRead(0, 24),
+                    protocol.ShortWrite(0, 24),
+                    protocol.OwnetTimeout(2.5, 2.0),
+                    protocol.OwnetError(2, 'legacy - No such entity', '/'), ):
+            self.assertEqual(str(pickle.loads(pickle.dumps(exc))), str(exc))
+
     def test_str(self):
         # check edge conditions in which _OwnetConnection.__str__ could fail
         try:
@@ -0,0 +1,90 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+import os
+import socket
+import shutil
+import tempfile
+
+from pyownet import protocol, replay
+from . import (HOST, PORT)
+
+
+class Test_replay(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, 'capture.owr')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def capture(self, data):
+        # write a synthetic capture of a single read request
+        rec = replay.Recorder(self.fname)
+        head = protocol._ToServerHeader(payload=3, type=protocol.MSG_READ,
+                                        flags=0, size=protocol.MAX_PAYLOAD)
+        msg = head + b'/a\x00'
+        rec._write(replay._OPEN, 1, replay._OPENDATA.pack(
+            socket.AF_INET, 0.0) + b"('127.0.0.1', 4304)")
+        rec._write(replay._SEND, 1, msg)
+        for chunk in data:
+            rec._write(replay._RECV, 1, chunk)
+        rec._write(replay._CLOSE, 1)
+        rec.close()
+
+    def test_replay(self):
+        ping = protocol._FromServerHeader(payload=-1)
+        reply = protocol._FromServerHeader(payload=3, ret=3, size=3) + b'abc'
+        self.capture([ping, reply[:10], reply[10:]])
+        rep = replay.Replayer(self.fname, scale=0)
+        self.assertEqual(len(rep), 1)
+        owp = rep.proxy()
+        self.assertEqual(owp._sockaddr, ('127.0.0.1', 4304))
+        self.assertEqual(owp.read('/a'), b'abc')
+        self.assertEqual(len(rep), 0)
+        self.assertRaises(protocol.ConnError, owp.read, '/a')
+
+    def test_strict(self):
+        reply = protocol._FromServerHeader(payload=3, ret=3, size=3) + b'abc'
+        self.capture([reply])
+        owp = replay.Replayer(self.fname, scale=0).proxy()
+        self.assertRaises(protocol.ProtocolError, owp.read, '/b')
+        self.capture([reply])
+        owp = replay.Replayer(self.fname, scale=0, strict=False).proxy()
+        self.assertEqual(owp.read('/b'), b'abc')
+
+    def test_truncated(self):
+        reply = protocol._FromServerHeader(payload=3, ret=3, size=3) + b'abc'
+        self.capture([reply[:-1]])
+        owp = replay.Replayer(self.fname, scale=0).proxy()
+        self.assertRaises(protocol.ShortRead, owp.read, '/a')
+
+    def test_badfile(self):
+        with open(self.fname, 'wb') as fil:
+            fil.write(b'garbage')
+        self.assertRaises(ValueError, replay.Replayer, self.fname)
+
+    def test_record(self):
+        try:
+            base = protocol.proxy(HOST, PORT)
+        except protocol.ConnError as exc:
+            self.skipTest('no owserver on %s:%s, got:%s' % (HOST, PORT, exc))
+        for persistent in (False, True):
+            with replay.Recorder(self.fname) as rec:
+                owp = rec.wrap(protocol.clone(base, persistent))
+                res = [owp.dir(), owp.present('/nonexistent')]
+                self.assertRaises(protocol.OwnetError, owp.read, '/')
+            owp = replay.Replayer(self.fname, scale=0).proxy(persistent)
+            self.assertEqual([owp.dir(), owp.present('/nonexistent')], res)
+            self.assertRaises(protocol.OwnetError, owp.read, '/')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from pyownet import protocol, romid
+from . import (HOST, PORT)
+
+
+class Test_romid(unittest.TestCase):
+
+    NAMES = {
+        protocol.FLG_FORMAT_FDI: '10.67C6697351FF',
+        protocol.FLG_FORMAT_FI: '1067C6697351FF',
+        protocol.FLG_FORMAT_FDIDC: '10.67C6697351FF.8D',
+        protocol.FLG_FORMAT_FDIC: '10.67C6697351FF8D',
+        protocol.FLG_FORMAT_FIDC: '1067C6697351FF.8D',
+        protocol.FLG_FORMAT_FIC: '1067C6697351FF8D',
+    }
+
+    def test_crc8(self):
+        self.assertEqual(romid.crc8(b''), 0)
+        self.assertEqual(romid.crc8(b'\x10\x67\xc6\x69\x73\x51\xff'), 0x8D)
+        self.assertEqual(romid.crc8(b'\x10\x67\xc6\x69\x73\x51\xff\x8d'), 0)
+
+    def test_parse(self):
+        rid = 0x1067C6697351FF8D
+        for flags, name in self.NAMES.items():
+            self.assertEqual(romid.parse(name), rid)
+            self.assertEqual(romid.parse('/bus.0/' + name + '/'), rid)
+            self.assertEqual(romid.to_name(rid, flags), name)
+        self.assertEqual(romid.split(rid), (0x10, 0x67C6697351FF, 0x8D))
+        self.assertRaises(ValueError, romid.parse, '10.67C6697351FF.8E')
+        self.assertRaises(ValueError, romid.parse, '/settings/')
+
+    def test_index(self):
+        index = romid.RomIndex.from_dir([
+            '/28.000028D70000/', '/bus.0/', '/10.67C6697351FF/',
+            '/28.000028D70100/', '/10.67C6697351FF.8D', '/settings/'])
+        self.assertEqual(len(index), 3)
+        self.assertIn('/10.67C6697351FF/', index)
+        self.assertIn(0x1067C6697351FF8D, index)
+        self.assertNotIn('/28.000028D70200/', index)
+        self.assertNotIn('/bus.0/', index)
+        self.assertEqual(index.families(), {0x10: 1, 0x28: 2})
+        temp = index.family(0x28)
+        self.assertEqual(list(temp.paths()),
+                         ['/28.000028D70000/', '/28.000028D70100/'])
+        self.assertEqual(list(index.family(0x29)), [])
+        self.assertEqual(list((index - temp).paths(slash=False)),
+                         ['/10.67C6697351FF'])
+        self.assertEqual(index & temp, temp)
+        self.assertEqual((index - temp) | temp, index)
+        self.assertEqual(romid.RomIndex(iter(index)), index)
+        # a wrong CRC does not fail the whole listing
+        errors = []
+        index = romid.RomIndex.from_dir(
+            ['/10.67C6697351FF.8E', '/28.000028D70000/'], errors)
+        self.assertEqual(list(index.paths()), ['/28.000028D70000/'])
+        self.assertEqual([i[0] for i in errors], ['/10.67C6697351FF.8E'])
+        self.assertIsInstance(errors[0][1], ValueError)
+        self.assertRaises(ValueError, romid.parse, '/10.67C6697351FF.8E')
+
+    def test_owserver(self):
+        try:
+            owproxy = protocol.proxy(HOST, PORT)
+        except protocol.ConnError as exc:
+            self.skipTest('no owserver on %s:%s, got:%s' % (HOST, PORT, exc))
+        entries = owproxy.dir(bus=False)
+        index = romid.RomIndex.from_dir(entries)
+        self.assertEqual(sorted(index.paths()), sorted(entries))
+
+
+if __name__ == '__main__':
+    unittest.main()
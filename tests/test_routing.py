@@ -0,0 +1,163 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+import errno
+import pickle
+import socket
+
+from pyownet import protocol, routing
+from . import (HOST, PORT)
+
+LISTING = ['/bus.0/28.000028D70000/', '/bus.0/bus.1/', '/bus.1/simultaneous/',
+           '/bus.1/29.000029AA0000', '/28.000028170000/']
+
+
+class _Buses(protocol._Proxy):
+    # proxy object serving devices on buses, logging requested paths
+
+    def __init__(self, buses):
+        super(_Buses, self).__init__(socket.AF_INET, ('127.0.0.1', 0))
+        self.buses = buses
+        self.log = []
+
+    def _transact(self, msg, timeout=0):
+        size = protocol._ToServerHeader.header_size
+        path = protocol.bytes2str(msg[size:].split(b'\x00')[0])
+        self.log.append(path)
+        parts = path.split('/')
+        if parts[1].startswith('bus.'):
+            if self.buses.get(parts[2]) != parts[1]:
+                return -2, b''
+            parts = parts[:1] + parts[2:]
+        if parts[1] not in self.buses or parts[2:] not in ([], ['type']):
+            return -2, b''
+        return 0, b'DS18B20' if parts[2:] else b''
+
+
+class _Invalid(_Buses):
+    # proxy object failing all requests with EINVAL
+
+    def _transact(self, msg, timeout=0):
+        self.log.append(msg)
+        return -errno.EINVAL, b''
+
+
+class Test_RoutingCache(unittest.TestCase):
+
+    def test_route(self):
+        routes = routing.RoutingCache()
+        routes.update(LISTING)
+        self.assertEqual(len(routes), 2)
+        self.assertEqual(routes.bus('29.000029AA0000'), '/bus.1')
+        self.assertEqual(routes.route('/28.000028D70000/temperature'),
+                         '/bus.0/28.000028D70000/temperature')
+        self.assertEqual(routes.route('/28.000028D70000'),
+                         '/bus.0/28.000028D70000')
+        self.assertEqual(routes.route('/uncached/29.000029AA0000/PIO.0'),
+                         '/uncached/bus.1/29.000029AA0000/PIO.0')
+        for path in ('/28.000028170000/temperature', '/bus.0/28.000028D70000',
+                     '/settings/units', '/', 'relative/28.000028D70000'):
+            self.assertIsNone(routes.route(path), path)
+        routes.invalidate('28.000028D70000')
+        routes.invalidate('28.000028D70000')
+        self.assertIsNone(routes.route('/28.000028D70000/temperature'))
+        self.assertEqual(routes.metrics()['invalidated'], 1)
+
+    def test_requests(self):
+        routes = routing.RoutingCache(probe=0)
+        routes.update(LISTING)
+        owp = _Buses({'28.000028D70000': 'bus.0'})
+        owp.routing = routes
+        self.assertEqual(owp.read('/28.000028D70000/type'), b'DS18B20')
+        self.assertTrue(owp.present('/28.000028D70000'))
+        self.assertRaises(protocol.OwnetError, owp.read, '/28.000028D70000/')
+        self.assertEqual(owp.log, ['/bus.0/28.000028D70000/type',
+                                   '/bus.0/28.000028D70000',
+                                   '/bus.0/28.000028D70000/',
+                                   '/28.000028D70000/'])
+        metrics = routes.metrics()
+        self.assertEqual((metrics['routed'], metrics['fallbacks'],
+                          metrics['invalidated']), (3, 1, 0))
+
+    def test_write_error(self):
+        # a routed write failing for other reasons is not resent
+        routes = routing.RoutingCache(probe=0)
+        routes.update(LISTING)
+        owp = _Invalid({'28.000028D70000': 'bus.0'})
+        owp.routing = routes
+        self.assertRaises(protocol.OwnetError, owp.write,
+                          '/28.000028D70000/PIO', b'1')
+        self.assertEqual(len(owp.log), 1)
+        self.assertEqual(routes.metrics()['fallbacks'], 0)
+        self.assertEqual(routes.bus('28.000028D70000'), '/bus.0')
+
+    def test_moved(self):
+        routes = routing.RoutingCache(probe=0)
+        routes.update(LISTING)
+        owp = _Buses({'28.000028D70000': 'bus.2'})
+        owp.routing = routes
+        for _ in range(2):
+            self.assertEqual(owp.read('/28.000028D70000/type'), b'DS18B20')
+        self.assertEqual(owp.log, ['/bus.0/28.000028D70000/type',
+                                   '/28.000028D70000/type',
+                                   '/28.000028D70000/type'])
+        self.assertIsNone(routes.bus('28.000028D70000'))
+        metrics = routes.metrics()
+        self.assertEqual((metrics['fallbacks'], metrics['invalidated'],
+                          metrics['unrouted']), (1, 1, 1))
+
+    def test_probe(self):
+        routes = routing.RoutingCache(probe=4)
+        routes.update(LISTING)
+        owp = _Buses({'28.000028D70000': 'bus.0'})
+        owp.routing = routes
+        self.assertIsNone(routes.metrics()['saving'])
+        for _ in range(8):
+            owp.read('/28.000028D70000/type')
+        self.assertEqual(owp.log.count('/28.000028D70000/type'), 2)
+        metrics = routes.metrics()
+        self.assertEqual((metrics['routed'], metrics['unrouted']), (6, 2))
+        self.assertIsNotNone(metrics['saving'])
+
+    def test_pickle(self):
+        routes = routing.RoutingCache(probe=8)
+        routes.update(LISTING)
+        dup = pickle.loads(pickle.dumps(routes))
+        self.assertEqual(dup.probe, 8)
+        self.assertEqual(dup.bus('28.000028D70000'), '/bus.0')
+
+
+class Test_routed_proxy(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.proxy = protocol.proxy(HOST, PORT)
+        except protocol.ConnError as exc:
+            raise unittest.SkipTest('no owserver on %s:%s, got:%s' %
+                                    (HOST, PORT, exc))
+
+    def test_learn(self):
+        routes = routing.RoutingCache(probe=2)
+        self.assertEqual(routes.learn(self.proxy), len(self.proxy.dir()))
+        for persistent in (False, True):
+            owp = routes.wrap(protocol.clone(self.proxy, persistent))
+            self.assertIsNone(self.proxy.routing)
+            self.assertEqual(owp.dir(), self.proxy.dir())
+            for i in owp.dir():
+                self.assertEqual(owp.read(i + 'type'),
+                                 self.proxy.read(i + 'type'))
+                self.assertTrue(owp.present(i))
+            if persistent:
+                owp.close_connection()
+        self.assertGreater(routes.metrics()['routed'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+import errno
+import pickle
+
+from pyownet import protocol, schema
+from . import (HOST, PORT)
+
+
+class Test_SchemaCache(unittest.TestCase):
+
+    def test_parse(self):
+        info = schema.PropertyInfo.parse(b't,000000,000001,ro,000012,v,')
+        self.assertEqual(info, ('t', 0, 1, 'ro', 12, 'v'))
+        self.assertTrue(info.readable)
+        self.assertFalse(info.writable)
+        self.assertEqual(info.decode(b'        21.5'), 21.5)
+        info = schema.PropertyInfo.parse(b'y,-00001,000008,rw,000015,s,')
+        self.assertEqual(info.decode(b'0,1'), [False, True])
+        info = schema.PropertyInfo.parse(b'b,000000,000001,wo,000008,s,')
+        self.assertFalse(info.readable)
+        self.assertEqual(info.decode(b'\x00\x01'), b'\x00\x01')
+        self.assertRaises(protocol.ProtocolError,
+                          schema.PropertyInfo.parse, b't,0,ro')
+
+    def test_lookup(self):
+        owp = protocol._Proxy(0, None)
+        owp.schema = schema.SchemaCache()
+        owp.schema._families['29'] = {
+            'PIO.0': schema.PropertyInfo('y', 0, 8, 'rw', 1, 's'),
+            'strobe': schema.PropertyInfo('y', 0, 1, 'wo', 1, 's'),
+            'T8A': schema.PropertyInfo('D', 0, 1, 'ro', 0, 'f'),
+        }
+        lookup = owp.schema.lookup
+        self.assertIsNone(lookup(owp, '/settings/timeout/volatile'))
+        self.assertIsNone(lookup(owp, '/29.000029AA0000/'))
+        self.assertIsNone(lookup(owp, '/29.000029AA0000/missing'))
+        self.assertEqual(lookup(owp, '/bus.0/29.000029AA0000/PIO.7').size, 1)
+        self.assertEqual(lookup(owp, '/29.000029AA0000/PIO.ALL').size, 15)
+        self.assertEqual(lookup(owp, '/29.000029aa0000/strobe').access, 'wo')
+        self.assertIsNone(lookup(owp, '/29.000029AA0000FF/strobe'))
+        # no request sent: owp is not connected to any owserver
+        for path, err in (('/29.000029AA0000/strobe', errno.EACCES),
+                          ('/29.000029AA0000/T8A', errno.EISDIR)):
+            with self.assertRaises(protocol.OwnetError) as ctx:
+                owp.read(path)
+            self.assertEqual(ctx.exception.errno, err)
+        owp.cache_timeouts = {'volatile': 15, 'stable': 300}
+        self.assertEqual(owp._cache_timeout('/29.000029AA0000/PIO.0'), 300)
+        self.assertIs(pickle.loads(pickle.dumps(schema.schema_cache())),
+                      schema.schema_cache())
+
+    def test_proxy(self):
+        try:
+            owp = protocol.proxy(HOST, PORT, schema=True, persistent=True)
+        except protocol.ConnError as exc:
+            self.skipTest('no owserver on %s:%s, got:%s' % (HOST, PORT, exc))
+        self.assertIs(owp.schema, schema.schema_cache())
+        owp.schema = schema.SchemaCache()
+        for i in owp.dir(bus=False):
+            info = owp.schema.lookup(owp, i + 'type')
+            self.assertEqual(info.type, 'a')
+            self.assertTrue(info.readable)
+            raw = protocol.clone(owp, persistent=False)
+            raw.schema = None
+            self.assertEqual(owp.read(i + 'type'), raw.read(i + 'type'))
+            self.assertEqual(owp.read_value(i + 'type'),
+                             protocol.bytes2str(raw.read(i + 'type')))
+
+
+if __name__ == '__main__':
+    unittest.main()
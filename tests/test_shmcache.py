@@ -0,0 +1,193 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+import os
+import time
+import pickle
+import shutil
+import socket
+import tempfile
+
+from pyownet import protocol, shmcache
+from . import (HOST, PORT)
+
+
+class Test_ShmCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, 'readings.shm')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_put_get(self):
+        with shmcache.ShmCache(self.fname, slots=8) as cache:
+            self.assertIsNone(cache.get('/a/temperature'))
+            self.assertTrue(cache.put('/a/temperature', b'  21.5'))
+            entry = cache.get('/a/temperature')
+            self.assertEqual(entry.value, b'  21.5')
+            self.assertEqual(entry.flags, 0)
+            # other formatting flags are a miss
+            self.assertIsNone(cache.get('/a/temperature',
+                                        protocol.FLG_TEMP_F))
+            self.assertTrue(cache.put('/a/temperature', b'  70.7',
+                                      protocol.FLG_TEMP_F))
+            self.assertEqual(cache.get('/a/temperature',
+                                       protocol.FLG_TEMP_F).value, b'  70.7')
+            # too large
+            self.assertFalse(cache.put('/a/memory', b'x' * 65))
+            self.assertEqual(len(list(cache.entries())), 1)
+
+    def test_age(self):
+        with shmcache.ShmCache(self.fname, slots=8, ttl=5) as cache:
+            cache.put('/old', b'1', timestamp=time.time() - 10)
+            cache.put('/new', b'2')
+            self.assertIsNone(cache.get('/old'))
+            self.assertEqual(cache.get('/old', max_age=20).value, b'1')
+            self.assertIsNone(cache.get('/new', max_age=-1))
+            self.assertEqual(cache.get('/new').value, b'2')
+
+    def test_eviction(self):
+        with shmcache.ShmCache(self.fname, slots=4) as cache:
+            for i in range(6):
+                self.assertTrue(cache.put('/p%d' % i, str(i).encode(),
+                                          timestamp=time.time() + i))
+            paths = sorted(path for path, _ in cache.entries())
+            self.assertEqual(paths, ['/p2', '/p3', '/p4', '/p5'])
+
+    def test_shared(self):
+        # a second mapping sees the same table, geometry from file
+        with shmcache.ShmCache(self.fname, slots=8, value_size=16) as one:
+            with shmcache.ShmCache(self.fname) as two:
+                self.assertEqual((two.slots, two.value_size), (8, 16))
+                one.put('/x', b'abc')
+                self.assertEqual(two.get('/x').value, b'abc')
+            dup = pickle.loads(pickle.dumps(one))
+            self.assertEqual(dup.get('/x').value, b'abc')
+            dup.close()
+
+    def test_errors(self):
+        self.assertRaises(ValueError, shmcache.ShmCache, self.fname, 0)
+        self.assertRaises(ValueError, shmcache.ShmCache, self.fname, ttl=0)
+        with open(self.fname, 'wb') as fil:
+            fil.write(b'\x00' * 128)
+        self.assertRaises(ValueError, shmcache.ShmCache, self.fname)
+
+    def test_elect(self):
+        with shmcache.ShmCache(self.fname, slots=8) as one:
+            with shmcache.ShmCache(self.fname) as two:
+                self.assertTrue(one.elect())
+                self.assertTrue(one.elect())
+                self.assertFalse(two.elect())
+                one.close()
+                self.assertTrue(two.elect())
+                with shmcache.ShmCache(self.fname) as three:
+                    self.assertFalse(three.elect())
+                    two.resign()
+                    self.assertTrue(three.elect())
+
+    def test_refresher_resign(self):
+        # a closed refresher lets another process take over
+        with shmcache.ShmCache(self.fname, slots=8) as one:
+            with shmcache.ShmCache(self.fname) as two:
+                owp = protocol._Proxy(0, None)
+                ref = shmcache.Refresher(one, owp)
+                self.assertTrue(one.elect())
+                self.assertFalse(two.elect())
+                ref.close()
+                self.assertTrue(two.elect())
+
+    def test_uncached_key(self):
+        with shmcache.ShmCache(self.fname, slots=8) as cache:
+            cache.put('/a/temperature', b'  21.5')
+            self.assertIsNone(cache.get('/a/temperature',
+                                        protocol.FLG_UNCACHED))
+            owp = cache.wrap(protocol._Proxy(socket.AF_INET,
+                                             ('127.0.0.1', 1),
+                                             flags=protocol.FLG_UNCACHED))
+            # not answered from the cache: no owserver on port 1
+            self.assertRaises(protocol.ConnError, owp.read,
+                              '/a/temperature')
+
+
+class Test_cached_proxy(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.proxy = protocol.proxy(HOST, PORT)
+        except protocol.ConnError as exc:
+            raise unittest.SkipTest('no owserver on %s:%s, got:%s' %
+                                    (HOST, PORT, exc))
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = shmcache.ShmCache(
+            os.path.join(self.tmpdir, 'readings.shm'), slots=64)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_read(self):
+        owp = self.cache.wrap(self.proxy)
+        self.assertIsNone(self.proxy.read_cache)
+        for i in self.proxy.dir():
+            path = i + 'type'
+            self.cache.put(path, b'cached')
+            self.assertEqual(owp.read(path), b'cached')
+            # partial reads are never cached
+            self.assertEqual(owp.read(path, size=3), self.proxy.read(path,
+                                                                     size=3))
+            self.assertEqual(owp.read(path, max_staleness=-1),
+                             self.proxy.read(path))
+            self.assertEqual(self.cache.get(path).value,
+                             self.proxy.read(path))
+        self.assertRaises(protocol.OwnetError, owp.read, '/')
+
+    def test_refresher(self):
+        owp = self.cache.wrap(self.proxy)
+        paths = [i + 'type' for i in self.proxy.dir()]
+        for path in paths:
+            self.cache.put(path, b'stale', timestamp=time.time() - 60)
+        with shmcache.Refresher(self.cache, owp, interval=0.05) as ref:
+            ref.start()
+            deadline = time.time() + 5
+            while ref.cycles < 1 and time.time() < deadline:
+                time.sleep(0.01)
+        self.assertGreaterEqual(ref.cycles, 1)
+        for path in paths:
+            self.assertEqual(self.cache.get(path).value,
+                             self.proxy.read(path))
+
+    def test_refresh_errors(self):
+        paths = [i + 'type' for i in self.proxy.dir()]
+        for path in ['/nonexistent'] + paths:
+            self.cache.put(path, b'stale', timestamp=time.time() - 60)
+        errors = []
+        self.assertEqual(self.cache.refresh(self.proxy, 30, errors),
+                         len(paths))
+        self.assertEqual([i for i, _ in errors], ['/nonexistent'])
+        self.assertIsInstance(errors[0][1], protocol.OwnetError)
+        self.assertEqual(self.cache.get('/nonexistent', max_age=120).value,
+                         b'stale')
+        with shmcache.Refresher(self.cache, self.proxy,
+                                interval=0.05) as ref:
+            ref.start()
+            deadline = time.time() + 5
+            while ref.cycles < 2 and time.time() < deadline:
+                time.sleep(0.01)
+        self.assertGreaterEqual(ref.cycles, 2)
+        self.assertGreaterEqual(ref.errors, 2)
+        self.assertIsInstance(ref.last_error, protocol.OwnetError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+import os
+import json
+import shutil
+import tempfile
+
+from pyownet import protocol, routing, schema, state
+from . import (HOST, PORT)
+
+SAVED = {
+    'version': state.VERSION,
+    'servers': {
+        'owserver:4304': {
+            'saved': 0,
+            'errcodes': ['Good result', 'Startup - command line parameters '
+                         'invalid', 'legacy - No such entity'],
+            'devices': {'/bus.0': {'28.000028D70000': 'DS18B20'},
+                        '/bus.1': {}},
+            'schema': {'28': {'temperature': ['t', 0, 1, 'ro', 12, 'v']}},
+        },
+    },
+}
+
+
+class Test_WarmState(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, 'owstate.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, text):
+        with open(self.fname, 'w') as f:
+            f.write(text)
+
+    def test_load(self):
+        self._write(json.dumps(SAVED))
+        warm = state.WarmState(self.fname)
+        self.assertEqual(warm.errmess('owserver', 4304)[2],
+                         'legacy - No such entity')
+        self.assertEqual(warm.devices('owserver', 4304),
+                         {'/bus.0': {'28.000028D70000': 'DS18B20'},
+                          '/bus.1': {}})
+        self.assertEqual(warm.families('owserver', 4304),
+                         {'28': {'temperature': schema.PropertyInfo(
+                             't', 0, 1, 'ro', 12, 'v')}})
+        for res in (warm.errmess(), warm.devices(), warm.families()):
+            self.assertIsNone(res)
+        # strings are native, also on python 2
+        routes = routing.RoutingCache()
+        routes.update(state._bus_entries(warm.devices('owserver', 4304)))
+        routed = routes.route('/28.000028D70000/temperature')
+        self.assertIsInstance(routed, str)
+        protocol.str2bytez(routed)
+        self.assertIsInstance(warm.errmess('owserver', 4304)[0], str)
+
+    def test_invalid(self):
+        for text in ('', '{"version": 1', '[]',
+                     json.dumps(dict(SAVED, version=0))):
+            self._write(text)
+            self.assertIsNone(state.WarmState(self.fname).devices(
+                'owserver', 4304))
+        self.assertIsNone(state.WarmState(
+            os.path.join(self.tmpdir, 'missing')).devices('owserver', 4304))
+
+    def test_save(self):
+        self._write(json.dumps(SAVED))
+        state.WarmState(self.fname).save()
+        self.assertEqual(os.listdir(self.tmpdir), ['owstate.json'])
+        with open(self.fname) as f:
+            self.assertEqual(json.load(f), SAVED)
+
+
+class Test_warm_proxy(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            protocol.proxy(HOST, PORT)
+        except protocol.ConnError as exc:
+            raise unittest.SkipTest('no owserver on %s:%s, got:%s' %
+                                    (HOST, PORT, exc))
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, 'owstate.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_warm_start(self):
+        cold = state.WarmState(self.fname)
+        owp = cold.proxy(HOST, PORT)
+        cold.join()
+        self.assertIsNone(cold.error)
+        self.assertTrue(os.path.exists(self.fname))
+        devices = cold.devices(HOST, PORT)
+        found = set(i for devs in devices.values() for i in devs)
+        self.assertEqual(found, set(i.strip('/') for i in owp.dir()))
+
+        warm = state.WarmState(self.fname)
+        self.assertEqual(warm.devices(HOST, PORT), devices)
+        routes = routing.RoutingCache()
+        owp = warm.proxy(HOST, PORT, schema=schema.SchemaCache(),
+                         routing=routes, revalidate=False)
+        self.assertEqual(list(owp.errmess), cold.errmess(HOST, PORT))
+        self.assertEqual(owp.schema.families(), warm.families(HOST, PORT))
+        self.assertEqual(len(routes), len(found))
+        for i in owp.dir():
+            owp.read(i + 'type')
+        warm.revalidate(owp, HOST, PORT)
+        self.assertEqual(warm.devices(HOST, PORT), devices)
+
+
+if __name__ == '__main__':
+    unittest.main()
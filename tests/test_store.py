@@ -0,0 +1,92 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+import os
+import math
+import shutil
+import tempfile
+
+from pyownet import protocol, store
+
+
+class Test_SampleStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, 'samples.ring')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_ring(self):
+        with store.SampleStore(self.fname, capacity=4) as st:
+            self.assertEqual(len(st), 0)
+            for i in range(6):
+                st.append(float(i), '/p%d' % (i % 2), i * 1.5)
+            self.assertEqual(len(st), 4)
+            self.assertEqual([r[0] for r in st], [2., 3., 4., 5.])
+            self.assertEqual(st.paths, ['/p0', '/p1'])
+
+    def test_reopen(self):
+        with store.SampleStore(self.fname, capacity=3) as st:
+            st.append(1., '/a', 1.)
+            st.append(2., '/b', 2.)
+        with store.SampleStore(self.fname) as st:
+            self.assertEqual(st.capacity, 3)
+            self.assertEqual(list(st), [(1., '/a', 1., 0), (2., '/b', 2., 0)])
+            st.append(3., '/c', 3.)
+            st.append(4., '/a', 4.)
+        with store.SampleStore(self.fname) as st:
+            self.assertEqual([r[1] for r in st], ['/b', '/c', '/a'])
+        self.assertRaises(ValueError, store.SampleStore, self.fname, 5)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, store.SampleStore, self.fname)
+        with open(self.fname, 'wb') as fil:
+            fil.write(b'\x00' * 128)
+        self.assertRaises(ValueError, store.SampleStore, self.fname)
+
+    def test_feed(self):
+        with store.SampleStore(self.fname, capacity=8) as st:
+            st.feed({'/t': b'        21.5',
+                     '/e': protocol.OwnetError(2, 'not found', '/e'),
+                     '/c': protocol.ConnError(111, 'refused'),
+                     '/s': b'DS18B20',
+                     '/f': 4.0,
+                     '/n': None}, timestamp=10.)
+            res = dict((r[1], r[2:]) for r in st)
+        self.assertEqual(res['/t'], (21.5, store.ST_OK))
+        self.assertEqual(res['/f'], (4.0, store.ST_OK))
+        self.assertEqual(res['/e'][1], 2)
+        self.assertEqual(res['/c'][1], store.ST_ERROR)
+        self.assertEqual(res['/s'][1], store.ST_NOTANUMBER)
+        self.assertTrue(math.isnan(res['/s'][0]))
+        self.assertEqual(res['/n'][1], store.ST_NOTANUMBER)
+
+    @unittest.skipIf(store.numpy is None, 'NumPy not available')
+    def test_query(self):
+        st = store.SampleStore(self.fname, capacity=5)
+        for i in range(7):
+            st.append(float(i), '/p', 10. * i)
+        chunks = st.view()
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual([r['timestamp'] for c in chunks for r in c],
+                         [2., 3., 4., 5., 6.])
+        res = st.query(3., 6.)
+        self.assertEqual([v for c in res for v in c['value']],
+                         [30., 40., 50.])
+        self.assertEqual(st.query(7.), [])
+        del chunks, res
+        st.close()
+        # closing twice is harmless
+        st.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+import pickle
+
+from pyownet import protocol, timeouts
+from . import (HOST, PORT)
+
+
+class Test_AdaptiveTimeouts(unittest.TestCase):
+
+    def test_estimator(self):
+        est = timeouts.RttEstimator()
+        self.assertEqual(est.rto(1, 60), 60)
+        est.sample(4.0)
+        self.assertEqual((est.srtt, est.rttvar), (4.0, 2.0))
+        self.assertEqual(est.rto(1, 60), 12.0)
+        est.sample(4.0)
+        self.assertEqual((est.srtt, est.rttvar), (4.0, 1.5))
+        self.assertEqual(est.rto(1, 60), 10.0)
+        self.assertEqual(est.rto(1, 5), 5)
+        self.assertEqual(est.rto(20, 60), 20)
+        est.expired()
+        self.assertEqual(est.rto(1, 60), 20.0)
+        est.sample(4.0)
+        self.assertEqual(est.backoff, 1)
+
+    def test_key(self):
+        msg = protocol._ToServerHeader(
+            payload=29, type=protocol.MSG_READ) + b'/29.000029AA0000/PIO.1\x00'
+        self.assertEqual(timeouts.AdaptiveTimeouts.key(('h', 1), msg),
+                         (('h', 1), protocol.MSG_READ, '29', 'PIO'))
+        path = b'/1d.00001DAA0000/counters.A\x00'
+        msg = protocol._ToServerHeader(
+            payload=len(path), type=protocol.MSG_READ) + path
+        self.assertEqual(timeouts.AdaptiveTimeouts.key(('h', 1), msg)[2], '1D')
+        msg = protocol._ToServerHeader(payload=0, type=protocol.MSG_NOP)
+        self.assertEqual(timeouts.AdaptiveTimeouts.key(('h', 1), msg),
+                         (('h', 1), protocol.MSG_NOP, '', ''))
+
+    def test_proxy(self):
+        try:
+            owp = protocol.proxy(HOST, PORT, timeouts=True)
+        except protocol.ConnError as exc:
+            self.skipTest('no owserver on %s:%s, got:%s' % (HOST, PORT, exc))
+        self.assertIs(owp.timeouts, timeouts.adaptive_timeouts())
+        adaptive = timeouts.AdaptiveTimeouts(max_connect=1.0)
+        owp.timeouts = adaptive
+        devices = owp.dir()
+        for device in devices:
+            owp.read(device + 'type')
+        owp = protocol.clone(owp, persistent=True)
+        self.assertIs(owp.timeouts, adaptive)
+        path = devices[-1] + 'type'
+        owp.read(path)
+        metrics = adaptive.metrics()
+        kinds = [(i['kind'], i['key']) for i in metrics]
+        self.assertIn(('connect', ()), kinds)
+        self.assertIn(('request', (protocol.MSG_READ, path[1:3], 'type')),
+                      kinds)
+        for i in metrics:
+            self.assertGreater(i['samples'], 0)
+            self.assertLess(i['timeout'], 60.0)
+        self.assertLess(adaptive.connect_timeout(owp._sockaddr), 1.0)
+        owp = pickle.loads(pickle.dumps(owp))
+        self.assertEqual(len(owp.timeouts.metrics()), len(metrics))
+        self.assertIs(pickle.loads(pickle.dumps(
+            timeouts.adaptive_timeouts())), timeouts.adaptive_timeouts())
+
+
+if __name__ == '__main__':
+    unittest.main()
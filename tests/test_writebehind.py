@@ -0,0 +1,87 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+if sys.version_info < (2, 7, ):
+    import unittest2 as unittest
+else:
+    import unittest
+import socket
+
+from pyownet import protocol, writebehind
+from . import (HOST, PORT)
+
+
+class _Broken(protocol._Proxy):
+    # proxy object whose writes fail with an unexpected exception
+
+    def __init__(self):
+        super(_Broken, self).__init__(socket.AF_INET, ('127.0.0.1', 0))
+
+    def write(self, path, data, offset=0, timeout=0):
+        raise RuntimeError('unexpected')
+
+    def close_connection(self):
+        pass
+
+
+class Test_WriteBehind(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.proxy = protocol.proxy(HOST, PORT)
+        except protocol.ConnError as exc:
+            raise unittest.SkipTest('no owserver on %s:%s, got:%s' %
+                                    (HOST, PORT, exc))
+
+    def test_arguments(self):
+        self.assertRaises(TypeError, writebehind.WriteBehind, object())
+        self.assertRaises(ValueError, writebehind.WriteBehind, self.proxy,
+                          delay=-1)
+        with writebehind.WriteBehind(self.proxy) as wb:
+            self.assertRaises(TypeError, wb.write, '/', 1)
+            self.assertRaises(TypeError, wb.write, 1, b'abc')
+            self.assertRaises(ValueError, wb.write, '/', b'abc', offset=-1)
+            self.assertRaises(ValueError, wb.write, '/', b'abc',
+                              offset=2 ** 31)
+        self.assertRaises(ValueError, wb.write, '/', b'abc')
+
+    def test_coalesce(self):
+        with writebehind.WriteBehind(self.proxy, delay=0.2) as wb:
+            first = [wb.write('/nonexistent', i) for i in (b'1', b'2', b'3')]
+            other = wb.write('/nonexistent', b'0', offset=1)
+            self.assertEqual(len(wb), 2)
+            self.assertFalse(first[-1].done())
+            self.assertRaises(ValueError, first[-1].result, 0)
+            self.assertTrue(wb.flush())
+            self.assertEqual(len(wb), 0)
+        self.assertEqual([i.superseded for i in first], [True, True, False])
+        self.assertFalse(other.superseded)
+        for pending in first + [other]:
+            self.assertTrue(pending.done())
+        for pending in first:
+            self.assertIs(pending.exception(), first[-1].exception())
+
+    def test_close(self):
+        wb = writebehind.WriteBehind(self.proxy, delay=10)
+        pending = wb.write('/nonexistent', b'1')
+        wb.close()
+        self.assertTrue(pending.done())
+        wb.close()
+
+
+class Test_errors(unittest.TestCase):
+
+    def test_unexpected(self):
+        owp = _Broken()
+        with writebehind.WriteBehind(owp) as wb:
+            wb._proxy = owp
+            for path in ('/first', '/second'):
+                pending = wb.write(path, b'1')
+                self.assertIsInstance(pending.exception(1), RuntimeError)
+
+
+if __name__ == '__main__':
+    unittest.main()